@@ -1,26 +1,45 @@
 """
-KPI Dashboard - Streamlit App mit SQLite und Login
+KPI Dashboard - Streamlit App mit PostgreSQL oder SQLite und Login
 Für Deployment auf Synology NAS via Docker
 """
 import streamlit as st
 import pandas as pd
+import numpy as np
 import altair as alt
 from datetime import datetime, timedelta
 import os
-from io import BytesIO
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+import uuid
 
 # Lokale Imports
+import metrics
+import save_jobs
+import write_queue
 from database import (
-    init_database, get_months, get_month_data, save_month_data,
-    create_month, delete_month, get_standorte, init_default_standorte
+    get_months, get_month_data,
+    create_month, delete_month, get_standorte,
+    get_range_data, create_year, is_database_available,
+    ensure_schema, DB_UNAVAILABLE_ERRORS
 )
 from auth import require_auth, show_user_info, is_admin
+from kpi import apply_kpis, validate_data
+from formatting import (
+    to_editor_frame, format_number_de, format_currency_de,
+    format_percent_de, format_frame_de
+)
+from export import frame_hash, get_excel_export
+from reports import compare_weeks, compare_months
+
+# Laufzeit dieses Durchlaufs messen (Aufrufe, Abfragen, Abschnitte)
+metrics.start_rerun(st.session_state)
 
-# Initialisiere Datenbank beim Start
-init_database()
-init_default_standorte()
+# Schema einmal pro Prozess prüfen/migrieren (bei aktuellem Schema: keine DDL).
+# Ist die Datenbank nicht erreichbar, läuft das Dashboard lesend aus dem Snapshot.
+try:
+    ensure_schema()
+except DB_UNAVAILABLE_ERRORS:
+    pass
+# Lokal gesicherte, noch nicht übertragene Änderungen nachtragen
+write_queue.start_flusher()
 
 # Konstanten
 COLUMNS = ["Datum", "Standort", "Disponent", "Fahrzeuge", "Stopps", 
@@ -34,12 +53,6 @@ KPI_COLUMNS = [
     ("Stoppkosten", "Stoppkosten")
 ]
 
-# Standard-Standorte
-DEFAULT_STANDORTE = [
-    'Delmenhorst', 'Güstrow', 'Döbeln', 'Melle', 'Langenfeld',
-    'Kassel', 'Berlin', 'Aschaffenburg', 'Renningen'
-]
-
 # --- Page Config ---
 st.set_page_config(
     page_title="KPI Dashboard - Dispo",
@@ -87,144 +100,146 @@ st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 require_auth()
 
 # --- Hilfsfunktionen ---
-def clean_kpi_columns(dataframe):
-    """Bereinigt KPI-Spalten und konvertiert sie zu numerischen Werten."""
-    kpi_cols = ['Fahrzeuge', 'Stopps', 'Stoppschnitt', 'Unverplante Stopps', 'Kosten Fuhrpark', 'Stoppkosten']
-    for col in kpi_cols:
-        if col in dataframe.columns:
-            dataframe[col] = pd.to_numeric(
-                dataframe[col]
-                .astype(str)
-                .str.replace('€', '', regex=False)
-                .str.replace(',', '.', regex=False)
-                .str.replace(' ', '', regex=False),
-                errors='coerce'
+def highlight_errors(df, validation):
+    """Gibt einen Styler zurück, der fehlerhafte Zellen rot markiert (nur betroffene Zeilen)."""
+    styles = np.full(df.shape, '', dtype=object)
+    col_positions = validation['column'].map({col: i for i, col in enumerate(df.columns)})
+    styles[validation['row'].to_numpy(dtype=int), col_positions.to_numpy(dtype=int)] = 'background-color: #ffcccc'
+    css = pd.DataFrame(styles, index=df.index, columns=df.columns)
+    rows = sorted(validation['row'].unique())
+    return df.iloc[rows].style.apply(lambda _: css.iloc[rows], axis=None)
+
+# Anzeigeformate der Report-Tabellen (siehe formatting.format_frame_de)
+RANKING_FORMATS = {
+    'Stoppkosten': {'decimals': 2, 'suffix': ' €'},
+    'Stopps': {'decimals': 0}
+}
+WEEKLY_FORMATS = {
+    'Fahrzeuge': {'decimals': 1},
+    'Stopps': {'decimals': 1},
+    'Stoppschnitt': {'decimals': 2},
+    'Unverplante Stopps': {'decimals': 2},
+    'Kosten Fuhrpark': {'decimals': 2, 'suffix': ' €'},
+    'Stoppkosten': {'decimals': 2, 'suffix': ' €'}
+}
+
+def weekly_formats(columns):
+    """Formate für den Wochenvergleich inkl. Delta- (mit Vorzeichen) und Delta%-Spalten."""
+    formats = dict(WEEKLY_FORMATS)
+    for col in columns:
+        if col.endswith('_Delta%'):
+            formats[col] = {'decimals': 1, 'sign': True, 'suffix': '%'}
+        elif col.endswith('_Delta'):
+            decimals = 2 if ('Kosten' in col or 'Stopp' in col) else 1
+            formats[col] = {'decimals': decimals, 'sign': True}
+    return formats
+
+def show_metrics_panel():
+    """Admin-Ansicht der Laufzeit-Metriken (letzter Rerun, p50/p95, langsame Abfragen)."""
+    with st.sidebar.expander("⏱️ Metriken"):
+        reruns = metrics.recent_reruns()
+        if reruns:
+            last = reruns[-1]
+            sections = ", ".join(
+                f"{name.split(':', 1)[1]} {seconds * 1000:.0f} ms"
+                for name, seconds in sorted(last['breakdown'].items(), key=lambda item: -item[1])
+            )
+            st.caption(
+                f"Letzter Rerun ({last['name']}): {last['seconds'] * 1000:.0f} ms, "
+                f"{last['queries']} Abfragen ({last['query_seconds'] * 1000:.0f} ms), "
+                f"Pool {last['pool_wait'] * 1000:.0f} ms"
+                + (f" – {sections}" if sections else "")
             )
-    return dataframe
+        stats = pd.DataFrame(metrics.summary())
+        if not stats.empty:
+            for col in ('total', 'max', 'p50', 'p95'):
+                stats[col] = (stats[col] * 1000).round(1)
+            stats.columns = ['Art', 'Name', 'Anzahl', 'Summe ms', 'Max ms', 'p50 ms', 'p95 ms']
+            st.dataframe(stats, hide_index=True, use_container_width=True)
+        queries = sorted(metrics.recent_queries(), key=lambda q: q['seconds'], reverse=True)[:10]
+        if queries:
+            st.caption("Langsamste der letzten Abfragen")
+            st.dataframe(pd.DataFrame([
+                {'ms': round(q['seconds'] * 1000, 1), 'Zeilen': q['rows'], 'Aufruf': q['call'], 'SQL': q['sql']}
+                for q in queries
+            ]), hide_index=True, use_container_width=True)
+        st.download_button("📥 Prometheus-Export", metrics.prometheus_text(), "kpi_metrics.prom")
 
-def validate_data(df):
-    """Validiert Daten und gibt Fehler zurück."""
-    errors = []
-    warnings = []
-    
-    for idx, row in df.iterrows():
-        row_num = idx + 1
-        
-        # Datumsvalidierung
-        if pd.notna(row['Datum']) and row['Datum'] != '':
-            try:
-                pd.to_datetime(row['Datum'], dayfirst=True)
-            except:
-                errors.append(f"Zeile {row_num}: Ungültiges Datum '{row['Datum']}'")
-        
-        # Numerische Felder validieren
-        numeric_fields = ['Fahrzeuge', 'Stopps', 'Unverplante Stopps', 'Kosten Fuhrpark']
-        for field in numeric_fields:
-            if pd.notna(row.get(field)) and str(row.get(field, '')).strip() != '':
-                try:
-                    value = float(str(row[field]).replace(',', '.').replace('€', ''))
-                    if value < 0:
-                        errors.append(f"Zeile {row_num}: {field} darf nicht negativ sein")
-                except:
-                    errors.append(f"Zeile {row_num}: {field} ist keine gültige Zahl")
-    
-    return errors, warnings
-
-def export_to_excel(df, title):
-    """Exportiert DataFrame als formatiertes Excel."""
-    output = BytesIO()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "KPI Daten"
-    
-    # Header-Style
-    header_fill = PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True, size=12)
-    thin_border = Border(
-        left=Side(style='thin'), right=Side(style='thin'),
-        top=Side(style='thin'), bottom=Side(style='thin')
-    )
-    
-    # Header schreiben
-    for col_idx, col_name in enumerate(df.columns, 1):
-        cell = ws.cell(row=1, column=col_idx, value=col_name)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Daten schreiben
-    for row_idx, row in enumerate(df.itertuples(index=False), 2):
-        for col_idx, value in enumerate(row, 1):
-            cell = ws.cell(row=row_idx, column=col_idx, value=value)
-            cell.border = thin_border
-    
-    # Spaltenbreite anpassen
-    for col in ws.columns:
-        max_length = max(len(str(cell.value or '')) for cell in col)
-        ws.column_dimensions[col[0].column_letter].width = min(max_length + 2, 30)
-    
-    wb.save(output)
-    output.seek(0)
-    return output
-
-def get_week_number(date):
-    """Gibt ISO-Wochennummer zurück."""
-    return date.isocalendar()[1]
-
-def format_number_de(value, decimals=2):
-    """Formatiert Zahlen im deutschen Format (Komma als Dezimaltrennzeichen)."""
-    if pd.isna(value) or value == '':
-        return ''
-    try:
-        num = float(value)
-        if decimals == 0:
-            return f"{int(num):,}".replace(',', '.')
+def save_session_id():
+    """Kennung der Browser-Session für das Zusammenlegen von Speichervorgängen."""
+    if 'save_session_id' not in st.session_state:
+        st.session_state['save_session_id'] = uuid.uuid4().hex
+    return st.session_state['save_session_id']
+
+def show_save_jobs():
+    """Ergebnis abgeschlossener und Fortschritt laufender Speichervorgänge."""
+    session_id = save_session_id()
+    pending = 0
+    for job in save_jobs.session_jobs(session_id):
+        if job.status == 'done':
+            result = job.result
+            if result.get('rejected'):
+                st.error(
+                    f"❌ {job.month}: {result['rejected']} Änderungen von der Datenbank abgelehnt "
+                    f"und nicht gespeichert: {result['error']}"
+                )
+            elif result.get('queued'):
+                st.warning(
+                    f"⏳ {job.month}: Datenbank nicht erreichbar – {result['queued']} Änderungen "
+                    f"lokal gesichert, sie werden automatisch nachgetragen."
+                )
+            elif result['changed']:
+                st.success(
+                    f"✅ {job.month} gespeichert! {result['inserted']} neu, {result['updated']} geändert, "
+                    f"{result['deleted']} entfernt, {result['skipped']} übersprungen"
+                )
+            else:
+                st.info(f"ℹ️ {job.month}: Keine Änderungen – nichts zu speichern.")
+            save_jobs.discard(job.id)
+        elif job.status == 'failed':
+            st.error(f"❌ Speichern von {job.month} fehlgeschlagen: {job.error}")
+            save_jobs.discard(job.id)
         else:
-            formatted = f"{num:.{decimals}f}".replace('.', ',')
-            # Tausendertrennzeichen
-            parts = formatted.split(',')
-            parts[0] = f"{int(parts[0]):,}".replace(',', '.')
-            return ','.join(parts)
-    except:
-        return str(value)
-
-def compare_weeks(df):
-    """Vergleicht KPIs wochenweise."""
-    df = df.copy()
-    df['Datum'] = pd.to_datetime(df['Datum'], dayfirst=True, errors='coerce')
-    df = clean_kpi_columns(df)
-    
-    df['Woche'] = df['Datum'].apply(lambda x: f"KW {get_week_number(x)}" if pd.notna(x) else None)
-    
-    # Tagessummen berechnen
-    daily_data = df.groupby(['Datum', 'Woche']).agg({
-        'Fahrzeuge': 'sum',
-        'Stopps': 'sum',
-        'Stoppschnitt': 'mean',
-        'Unverplante Stopps': 'mean',
-        'Kosten Fuhrpark': 'sum',
-        'Stoppkosten': 'mean'
-    }).reset_index()
-    
-    # Wochendurchschnitte
-    weekly_data = daily_data.groupby('Woche').agg({
-        'Fahrzeuge': 'mean',
-        'Stopps': 'mean',
-        'Stoppschnitt': 'mean',
-        'Unverplante Stopps': 'mean',
-        'Kosten Fuhrpark': 'mean',
-        'Stoppkosten': 'mean'
-    }).reset_index()
-    
-    # Deltas berechnen
-    for col in ['Fahrzeuge', 'Stopps', 'Stoppschnitt', 'Unverplante Stopps', 'Kosten Fuhrpark', 'Stoppkosten']:
-        weekly_data[f'{col}_Delta'] = weekly_data[col].diff()
-        pct_change = weekly_data[col].pct_change() * 100
-        pct_change = pct_change.replace([float('inf'), float('-inf')], float('nan'))
-        weekly_data[f'{col}_Delta%'] = pct_change.round(1)
-    
-    return weekly_data
+            pending += 1
+    if pending:
+        show_save_progress(session_id, pending)
+
+@st.fragment(run_every=1)
+def show_save_progress(session_id, pending):
+    """Fragt laufende Jobs ab; ist einer fertig, lädt die ganze Seite neu."""
+    jobs = [job for job in save_jobs.session_jobs(session_id) if not job.finished]
+    if len(jobs) < pending:
+        st.rerun()
+    for job in jobs:
+        st.progress(job.progress, text=f"💾 {job.month}: {job.message}")
+
+def show_save_queue():
+    """Status der lokalen Speicher-Queue und abgelehnte Änderungen; Konflikte nur für Admins."""
+    status = write_queue.status()
+    if status['pending']:
+        st.sidebar.warning(
+            f"⏳ {status['pending']} Änderungen warten auf die Datenbank und werden automatisch nachgetragen."
+        )
+        if status['last_error']:
+            st.sidebar.caption(f"Letzter Fehler: {status['last_error']}")
+    if status['rejected']:
+        with st.sidebar.expander(f"❌ Abgelehnte Änderungen ({status['rejected']})", expanded=True):
+            st.caption("Von der Datenbank abgelehnt und nicht gespeichert – bitte korrigieren")
+            st.dataframe(write_queue.rejected(), hide_index=True, use_container_width=True)
+            col1, col2 = st.columns(2)
+            if col1.button("🔁 Erneut senden"):
+                write_queue.retry_rejected()
+                st.rerun()
+            if col2.button("🗑️ Verwerfen"):
+                write_queue.acknowledge_rejected()
+                st.rerun()
+    if is_admin() and status['conflicts']:
+        with st.sidebar.expander(f"⚠️ Konflikte ({status['conflicts']})"):
+            st.caption("Beim Nachtragen überschriebene Stände anderer Benutzer")
+            st.dataframe(write_queue.conflicts(), hide_index=True, use_container_width=True)
+            if st.button("✔️ Als gesehen markieren"):
+                write_queue.acknowledge_conflicts()
+                st.rerun()
 
 # --- Navigation (rollenbasiert) ---
 st.sidebar.title("📊 KPI Dashboard")
@@ -254,8 +269,15 @@ def get_month_str(dt):
 heute = datetime.today()
 monate = get_months()
 aktueller_monat = get_month_str(heute)
+offline = not is_database_available()
 
-if aktueller_monat not in monate:
+if offline:
+    # Nur Monate aus dem lokalen Snapshot; Speichern nur über die lokale Queue
+    st.sidebar.warning(
+        "⚠️ Datenbank nicht erreichbar – Anzeige aus lokalem Snapshot"
+        + (", Änderungen werden lokal gesichert." if write_queue.SAVE_QUEUE_ENABLED else " (nur lesen).")
+    )
+elif aktueller_monat not in monate:
     monate.append(aktueller_monat)
 monate = sorted(list(set(monate)))
 
@@ -265,278 +287,264 @@ if not monate:
 selected_month = st.sidebar.selectbox(
     "Monat wählen", 
     monate, 
-    index=monate.index(aktueller_monat) if aktueller_monat in monate else 0
+    index=monate.index(aktueller_monat) if aktueller_monat in monate else len(monate) - 1
 )
 
 # Neuen Monat anlegen
 st.sidebar.markdown("---")
 new_month = st.sidebar.text_input("Neuer Monat (YYYY-MM)", value=get_month_str(heute))
-if st.sidebar.button("➕ Monat anlegen"):
+if st.sidebar.button("➕ Monat anlegen", disabled=offline):
     if new_month and new_month not in monate:
         try:
-            create_month(new_month, DEFAULT_STANDORTE)
+            create_month(new_month)
             st.sidebar.success(f"✅ Monat {new_month} angelegt!")
             st.rerun()
         except Exception as e:
             st.sidebar.error(f"Fehler: {e}")
 
-# --- Daten laden ---
-df = get_month_data(selected_month)
-if df.empty:
-    df = pd.DataFrame(columns=COLUMNS)
+# Ganzes Jahr vorab anlegen (nur Admin)
+if is_admin() and st.sidebar.button("📆 Jahr anlegen", disabled=offline):
+    try:
+        year = int(new_month.split('-')[0])
+        created = create_year(year)
+        st.sidebar.success(f"✅ Jahr {year} angelegt ({created} neue Zeilen)!")
+        st.rerun()
+    except Exception as e:
+        st.sidebar.error(f"Fehler: {e}")
+
+if write_queue.SAVE_QUEUE_ENABLED:
+    show_save_queue()
+
+if is_admin():
+    show_metrics_panel()
 
 # === SEITEN ===
+# Jede Seite lädt nur die Daten, die sie braucht. Editor, Exporte, Diagramme
+# und der Monatsvergleich sind Fragmente: Eingaben dort rerunnen nur das
+# Fragment, nicht CSS, Anmeldung, Monatsliste und Datenladen.
 
-if page == "📋 Eingabemaske":
-    st.header(f"📋 Eingabemaske ({selected_month})")
+EDITOR_COLUMN_CONFIG = {
+    "Datum": st.column_config.TextColumn("Datum", help="Format: TT.MM.JJJJ"),
+    "Standort": st.column_config.TextColumn("Standort"),
+    "Disponent": st.column_config.TextColumn("Disponent"),
+    "Fahrzeuge": st.column_config.TextColumn("Fahrzeuge"),
+    "Stopps": st.column_config.TextColumn("Stopps"),
+    "Unverplante Stopps": st.column_config.TextColumn("Unverplante Stopps"),
+    "Kosten Fuhrpark": st.column_config.TextColumn("Kosten Fuhrpark (€)"),
+    "Stoppschnitt": st.column_config.TextColumn("Stoppschnitt", disabled=True),
+    "Stoppkosten": st.column_config.TextColumn("Stoppkosten", disabled=True),
+}
+
+def load_month_frame(month):
+    """Monatsdaten (typisiert: Datum datetime, KPIs Int64/float64) inkl. lokal gesicherter Änderungen."""
+    with metrics.timer('section', 'Daten laden'):
+        df = get_month_data(month)
+        if write_queue.SAVE_QUEUE_ENABLED:
+            # Noch nicht übertragene eigene Änderungen anzeigen
+            df = write_queue.overlay(month, df)
+    return df
+
+def show_input_page(month, can_save):
+    st.header(f"📋 Eingabemaske ({month})")
     
     st.write("Bearbeite die Tabelle direkt im Editor:")
     
-    # Bereinige für Anzeige
-    df_display = df.copy()
-    for col in df_display.columns:
-        df_display[col] = df_display[col].astype(str).replace('nan', '').replace('None', '')
-        # Entferne unnötige .0 bei ganzen Zahlen
-        if col in ['Fahrzeuge', 'Stopps', 'Unverplante Stopps', 'Kosten Fuhrpark', 'Stoppschnitt', 'Stoppkosten']:
-            df_display[col] = df_display[col].apply(lambda x: x.rstrip('0').rstrip('.') if '.' in str(x) and x not in ['', 'nan', 'None'] else x)
+    # Editor arbeitet auf Text (deutsche Eingaben wie '1.234,50')
+    show_editor(month, to_editor_frame(load_month_frame(month)), can_save)
+
+@st.fragment
+def show_editor(month, df_display, can_save):
+    """Editor mit Validierung und Speichern; Eingaben rerunnen nur dieses Fragment."""
+    with metrics.timer('fragment', 'Editor'):
+        edited_df = st.data_editor(
+            df_display,
+            num_rows="dynamic",
+            column_config=EDITOR_COLUMN_CONFIG,
+            column_order=COLUMNS,
+            hide_index=True,
+            use_container_width=True
+        )
+        
+        # Berechne Stoppschnitt und Stoppkosten automatisch (spaltenweise)
+        edited_df = apply_kpis(edited_df, as_text=True)
+        
+        # Validierung
+        validation = validate_data(edited_df)
+        if not validation.empty:
+            st.error("🚨 Validierungsfehler:")
+            for message in validation['message']:
+                st.error(f"❌ {message}")
+            st.dataframe(highlight_errors(edited_df, validation), hide_index=True, use_container_width=True)
+        
+        # Buttons
+        st.markdown("---")
+        col_exports, col_save = st.columns([2, 1])
+        
+        with col_exports:
+            show_exports(month, edited_df)
+        
+        with col_save:
+            if st.button("💾 Speichern", type="primary", disabled=not can_save or not validation.empty):
+                # Im Hintergrund speichern (nur Änderungen gegenüber dem geladenen Stand)
+                save_jobs.submit_save(save_session_id(), month, df_display, edited_df)
     
-    # Column Config
-    column_config = {
-        "Datum": st.column_config.TextColumn("Datum", help="Format: TT.MM.JJJJ"),
-        "Standort": st.column_config.TextColumn("Standort"),
-        "Disponent": st.column_config.TextColumn("Disponent"),
-        "Fahrzeuge": st.column_config.TextColumn("Fahrzeuge"),
-        "Stopps": st.column_config.TextColumn("Stopps"),
-        "Unverplante Stopps": st.column_config.TextColumn("Unverplante Stopps"),
-        "Kosten Fuhrpark": st.column_config.TextColumn("Kosten Fuhrpark (€)"),
-        "Stoppschnitt": st.column_config.TextColumn("Stoppschnitt", disabled=True),
-        "Stoppkosten": st.column_config.TextColumn("Stoppkosten", disabled=True),
-    }
+    show_save_jobs()
+
+@st.fragment
+def show_exports(month, edited_df):
+    """CSV- und Excel-Export des Editor-Stands (Downloads lösen keinen Rerun aus)."""
+    col1, col2 = st.columns(2)
     
-    # Spaltenreihenfolge mit Datum als erste Spalte
-    column_order = ['Datum', 'Standort', 'Disponent', 'Fahrzeuge', 'Stopps', 'Unverplante Stopps', 'Kosten Fuhrpark', 'Stoppschnitt', 'Stoppkosten']
+    with col1:
+        csv = edited_df.to_csv(index=False, sep=';').encode('utf-8')
+        st.download_button("📥 CSV Export", csv, f"KPI_{month}.csv", on_click="ignore")
     
-    edited_df = st.data_editor(
-        df_display,
-        num_rows="dynamic",
-        column_config=column_config,
-        column_order=column_order,
-        hide_index=True,
-        use_container_width=True
-    )
+    with col2:
+        # Excel nur auf Anforderung erzeugen; der Export ist per Inhalts-Hash gecacht
+        if st.button("📊 Excel Export"):
+            st.session_state['excel_export_hash'] = frame_hash(edited_df)
+        requested_hash = st.session_state.get('excel_export_hash')
+        if requested_hash and requested_hash == frame_hash(edited_df):
+            excel = get_excel_export(edited_df, month)
+            st.download_button("📥 Excel herunterladen", excel, f"KPI_{month}.xlsx", on_click="ignore")
+
+def show_daily_report(month):
+    st.header("📊 Daily Report")
     
-    # Berechne Stoppschnitt und Stoppkosten automatisch
-    for idx in edited_df.index:
-        try:
-            fahrzeuge = pd.to_numeric(str(edited_df.at[idx, 'Fahrzeuge']).replace(',', '.'), errors='coerce')
-            stopps = pd.to_numeric(str(edited_df.at[idx, 'Stopps']).replace(',', '.'), errors='coerce')
-            kosten = pd.to_numeric(str(edited_df.at[idx, 'Kosten Fuhrpark']).replace(',', '.'), errors='coerce')
-            
-            # Stoppschnitt berechnen oder löschen
-            if pd.notna(fahrzeuge) and pd.notna(stopps) and fahrzeuge > 0:
-                edited_df.at[idx, 'Stoppschnitt'] = str(round(stopps / fahrzeuge, 1)).replace('.', ',')
-            else:
-                edited_df.at[idx, 'Stoppschnitt'] = ''
-            
-            # Stoppkosten berechnen oder löschen
-            if pd.notna(kosten) and pd.notna(stopps) and stopps > 0:
-                edited_df.at[idx, 'Stoppkosten'] = str(round(kosten / stopps, 2)).replace('.', ',')
-            else:
-                edited_df.at[idx, 'Stoppkosten'] = ''
-        except:
-            pass
+    df = load_month_frame(month)
+    if df.empty:
+        st.info("Keine Daten vorhanden.")
+        return
+    
+    # Filtere Zeilen mit Daten
+    df_with_data = df[(df['Stopps'].notna()) & (df['Stopps'] > 0)]
+    if df_with_data.empty:
+        st.info("Keine Daten mit KPI-Werten vorhanden.")
+        return
+    
+    latest_date = df_with_data['Datum'].max()
+    df_latest = df_with_data[df_with_data['Datum'] == latest_date]
+    
+    st.subheader(f"📅 {latest_date.strftime('%d.%m.%Y')}")
     
-    # Validierung
-    errors, warnings = validate_data(edited_df)
-    if errors:
-        st.error("🚨 Validierungsfehler:")
-        for error in errors:
-            st.error(f"❌ {error}")
+    # KPIs mit deutscher Formatierung
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Ø Stoppkosten", format_currency_de(df_latest['Stoppkosten'].mean()))
+    col2.metric("Gesamt Stopps", format_number_de(df_latest['Stopps'].sum(), 0))
+    col3.metric("Fahrzeuge", format_number_de(df_latest['Fahrzeuge'].sum(), 0))
+    col4.metric("Ø Stoppschnitt", format_number_de(df_latest['Stoppschnitt'].mean(), 1))
     
-    # Buttons
     st.markdown("---")
-    col1, col2, col3 = st.columns(3)
+    
+    # Top/Bottom Standorte
+    col1, col2 = st.columns(2)
     
     with col1:
-        csv = edited_df.to_csv(index=False, sep=';').encode('utf-8')
-        st.download_button("📥 CSV Export", csv, f"KPI_{selected_month}.csv")
+        st.markdown("**🟢 TOP 3 - Niedrigste Stoppkosten**")
+        top3 = df_latest.nsmallest(3, 'Stoppkosten')[['Standort', 'Stoppkosten', 'Stopps']]
+        st.dataframe(format_frame_de(top3, RANKING_FORMATS), hide_index=True)
     
     with col2:
-        excel = export_to_excel(edited_df, selected_month)
-        st.download_button("📊 Excel Export", excel, f"KPI_{selected_month}.xlsx")
-    
-    with col3:
-        if st.button("💾 Speichern", type="primary", disabled=len(errors) > 0):
-            save_month_data(selected_month, edited_df)
-            st.success("✅ Gespeichert!")
-            st.rerun()
-
-elif page == "📊 Daily Report":
-    st.header("📊 Daily Report")
-    
-    if not df.empty:
-        df['Datum'] = pd.to_datetime(df['Datum'], dayfirst=True, errors='coerce')
-        df = clean_kpi_columns(df)
-        
-        # Filtere Zeilen mit Daten
-        df_with_data = df[(df['Stopps'].notna()) & (df['Stopps'] > 0)]
-        
-        if not df_with_data.empty:
-            latest_date = df_with_data['Datum'].max()
-            df_latest = df_with_data[df_with_data['Datum'] == latest_date]
-            
-            st.subheader(f"📅 {latest_date.strftime('%d.%m.%Y')}")
-            
-            # KPIs mit deutscher Formatierung
-            col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Ø Stoppkosten", f"{format_number_de(df_latest['Stoppkosten'].mean(), 2)} €")
-            col2.metric("Gesamt Stopps", format_number_de(int(df_latest['Stopps'].sum()), 0))
-            col3.metric("Fahrzeuge", format_number_de(int(df_latest['Fahrzeuge'].sum()), 0))
-            col4.metric("Ø Stoppschnitt", format_number_de(df_latest['Stoppschnitt'].mean(), 1))
-            
-            st.markdown("---")
-            
-            # Top/Bottom Standorte
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**🟢 TOP 3 - Niedrigste Stoppkosten**")
-                top3 = df_latest.nsmallest(3, 'Stoppkosten')[['Standort', 'Stoppkosten', 'Stopps']].copy()
-                top3['Stoppkosten'] = top3['Stoppkosten'].apply(lambda x: f"{format_number_de(x, 2)} €")
-                top3['Stopps'] = top3['Stopps'].apply(lambda x: format_number_de(x, 0))
-                st.dataframe(top3, hide_index=True)
-            
-            with col2:
-                st.markdown("**🔴 BOTTOM 3 - Höchste Stoppkosten**")
-                bottom3 = df_latest.nlargest(3, 'Stoppkosten')[['Standort', 'Stoppkosten', 'Stopps']].copy()
-                bottom3['Stoppkosten'] = bottom3['Stoppkosten'].apply(lambda x: f"{format_number_de(x, 2)} €")
-                bottom3['Stopps'] = bottom3['Stopps'].apply(lambda x: format_number_de(x, 0))
-                st.dataframe(bottom3, hide_index=True)
-        else:
-            st.info("Keine Daten mit KPI-Werten vorhanden.")
-    else:
-        st.info("Keine Daten vorhanden.")
+        st.markdown("**🔴 BOTTOM 3 - Höchste Stoppkosten**")
+        bottom3 = df_latest.nlargest(3, 'Stoppkosten')[['Standort', 'Stoppkosten', 'Stopps']]
+        st.dataframe(format_frame_de(bottom3, RANKING_FORMATS), hide_index=True)
 
-elif page == "📈 Wochenvergleich":
+def show_weekly_comparison(month):
     st.header("📈 Wochenvergleich")
     
-    if not df.empty:
-        weekly_data = compare_weeks(df)
-        
-        if not weekly_data.empty:
-            st.subheader(f"KPIs pro Woche - {selected_month}")
-            
-            # Formatiere Tabelle für deutsche Darstellung
-            display_data = weekly_data.copy()
-            
-            # Formatiere numerische Spalten
-            display_data['Fahrzeuge'] = display_data['Fahrzeuge'].apply(lambda x: format_number_de(x, 1))
-            display_data['Stopps'] = display_data['Stopps'].apply(lambda x: format_number_de(x, 1))
-            display_data['Stoppschnitt'] = display_data['Stoppschnitt'].apply(lambda x: format_number_de(x, 2))
-            display_data['Unverplante Stopps'] = display_data['Unverplante Stopps'].apply(lambda x: format_number_de(x, 2))
-            display_data['Kosten Fuhrpark'] = display_data['Kosten Fuhrpark'].apply(lambda x: format_number_de(x, 2) + ' €' if x != '' else '')
-            display_data['Stoppkosten'] = display_data['Stoppkosten'].apply(lambda x: format_number_de(x, 2) + ' €' if x != '' else '')
-            
-            # Formatiere Delta-Spalten
-            for col in display_data.columns:
-                if 'Delta%' in col:
-                    display_data[col] = display_data[col].apply(lambda x: f"{x:+.1f}%".replace('.', ',') if pd.notna(x) else "")
-                elif 'Delta' in col and 'Delta%' not in col:
-                    # Absolute Delta-Werte
-                    if 'Kosten' in col or 'Stopp' in col:
-                        display_data[col] = display_data[col].apply(lambda x: ('+' if x > 0 else '') + format_number_de(x, 2) if pd.notna(x) else "")
-                    else:
-                        display_data[col] = display_data[col].apply(lambda x: ('+' if x > 0 else '') + format_number_de(x, 1) if pd.notna(x) else "")
-            
-            st.dataframe(display_data, hide_index=True, use_container_width=True)
-            
-            # Charts
-            st.markdown("---")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                chart = alt.Chart(weekly_data).mark_line(point=True).encode(
-                    x='Woche:N',
-                    y='Stopps:Q',
-                    tooltip=['Woche', 'Stopps']
-                ).properties(title='Stopps pro Woche', height=300)
-                st.altair_chart(chart, use_container_width=True)
-            
-            with col2:
-                chart = alt.Chart(weekly_data).mark_line(point=True, color='red').encode(
-                    x='Woche:N',
-                    y='Stoppkosten:Q',
-                    tooltip=['Woche', alt.Tooltip('Stoppkosten:Q', format='.2f')]
-                ).properties(title='Stoppkosten pro Woche', height=300)
-                st.altair_chart(chart, use_container_width=True)
-    else:
+    # Aggregiert in der Datenbank, die Monatsdaten selbst werden nicht geladen
+    weekly_data = compare_weeks(month)
+    if weekly_data.empty:
         st.info("Keine Daten vorhanden.")
+        return
+    
+    st.subheader(f"KPIs pro Woche - {month}")
+    
+    # Formatiere Tabelle für deutsche Darstellung
+    display_data = format_frame_de(
+        weekly_data.drop(columns=['Wochenstart']),
+        weekly_formats(weekly_data.columns)
+    )
+    
+    st.dataframe(display_data, hide_index=True, use_container_width=True)
+    
+    # Charts
+    st.markdown("---")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        chart = alt.Chart(weekly_data).mark_line(point=True).encode(
+            x=alt.X('Woche:N', sort=None),
+            y='Stopps:Q',
+            tooltip=['Woche', 'Stopps']
+        ).properties(title='Stopps pro Woche', height=300)
+        st.altair_chart(chart, use_container_width=True)
+    
+    with col2:
+        chart = alt.Chart(weekly_data).mark_line(point=True, color='red').encode(
+            x=alt.X('Woche:N', sort=None),
+            y='Stoppkosten:Q',
+            tooltip=['Woche', alt.Tooltip('Stoppkosten:Q', format='.2f')]
+        ).properties(title='Stoppkosten pro Woche', height=300)
+        st.altair_chart(chart, use_container_width=True)
 
-elif page == "📅 Monatsvergleich":
+@st.fragment
+def show_month_comparison(monate):
+    """Vergleich zweier Monate; Auswahl und Button rerunnen nur dieses Fragment."""
     st.header("📅 Monatsvergleich")
     
-    if len(monate) >= 2:
-        col1, col2 = st.columns(2)
-        with col1:
-            month1 = st.selectbox("Monat 1", monate, index=max(0, len(monate)-2))
-        with col2:
-            month2 = st.selectbox("Monat 2", monate, index=len(monate)-1)
+    if len(monate) < 2:
+        st.info("Mindestens 2 Monate benötigt.")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        month1 = st.selectbox("Monat 1", monate, index=max(0, len(monate)-2))
+    with col2:
+        month2 = st.selectbox("Monat 2", monate, index=len(monate)-1)
+    
+    if st.button("🔄 Vergleichen", type="primary"):
+        with metrics.timer('fragment', 'Monatsvergleich'):
+            comparison = compare_months(month1, month2)
         
-        if st.button("🔄 Vergleichen", type="primary"):
-            df1 = get_month_data(month1)
-            df2 = get_month_data(month2)
+        if not comparison.empty:
+            # Formatiere für Anzeige
+            display_comp = comparison.copy()
+            two_decimals = display_comp['KPI'].isin(['Stoppschnitt', 'Stoppkosten']).to_numpy()
+            for col in [month1, month2, 'Delta']:
+                display_comp[col] = np.where(
+                    two_decimals,
+                    format_number_de(comparison[col], 2),
+                    format_number_de(comparison[col], 1)
+                )
+            display_comp['Delta %'] = format_percent_de(comparison['Delta %'])
             
-            if not df1.empty and not df2.empty:
-                df1 = clean_kpi_columns(df1)
-                df2 = clean_kpi_columns(df2)
-                
-                comparison = pd.DataFrame({
-                    'KPI': ['Fahrzeuge', 'Stopps', 'Stoppschnitt', 'Stoppkosten'],
-                    month1: [
-                        df1['Fahrzeuge'].sum(),
-                        df1['Stopps'].sum(),
-                        df1['Stoppschnitt'].mean(),
-                        df1['Stoppkosten'].mean()
-                    ],
-                    month2: [
-                        df2['Fahrzeuge'].sum(),
-                        df2['Stopps'].sum(),
-                        df2['Stoppschnitt'].mean(),
-                        df2['Stoppkosten'].mean()
-                    ]
-                })
-                
-                comparison['Delta'] = comparison[month2] - comparison[month1]
-                comparison['Delta %'] = ((comparison[month2] / comparison[month1] - 1) * 100).round(1)
-                
-                # Formatiere für Anzeige
-                display_comp = comparison.copy()
-                for col in [month1, month2, 'Delta']:
-                    display_comp[col] = display_comp.apply(
-                        lambda row: format_number_de(row[col], 2) if row['KPI'] in ['Stoppschnitt', 'Stoppkosten'] else format_number_de(row[col], 1),
-                        axis=1
-                    )
-                display_comp['Delta %'] = display_comp['Delta %'].apply(lambda x: f"{x:+.1f}%".replace('.', ',') if pd.notna(x) else "")
-                
-                st.dataframe(display_comp, hide_index=True, use_container_width=True)
-    else:
-        st.info("Mindestens 2 Monate benötigt.")
+            st.dataframe(display_comp, hide_index=True, use_container_width=True)
 
-elif page == "📉 Verlauf (KPIs)":
+def show_kpi_history(month):
     st.header("📉 KPI Verlauf")
     
-    if not df.empty:
-        df['Datum'] = pd.to_datetime(df['Datum'], dayfirst=True, errors='coerce')
-        df = clean_kpi_columns(df)
-        
-        standorte = sorted(df['Standort'].dropna().unique())
-        selected = st.multiselect("Standorte", standorte, default=standorte[:1] if standorte else [])
-        
-        kpi = st.selectbox("KPI", ['Stoppkosten', 'Stopps', 'Fahrzeuge', 'Stoppschnitt'])
+    # Auswahl: aktive Standorte plus alle mit Daten im gewählten Monat
+    standorte = sorted(set(get_standorte()) | set(get_month_data(month)['Standort'].dropna()))
+    show_kpi_chart(month, standorte)
+
+@st.fragment
+def show_kpi_chart(month, standorte):
+    """Zeitraum-, Standort- und KPI-Auswahl mit Diagramm; rerunnt nur dieses Fragment."""
+    # Zeitraum (Standard: gewählter Monat), kann mehrere Monate umfassen
+    month_start = datetime.strptime(month, "%Y-%m").date()
+    month_end = (pd.Timestamp(month_start) + pd.offsets.MonthEnd(0)).date()
+    zeitraum = st.date_input("Zeitraum", value=(month_start, month_end), format="DD.MM.YYYY")
+    
+    selected = st.multiselect("Standorte", standorte, default=standorte[:1] if standorte else [])
+    
+    kpi = st.selectbox("KPI", ['Stoppkosten', 'Stopps', 'Fahrzeuge', 'Stoppschnitt'])
+    
+    if selected and len(zeitraum) == 2:
+        with metrics.timer('fragment', 'KPI Verlauf'):
+            chart_data = get_range_data(zeitraum[0], zeitraum[1], standorte=selected, columns=[kpi])
         
-        if selected:
-            chart_data = df[df['Standort'].isin(selected)].sort_values('Datum')
-            
+        if not chart_data.empty:
             chart = alt.Chart(chart_data).mark_line(point=True).encode(
                 x=alt.X('Datum:T', title='Datum'),
                 y=alt.Y(f'{kpi}:Q', title=kpi),
@@ -545,5 +553,27 @@ elif page == "📉 Verlauf (KPIs)":
             ).properties(height=400)
             
             st.altair_chart(chart, use_container_width=True)
-    else:
-        st.info("Keine Daten vorhanden.")
+        else:
+            st.info("Keine Daten im gewählten Zeitraum vorhanden.")
+
+# Auswertungen über mehrere Monate laufen in der Datenbank
+if offline and page not in ("📋 Eingabemaske", "📊 Daily Report"):
+    st.info("Diese Auswertung benötigt die Datenbank und ist offline nicht verfügbar.")
+    metrics.finish_rerun(st.session_state, page)
+    st.stop()
+
+page_timer = metrics.start_timer('page', page)
+
+if page == "📋 Eingabemaske":
+    show_input_page(selected_month, can_save=write_queue.SAVE_QUEUE_ENABLED or not offline)
+elif page == "📊 Daily Report":
+    show_daily_report(selected_month)
+elif page == "📈 Wochenvergleich":
+    show_weekly_comparison(selected_month)
+elif page == "📅 Monatsvergleich":
+    show_month_comparison(monate)
+elif page == "📉 Verlauf (KPIs)":
+    show_kpi_history(selected_month)
+
+page_timer.stop()
+metrics.finish_rerun(st.session_state, page)
@@ -0,0 +1,47 @@
+"""
+Austauschbare Storage-Backends für das KPI Dashboard
+
+database.py bleibt die einzige Schnittstelle für App und Scripts; dahinter
+arbeitet wahlweise PostgreSQL (Supabase/Server) oder eine eingebettete
+SQLite-Datei (Synology/Einzelstandort).
+
+Auswahl (erste zutreffende Regel):
+    KPI_BACKEND=postgres|sqlite         explizit
+    DATABASE_URL=sqlite:///pfad.db      SQLite (sqlite:////absoluter/pfad.db)
+    DATABASE_URL=postgresql://...       PostgreSQL
+    DATABASE_PATH=/data/kpi.db          SQLite (Docker-Standard)
+"""
+from backends.base import (
+    KPIBackend, KPI_COLUMN_MAP, NUMERIC_DB_COLUMNS, STAGING_COLUMNS,
+    KPI_AGGREGATES, DEFAULT_STANDORTE
+)
+
+BACKENDS = ('postgres', 'sqlite')
+SQLITE_URL_PREFIX = 'sqlite:///'
+
+
+def resolve_backend(url: str = None, path: str = None, kind: str = None) -> tuple:
+    """
+    Bestimmt Backend-Art und Ziel aus der Konfiguration.
+
+    Returns:
+        (Art, URL bzw. Dateipfad)
+    """
+    if url and url.startswith(SQLITE_URL_PREFIX):
+        kind = kind or 'sqlite'
+        path = url[len(SQLITE_URL_PREFIX):]
+    if not kind:
+        kind = 'postgres' if url or not path else 'sqlite'
+    if kind not in BACKENDS:
+        raise ValueError(f"Unbekanntes Backend: {kind} (erlaubt: {', '.join(BACKENDS)})")
+    return kind, (url if kind == 'postgres' else path)
+
+
+def create_backend(url: str = None, path: str = None, kind: str = None) -> KPIBackend:
+    """Erstellt ein Backend; die Treiber werden erst hier importiert."""
+    kind, target = resolve_backend(url, path, kind)
+    if kind == 'sqlite':
+        from backends.sqlite import SQLiteBackend
+        return SQLiteBackend(target)
+    from backends.postgres import PostgresBackend
+    return PostgresBackend(target)
@@ -0,0 +1,160 @@
+"""
+Gemeinsame Schnittstelle und Schema-Konstanten der Storage-Backends
+
+database.py ruft ausschließlich diese Methoden auf; Caching, Snapshot,
+Aufbereitung der Frames und Validierung bleiben backend-unabhängig.
+"""
+
+# Mapping Anzeige-Spalten -> Datenbank-Spalten
+KPI_COLUMN_MAP = {
+    'Standort': 'standort',
+    'Disponent': 'disponent',
+    'Fahrzeuge': 'fahrzeuge',
+    'Stopps': 'stopps',
+    'Unverplante Stopps': 'unverplante_stopps',
+    'Kosten Fuhrpark': 'kosten_fuhrpark',
+    'Stoppschnitt': 'stoppschnitt',
+    'Stoppkosten': 'stoppkosten'
+}
+NUMERIC_DB_COLUMNS = [
+    'fahrzeuge', 'stopps', 'unverplante_stopps',
+    'kosten_fuhrpark', 'stoppschnitt', 'stoppkosten'
+]
+STAGING_COLUMNS = ['datum', 'standort', 'disponent'] + NUMERIC_DB_COLUMNS
+MONTH_ROW_COLUMNS = STAGING_COLUMNS
+
+# Standard-Standorte (werden per Migration angelegt)
+DEFAULT_STANDORTE = [
+    'Delmenhorst', 'Güstrow', 'Döbeln', 'Melle', 'Langenfeld',
+    'Kassel', 'Berlin', 'Aschaffenburg', 'Renningen'
+]
+
+# (DB-Spalte, Anzeigename, Aggregat über die Zeilen eines Tages bzw. Monats)
+KPI_AGGREGATES = [
+    ('fahrzeuge', 'Fahrzeuge', 'SUM'),
+    ('stopps', 'Stopps', 'SUM'),
+    ('stoppschnitt', 'Stoppschnitt', 'AVG'),
+    ('unverplante_stopps', 'Unverplante Stopps', 'AVG'),
+    ('kosten_fuhrpark', 'Kosten Fuhrpark', 'SUM'),
+    ('stoppkosten', 'Stoppkosten', 'AVG')
+]
+
+
+class KPIBackend:
+    """
+    Schnittstelle eines Storage-Backends.
+
+    Versionsstempel sind immer (max(updated_at) als datetime oder None,
+    Zeilenzahl). Frames tragen DB-Spaltennamen; Aggregat-Frames zusätzlich
+    die Label-Spalten Datum/Woche, Woche/Wochenstart bzw. Monat sowie
+    <spalte>_delta und <spalte>_delta_pct.
+    """
+
+    name = None
+
+    def init_schema(self) -> list:
+        """Wendet ausstehende Schema-Migrationen an; gibt die angewendeten Versionen zurück."""
+        raise NotImplementedError
+
+    def get_connection(self):
+        raise NotImplementedError
+
+    def return_connection(self, conn):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Verbindungs-Statistiken (Pool-Auslastung, Wartezeiten)."""
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    # --- Lesen ---
+
+    def months_version(self) -> tuple:
+        raise NotImplementedError
+
+    def month_version(self, month: str) -> tuple:
+        raise NotImplementedError
+
+    def month_versions(self, before: str) -> dict:
+        """Versionsstempel aller Monate vor before: {monat: (max(updated_at), Zeilenzahl)}."""
+        raise NotImplementedError
+
+    def list_months(self):
+        """Sortierte Monatsliste und Versionsstempel aus einer Verbindung."""
+        raise NotImplementedError
+
+    def load_month(self, month: str):
+        """Zeilen eines Monats (MONTH_ROW_COLUMNS) und Versionsstempel aus einer Verbindung."""
+        raise NotImplementedError
+
+    def load_range(self, start, end, standorte: list, db_columns: list):
+        """Zeilen im Datumsbereich (inklusive) mit den Spalten db_columns."""
+        raise NotImplementedError
+
+    def daily_aggregates(self, month: str):
+        raise NotImplementedError
+
+    def weekly_aggregates(self, month: str):
+        raise NotImplementedError
+
+    def monthly_aggregates(self, months: list = None):
+        raise NotImplementedError
+
+    def get_standorte(self) -> list:
+        raise NotImplementedError
+
+    # --- Schreiben ---
+
+    def merge_month(self, staged, month: str, prune: bool = True) -> dict:
+        """
+        Übernimmt einen Staging-Frame (STAGING_COLUMNS) in einer Transaktion.
+
+        Returns:
+            dict mit inserted, updated, unchanged, deleted
+        """
+        raise NotImplementedError
+
+    def save_changes(self, staged, deleted, month: str, check=None) -> dict:
+        """
+        Übernimmt nur eine Änderungsmenge: staged (STAGING_COLUMNS) wird
+        upgesertet, die Schlüssel in deleted (datum, standort) des Monats
+        werden entfernt – in einer Transaktion.
+
+        check: optional Funktion, die vor dem Schreiben den aktuellen Stand
+        der betroffenen Zeilen (MONTH_ROW_COLUMNS) erhält. Er wird in derselben
+        Transaktion gesperrt gelesen, zwischen Prüfung und Schreiben kann
+        also niemand dazwischenschreiben (Konflikterkennung der Speicher-Queue).
+
+        Returns:
+            dict mit inserted, updated, unchanged, deleted
+        """
+        raise NotImplementedError
+
+    def import_file(self, staged, month: str, content_hash: str, filename: str,
+                    skipped: int, force: bool = False) -> dict:
+        """Wie merge_month ohne Löschen, plus Eintrag in import_log (idempotent per Hash)."""
+        raise NotImplementedError
+
+    def create_workdays(self, start, end, standorte: list = None) -> int:
+        raise NotImplementedError
+
+    def delete_month(self, month: str) -> bool:
+        raise NotImplementedError
+
+    def purge_months(self, months: list):
+        """Entfernt Monate samt Import-Protokoll ohne Rückfrage (Wartung/Benchmarks)."""
+        raise NotImplementedError
+
+    def archive_month(self, month: str) -> str:
+        """
+        Nimmt einen Monat aus kpi_data heraus, ohne die Zeilen zu löschen.
+
+        Returns:
+            Name der Archivtabelle
+        """
+        raise NotImplementedError(f"{self.name}: Archivieren von Monaten wird nicht unterstützt")
+
+    def add_standorte(self, names: list):
+        raise NotImplementedError
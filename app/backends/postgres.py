@@ -0,0 +1,605 @@
+"""
+PostgreSQL-Backend (Supabase oder eigener Server)
+
+Verbindungen kommen aus dem thread-sicheren KPIConnectionPool. Schreibpfade
+laden per COPY in eine temporäre Staging-Tabelle und übernehmen sie mit
+einem einzigen INSERT ... ON CONFLICT; das Schema verwaltet migrations.py.
+
+kpi_data ist nach Monaten partitioniert (kpi_data_YYYY_MM). Jeder
+Schreibpfad legt vorher die Partitionen seiner Monate an
+(kpi_ensure_month_partition); was trotzdem ohne Partition geschrieben wird,
+fängt kpi_data_default auf. Monatsabfragen grenzen zusätzlich über datum
+ein, damit der Planer nur die Partition des Monats liest; ganze Monate werden per DROP bzw. DETACH der Partition
+entfernt oder archiviert statt zeilenweise gelöscht.
+"""
+import os
+import threading
+import time
+from datetime import date
+from io import StringIO
+
+import pandas as pd
+from psycopg2 import extensions
+
+import metrics
+from connection_pool import KPIConnectionPool
+from backends.base import KPIBackend, KPI_AGGREGATES, STAGING_COLUMNS, MONTH_ROW_COLUMNS
+
+# Connection Pool (thread-sicher, prozessweit von allen Sessions geteilt)
+POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', '10'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+POOL_HEALTH_CHECK_AFTER = float(os.environ.get('DB_POOL_HEALTH_CHECK_AFTER', '30'))
+POOL_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', '5'))
+
+MONTHS_VERSION_QUERY = 'SELECT MAX(updated_at), COUNT(*) FROM kpi_data'
+# monat = %s plus Datumsgrenzen (month_params): das Datum erlaubt Partition-Pruning
+MONTH_FILTER = 'monat = %s AND datum >= %s AND datum < %s'
+MONTH_VERSION_QUERY = f'SELECT MAX(updated_at), COUNT(*) FROM kpi_data WHERE {MONTH_FILTER}'
+
+ENSURE_STAGE_PARTITIONS = '''
+    SELECT kpi_ensure_month_partition(m)
+    FROM (SELECT DISTINCT date_trunc('month', datum)::date FROM kpi_stage) AS months(m)
+'''
+
+
+def month_start(month: str) -> date:
+    """Erster Tag eines Monats 'YYYY-MM'."""
+    year, month_num = map(int, month.split('-'))
+    return date(year, month_num, 1)
+
+
+def month_params(month: str) -> tuple:
+    """Parameter für MONTH_FILTER: (monat, erster Tag, erster Tag des Folgemonats)."""
+    start = month_start(month)
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return month, start, end
+
+
+def partition_name(month: str) -> str:
+    """Name der Partition eines Monats (wie in kpi_ensure_month_partition)."""
+    return 'kpi_data_' + month_start(month).strftime('%Y_%m')
+
+
+def _aggregate_select(func_for=None):
+    """SELECT-Liste der KPI-Aggregate als float8."""
+    return ',\n'.join(
+        f'{func_for or func}({col})::float8 AS {col}'
+        for col, _, func in KPI_AGGREGATES
+    )
+
+
+def _delta_select(order_by: str):
+    """Absolute und prozentuale Veränderung zur Vorperiode über lag()."""
+    parts = []
+    for col, _, _ in KPI_AGGREGATES:
+        prev = f'lag({col}) OVER (ORDER BY {order_by})'
+        parts.append(f'{col} - {prev} AS {col}_delta')
+        parts.append(f'round(((({col} / NULLIF({prev}, 0)) - 1) * 100)::numeric, 1)::float8 AS {col}_delta_pct')
+    return ',\n'.join(parts)
+
+
+AGGREGATE_COLUMNS = ', '.join(col for col, _, _ in KPI_AGGREGATES)
+
+
+class InstrumentedCursor(extensions.cursor):
+    """Cursor, der jede Abfrage mit Dauer und Zeilenzahl an metrics meldet."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            metrics.record_query(sql, time.perf_counter() - started, self.rowcount)
+
+
+class PostgresBackend(KPIBackend):
+    """KPI-Daten in PostgreSQL."""
+
+    name = 'postgres'
+
+    def __init__(self, url: str):
+        if not url:
+            raise ValueError("DATABASE_URL is not set! Check Streamlit Secrets or environment variables.")
+        self.url = url
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    # --- Verbindungen ---
+
+    def _get_pool(self):
+        """Erstellt den Pool beim ersten Zugriff."""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = KPIConnectionPool(
+                        self.url,
+                        minconn=POOL_MIN,
+                        maxconn=POOL_MAX,
+                        timeout=POOL_TIMEOUT,
+                        health_check_after=POOL_HEALTH_CHECK_AFTER,
+                        connect_timeout=POOL_CONNECT_TIMEOUT,
+                        cursor_factory=InstrumentedCursor
+                    )
+        return self._pool
+
+    def get_connection(self):
+        """Holt eine Connection aus dem Pool (wartet bis DB_POOL_TIMEOUT)."""
+        started = time.perf_counter()
+        conn = self._get_pool().getconn()
+        metrics.record_pool_wait(time.perf_counter() - started)
+        return conn
+
+    def return_connection(self, conn):
+        self._get_pool().putconn(conn)
+
+    def stats(self) -> dict:
+        return self._get_pool().stats()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    def init_schema(self) -> list:
+        from migrations import run_migrations
+        return run_migrations()
+
+    def _fetch(self, query: str, params=(), one: bool = False):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+        finally:
+            self.return_connection(conn)
+
+    # --- Lesen ---
+
+    def months_version(self) -> tuple:
+        return tuple(self._fetch(MONTHS_VERSION_QUERY, one=True))
+
+    def month_version(self, month: str) -> tuple:
+        return tuple(self._fetch(MONTH_VERSION_QUERY, month_params(month), one=True))
+
+    def month_versions(self, before: str) -> dict:
+        rows = self._fetch('''
+            SELECT monat, MAX(updated_at), COUNT(*)
+            FROM kpi_data
+            WHERE monat < %s AND datum < %s
+            GROUP BY monat
+        ''', (before, month_start(before)))
+        return {row[0]: (row[1], row[2]) for row in rows}
+
+    def list_months(self):
+        """Monatsliste und Versionsstempel aus einer Verbindung."""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(MONTHS_VERSION_QUERY)
+            version = tuple(cursor.fetchone())
+            cursor.execute('SELECT DISTINCT monat FROM kpi_data ORDER BY monat')
+            return [row[0] for row in cursor.fetchall()], version
+        finally:
+            self.return_connection(conn)
+
+    def load_month(self, month: str):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(MONTH_VERSION_QUERY, month_params(month))
+            version = tuple(cursor.fetchone())
+
+            query = f'''
+                SELECT
+                    datum, standort, disponent, fahrzeuge, stopps,
+                    unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten
+                FROM kpi_data
+                WHERE {MONTH_FILTER}
+                ORDER BY datum, standort
+            '''
+            return pd.read_sql_query(query, conn, params=month_params(month)), version
+        finally:
+            self.return_connection(conn)
+
+    def load_range(self, start, end, standorte: list, db_columns: list):
+        query = f'''
+            SELECT {', '.join(db_columns)}
+            FROM kpi_data
+            WHERE datum BETWEEN %s AND %s
+        '''
+        params = [start, end]
+        if standorte:
+            query += ' AND standort = ANY(%s)'
+            params.append(list(standorte))
+        query += ' ORDER BY datum, standort'
+        return pd.DataFrame(self._fetch(query, params), columns=db_columns)
+
+    def _read_frame(self, query: str, params) -> pd.DataFrame:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=columns)
+        finally:
+            self.return_connection(conn)
+
+    def daily_aggregates(self, month: str) -> pd.DataFrame:
+        return self._read_frame(f'''
+            WITH daily AS (
+                SELECT datum,
+                       {_aggregate_select()}
+                FROM kpi_data
+                WHERE {MONTH_FILTER}
+                GROUP BY datum
+            )
+            SELECT datum AS "Datum",
+                   'KW ' || EXTRACT(week FROM datum)::int AS "Woche",
+                   {AGGREGATE_COLUMNS},
+                   {_delta_select('datum')}
+            FROM daily
+            ORDER BY datum
+        ''', month_params(month))
+
+    def weekly_aggregates(self, month: str) -> pd.DataFrame:
+        return self._read_frame(f'''
+            WITH daily AS (
+                SELECT datum,
+                       {_aggregate_select()}
+                FROM kpi_data
+                WHERE {MONTH_FILTER}
+                GROUP BY datum
+            ), weekly AS (
+                SELECT date_trunc('week', datum)::date AS wochenstart,
+                       {_aggregate_select('AVG')}
+                FROM daily
+                GROUP BY 1
+            )
+            SELECT 'KW ' || EXTRACT(week FROM wochenstart)::int AS "Woche",
+                   wochenstart AS "Wochenstart",
+                   {AGGREGATE_COLUMNS},
+                   {_delta_select('wochenstart')}
+            FROM weekly
+            ORDER BY wochenstart
+        ''', month_params(month))
+
+    def monthly_aggregates(self, months: list = None) -> pd.DataFrame:
+        params = (list(months) if months else None,) * 2
+        return self._read_frame(f'''
+            WITH monthly AS (
+                SELECT monat,
+                       {_aggregate_select()}
+                FROM kpi_data
+                WHERE %s IS NULL OR monat = ANY(%s)
+                GROUP BY monat
+            )
+            SELECT monat AS "Monat",
+                   {AGGREGATE_COLUMNS},
+                   {_delta_select('monat')}
+            FROM monthly
+            ORDER BY monat
+        ''', params)
+
+    def get_standorte(self) -> list:
+        rows = self._fetch('SELECT name FROM standorte WHERE aktiv = TRUE ORDER BY name')
+        return [row[0] for row in rows]
+
+    # --- Schreiben ---
+
+    def merge_month(self, staged: pd.DataFrame, month: str, prune: bool = True) -> dict:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            copy_to_staging(cursor, staged)
+            result = merge_staging(cursor, month, prune=prune)
+            conn.commit()
+            return result
+
+        except Exception as e:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def save_changes(self, staged: pd.DataFrame, deleted: pd.DataFrame, month: str,
+                     check=None) -> dict:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if check is not None:
+                keys = pd.concat([staged[['datum', 'standort']], deleted[['datum', 'standort']]])
+                # Sortiert sperren, damit sich parallele Speichervorgänge nicht verklemmen
+                cursor.execute(f'''
+                    SELECT {', '.join(MONTH_ROW_COLUMNS)}
+                    FROM kpi_data
+                    WHERE (datum, standort) IN (SELECT * FROM unnest(%s::date[], %s::text[]))
+                      AND {MONTH_FILTER}
+                    ORDER BY datum, standort
+                    FOR UPDATE
+                ''', (list(keys['datum']), list(keys['standort'])) + month_params(month))
+                check(pd.DataFrame(cursor.fetchall(), columns=MONTH_ROW_COLUMNS))
+            result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+            if not staged.empty:
+                copy_to_staging(cursor, staged)
+                result = merge_staging(cursor, month, prune=False)
+            if not deleted.empty:
+                cursor.execute('''
+                    DELETE FROM kpi_data k
+                    USING unnest(%s::date[], %s::text[]) AS d(datum, standort)
+                    WHERE k.datum = d.datum AND k.standort = d.standort
+                      AND k.monat = %s AND k.datum >= %s AND k.datum < %s
+                ''', (list(deleted['datum']), list(deleted['standort'])) + month_params(month))
+                result['deleted'] = cursor.rowcount
+            conn.commit()
+            return result
+
+        except Exception as e:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def import_file(self, staged: pd.DataFrame, month: str, content_hash: str, filename: str,
+                    skipped: int, force: bool = False) -> dict:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            if not force:
+                cursor.execute('SELECT 1 FROM import_log WHERE content_hash = %s', (content_hash,))
+                if cursor.fetchone():
+                    conn.rollback()
+                    return {'already_imported': True}
+
+            copy_to_staging(cursor, staged)
+            result = merge_staging(cursor, month, prune=False)
+            cursor.execute('''
+                INSERT INTO import_log (content_hash, filename, monat, rows_staged, rows_skipped)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (content_hash) DO UPDATE SET imported_at = CURRENT_TIMESTAMP
+            ''', (content_hash, filename, month, len(staged), skipped))
+            conn.commit()
+            return result
+
+        except Exception as e:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def create_workdays(self, start, end, standorte: list = None) -> int:
+        if standorte is None:
+            standort_source = 'SELECT name FROM standorte WHERE aktiv = TRUE'
+            params = (start, end)
+        else:
+            standort_source = 'SELECT unnest(%s::text[]) AS name'
+            params = (start, end, list(standorte))
+
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT kpi_ensure_month_partition(m::date)
+                FROM generate_series(date_trunc('month', %s::date), %s::date, interval '1 month') AS m
+            ''', (start, end))
+            cursor.execute(f'''
+                INSERT INTO kpi_data (datum, monat, standort)
+                SELECT tage.tag::date, to_char(tage.tag, 'YYYY-MM'), s.name
+                FROM generate_series(%s::date, %s::date, interval '1 day') AS tage(tag)
+                CROSS JOIN ({standort_source}) AS s
+                WHERE EXTRACT(isodow FROM tage.tag) < 6
+                ON CONFLICT (datum, standort) DO NOTHING
+            ''', params)
+            created = cursor.rowcount
+            conn.commit()
+            return created
+
+        except Exception as e:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def delete_month(self, month: str) -> bool:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+
+            # Prüfe ob Daten vorhanden
+            cursor.execute(f'''
+                SELECT COUNT(*) as count FROM kpi_data
+                WHERE {MONTH_FILTER} AND (fahrzeuge IS NOT NULL OR stopps IS NOT NULL)
+            ''', month_params(month))
+
+            if cursor.fetchone()[0] > 0:
+                return False
+
+            drop_month_partitions(cursor, [month])
+            conn.commit()
+            return True
+
+        except Exception as e:
+            conn.rollback()
+            return False
+        finally:
+            self.return_connection(conn)
+
+    def purge_months(self, months: list):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            drop_month_partitions(cursor, months)
+            cursor.execute('DELETE FROM import_log WHERE monat = ANY(%s)', (list(months),))
+            conn.commit()
+
+        except Exception as e:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def archive_month(self, month: str) -> str:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            partition = partition_name(month)
+            archive = partition_name(month).replace('kpi_data_', 'kpi_archiv_')
+            cursor.execute(f'''
+                SELECT EXISTS (SELECT 1 FROM kpi_data WHERE {MONTH_FILTER}), to_regclass(%s) IS NOT NULL
+            ''', month_params(month) + (archive,))
+            exists, archived = cursor.fetchone()
+            if not exists:
+                raise ValueError(f"Keine Daten für {month} vorhanden")
+            if archived:
+                raise ValueError(f"{archive} existiert bereits")
+
+            # Zeilen aus der DEFAULT-Partition vorher in die Monatspartition holen
+            cursor.execute('SELECT kpi_ensure_month_partition(%s)', (month_start(month),))
+            cursor.execute(f'ALTER TABLE kpi_data DETACH PARTITION {partition}')
+            cursor.execute(f'ALTER TABLE {partition} RENAME TO {archive}')
+            conn.commit()
+            return archive
+
+        except Exception as e:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+    def add_standorte(self, names: list):
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO standorte (name)
+                SELECT unnest(%s::text[])
+                ON CONFLICT (name) DO NOTHING
+            ''', (list(names),))
+            conn.commit()
+
+        except Exception as e:
+            conn.rollback()
+            raise
+        finally:
+            self.return_connection(conn)
+
+
+def copy_to_staging(cursor, staged: pd.DataFrame):
+    """Legt die temporäre Staging-Tabelle an und lädt den Frame per COPY hinein."""
+    cursor.execute('''
+        CREATE TEMP TABLE kpi_stage (
+            datum DATE NOT NULL,
+            standort VARCHAR(100) NOT NULL,
+            disponent VARCHAR(100),
+            fahrzeuge NUMERIC,
+            stopps NUMERIC,
+            unverplante_stopps NUMERIC,
+            kosten_fuhrpark NUMERIC,
+            stoppschnitt NUMERIC,
+            stoppkosten NUMERIC
+        ) ON COMMIT DROP
+    ''')
+    buffer = StringIO()
+    staged.to_csv(buffer, header=False, index=False, na_rep='')
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY kpi_stage ({}) FROM STDIN WITH (FORMAT csv)'.format(', '.join(STAGING_COLUMNS)),
+        buffer
+    )
+
+
+def merge_staging(cursor, month: str = None, prune: bool = False) -> dict:
+    """
+    Übernimmt kpi_stage mit einem einzigen INSERT ... SELECT ... ON CONFLICT.
+
+    Unveränderte Zeilen werden nicht angefasst (updated_at bleibt stehen).
+    Mit prune=True werden Zeilen des Monats gelöscht, die nicht mehr im
+    Staging stehen. Die Spalte monat wird immer aus dem Datum abgeleitet,
+    damit jede Zeile in der Partition ihres Monats liegt.
+    """
+    cursor.execute(ENSURE_STAGE_PARTITIONS)
+    # xmax ist auf partitionierten Tabellen in RETURNING nicht verfügbar:
+    # vorhandene Schlüssel zählt ein CTE (sieht den Stand vor dem INSERT)
+    cursor.execute('''
+        WITH existing AS (
+            SELECT COUNT(*) AS n
+            FROM kpi_stage s
+            JOIN kpi_data k ON k.datum = s.datum AND k.standort = s.standort
+        ), merged AS (
+            INSERT INTO kpi_data
+            (datum, monat, standort, disponent, fahrzeuge, stopps,
+             unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten)
+            SELECT
+                datum, to_char(datum, 'YYYY-MM'), standort, disponent,
+                fahrzeuge, stopps, unverplante_stopps, kosten_fuhrpark,
+                stoppschnitt, stoppkosten
+            FROM kpi_stage
+            ON CONFLICT (datum, standort)
+            DO UPDATE SET
+                monat = EXCLUDED.monat,
+                disponent = EXCLUDED.disponent,
+                fahrzeuge = EXCLUDED.fahrzeuge,
+                stopps = EXCLUDED.stopps,
+                unverplante_stopps = EXCLUDED.unverplante_stopps,
+                kosten_fuhrpark = EXCLUDED.kosten_fuhrpark,
+                stoppschnitt = EXCLUDED.stoppschnitt,
+                stoppkosten = EXCLUDED.stoppkosten,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE (kpi_data.monat, kpi_data.disponent, kpi_data.fahrzeuge, kpi_data.stopps,
+                   kpi_data.unverplante_stopps, kpi_data.kosten_fuhrpark,
+                   kpi_data.stoppschnitt, kpi_data.stoppkosten)
+                IS DISTINCT FROM
+                  (EXCLUDED.monat, EXCLUDED.disponent, EXCLUDED.fahrzeuge, EXCLUDED.stopps,
+                   EXCLUDED.unverplante_stopps, EXCLUDED.kosten_fuhrpark,
+                   EXCLUDED.stoppschnitt, EXCLUDED.stoppkosten)
+            RETURNING 1
+        )
+        SELECT
+            (SELECT COUNT(*) FROM merged),
+            (SELECT n FROM existing),
+            (SELECT COUNT(*) FROM kpi_stage)
+    ''')
+    written, existing, staged = cursor.fetchone()
+    inserted = staged - existing
+    updated = written - inserted
+
+    deleted = 0
+    if prune and month:
+        cursor.execute(f'''
+            DELETE FROM kpi_data k
+            WHERE {MONTH_FILTER}
+              AND NOT EXISTS (
+                  SELECT 1 FROM kpi_stage s
+                  WHERE s.datum = k.datum AND s.standort = k.standort
+              )
+        ''', month_params(month))
+        deleted = cursor.rowcount
+
+    return {
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': staged - inserted - updated,
+        'deleted': deleted
+    }
+
+
+def drop_month_partitions(cursor, months: list):
+    """Verwirft die Partitionen der Monate samt ihrer Zeilen (auch aus der DEFAULT-Partition)."""
+    for month in months:
+        cursor.execute(f'DROP TABLE IF EXISTS {partition_name(month)}')
+        _, start, end = month_params(month)
+        cursor.execute('DELETE FROM kpi_data_default WHERE datum >= %s AND datum < %s', (start, end))
@@ -0,0 +1,708 @@
+"""
+SQLite-Backend (eingebettete Datenbankdatei, z.B. auf der Synology)
+
+Für Einzelstandorte ohne Datenbankserver: keine Netzwerk-Latenz. Verbindungen
+auf die Datei werden wie beim PostgreSQL-Backend ausgeliehen und
+zurückgegeben (höchstens SQLITE_POOL_MAX gleichzeitig, Wartezeit bis
+DB_POOL_TIMEOUT); der WAL-Modus erlaubt parallele Leser neben einem Schreiber.
+Schreibtransaktionen starten mit BEGIN IMMEDIATE und warten bei Sperren bis
+SQLITE_BUSY_TIMEOUT.
+
+Das Schema entspricht migrations.py (gleiche Tabellen und Schlüssel), wird
+aber mit eigenen, SQLite-tauglichen Migrationen in schema_version gepflegt.
+updated_at hat Millisekunden-Auflösung, damit die Versionsstempel der
+Lese-Caches auch bei schnell aufeinanderfolgenden Änderungen wechseln.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+import metrics
+from connection_pool import PoolTimeout
+from backends.base import (
+    KPIBackend, KPI_AGGREGATES, STAGING_COLUMNS, NUMERIC_DB_COLUMNS, MONTH_ROW_COLUMNS, DEFAULT_STANDORTE
+)
+
+BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', '30'))
+CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '65536'))
+POOL_MAX = int(os.environ.get('SQLITE_POOL_MAX', '8'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+
+NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+MIGRATIONS = [
+    {
+        'version': 1,
+        'name': 'Basistabellen',
+        'statements': [
+            f'''
+            CREATE TABLE IF NOT EXISTS kpi_data (
+                id INTEGER PRIMARY KEY,
+                datum TEXT NOT NULL,
+                monat TEXT NOT NULL,
+                standort TEXT NOT NULL,
+                disponent TEXT,
+                fahrzeuge INTEGER,
+                stopps INTEGER,
+                unverplante_stopps REAL,
+                kosten_fuhrpark REAL,
+                stoppschnitt REAL,
+                stoppkosten REAL,
+                created_at TEXT DEFAULT ({NOW}),
+                updated_at TEXT DEFAULT ({NOW}),
+                UNIQUE(datum, standort)
+            )
+            ''',
+            f'''
+            CREATE TABLE IF NOT EXISTS standorte (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                aktiv INTEGER DEFAULT 1,
+                created_at TEXT DEFAULT ({NOW})
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS disponenten (
+                id INTEGER PRIMARY KEY,
+                name TEXT UNIQUE NOT NULL,
+                standort_id INTEGER REFERENCES standorte(id),
+                aktiv INTEGER DEFAULT 1
+            )
+            ''',
+            f'''
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                username TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                role TEXT DEFAULT 'user',
+                created_at TEXT DEFAULT ({NOW})
+            )
+            ''',
+            f'''
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER,
+                action TEXT NOT NULL,
+                table_name TEXT,
+                record_id INTEGER,
+                old_values TEXT,
+                new_values TEXT,
+                created_at TEXT DEFAULT ({NOW})
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_kpi_datum ON kpi_data(datum)',
+            'CREATE INDEX IF NOT EXISTS idx_kpi_monat ON kpi_data(monat)',
+            'CREATE INDEX IF NOT EXISTS idx_kpi_standort ON kpi_data(standort)'
+        ]
+    },
+    {
+        'version': 2,
+        'name': 'Standard-Standorte',
+        'statements': [
+            (
+                'INSERT INTO standorte (name) SELECT value FROM json_each(?) WHERE true '
+                'ON CONFLICT (name) DO NOTHING',
+                (json.dumps(DEFAULT_STANDORTE),)
+            )
+        ]
+    },
+    {
+        'version': 3,
+        'name': 'Index für Standort-Zeitreihen (get_range_data)',
+        'statements': [
+            'CREATE INDEX IF NOT EXISTS idx_kpi_standort_datum ON kpi_data(standort, datum)'
+        ]
+    },
+    {
+        'version': 4,
+        'name': 'Import-Protokoll für CSV-Bulk-Import',
+        'statements': [
+            f'''
+            CREATE TABLE IF NOT EXISTS import_log (
+                content_hash TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                monat TEXT NOT NULL,
+                rows_staged INTEGER NOT NULL,
+                rows_skipped INTEGER NOT NULL,
+                imported_at TEXT DEFAULT ({NOW})
+            )
+            '''
+        ]
+    }
+]
+
+# Zahlen wie in PostgreSQL speichern: INTEGER gerundet, NUMERIC(10,2) auf 2 Stellen
+STAGE_VALUES = {
+    'fahrzeuge': 'CAST(round(fahrzeuge) AS INTEGER)',
+    'stopps': 'CAST(round(stopps) AS INTEGER)',
+    'unverplante_stopps': 'round(unverplante_stopps, 2)',
+    'kosten_fuhrpark': 'round(kosten_fuhrpark, 2)',
+    'stoppschnitt': 'round(stoppschnitt, 2)',
+    'stoppkosten': 'round(stoppkosten, 2)'
+}
+VALUE_COLUMNS = ['monat', 'disponent'] + NUMERIC_DB_COLUMNS
+
+# Montag der Woche (strftime %w: Sonntag = 0)
+WEEK_START = "date(datum, '-' || ((CAST(strftime('%w', datum) AS INTEGER) + 6) % 7) || ' days')"
+
+AGGREGATE_COLUMNS = ', '.join(col for col, _, _ in KPI_AGGREGATES)
+
+
+def _aggregate_select(func_for=None):
+    """SELECT-Liste der KPI-Aggregate als REAL."""
+    return ',\n'.join(
+        f'CAST({func_for or func}({col}) AS REAL) AS {col}'
+        for col, _, func in KPI_AGGREGATES
+    )
+
+
+def _delta_select(order_by: str):
+    """Absolute und prozentuale Veränderung zur Vorperiode über lag()."""
+    parts = []
+    for col, _, _ in KPI_AGGREGATES:
+        prev = f'lag({col}) OVER (ORDER BY {order_by})'
+        parts.append(f'{col} - {prev} AS {col}_delta')
+        parts.append(f'round((({col} / NULLIF({prev}, 0)) - 1) * 100, 1) AS {col}_delta_pct')
+    return ',\n'.join(parts)
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _version(row) -> tuple:
+    """(max(updated_at), Zeilenzahl) mit datetime wie bei PostgreSQL."""
+    return (_parse_timestamp(row[0]), row[1])
+
+
+def _iso_week_labels(dates: pd.Series) -> pd.Series:
+    """'KW n' nach ISO 8601 (strftime %V fehlt in älteren SQLite-Versionen)."""
+    weeks = pd.to_datetime(dates).dt.isocalendar().week
+    return 'KW ' + weeks.astype(str)
+
+
+def _rows(staged: pd.DataFrame) -> list:
+    """Staging-Frame -> Parameterzeilen (Datum als ISO-Text, NaN als NULL)."""
+    values = staged[STAGING_COLUMNS].astype(object)
+    values['datum'] = staged['datum'].map(lambda d: d.isoformat())
+    values = values.where(staged[STAGING_COLUMNS].notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor, der jede Abfrage mit Dauer und Zeilenzahl an metrics meldet."""
+
+    _entry = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._entry = metrics.record_query(sql, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._entry = metrics.record_query(sql, time.perf_counter() - started, self.rowcount)
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._entry:
+            self._entry['rows'] = len(rows)
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Verbindung, deren Cursor (auch conn.execute und pandas) gemessen werden."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class SQLiteBackend(KPIBackend):
+    """KPI-Daten in einer lokalen SQLite-Datei."""
+
+    name = 'sqlite'
+
+    def __init__(self, path: str):
+        if not path:
+            raise ValueError("SQLite-Pfad fehlt (DATABASE_PATH oder sqlite:///pfad)")
+        self.path = path
+        self._idle = deque()
+        self._size = 0  # offene + gerade im Aufbau befindliche Verbindungen
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._counters = {'connections': 0, 'checkouts': 0, 'waits': 0, 'timeouts': 0,
+                          'busy_waits': 0, 'busy_wait_time_total': 0.0}
+
+    # --- Verbindungen ---
+
+    def _connect(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # isolation_level=None: Transaktionen werden explizit gesteuert (_transaction)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False, factory=InstrumentedConnection)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute('PRAGMA foreign_keys = ON')
+        conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def get_connection(self):
+        """
+        Leiht eine Verbindung aus. Sind alle POOL_MAX Verbindungen vergeben,
+        wird bis POOL_TIMEOUT gewartet, danach PoolTimeout ausgelöst.
+        """
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.ProgrammingError("SQLite-Backend ist geschlossen")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < POOL_MAX:
+                    conn = None
+                    self._size += 1  # Platz reservieren, Öffnen außerhalb des Locks
+                    break
+                remaining = POOL_TIMEOUT - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"Keine freie SQLite-Verbindung nach {POOL_TIMEOUT:.1f}s "
+                        f"(max. {POOL_MAX} Verbindungen)"
+                    )
+                self._counters['waits'] += 1
+                self._cond.wait(remaining)
+            self._counters['checkouts'] += 1
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._counters['connections'] += 1
+        metrics.record_pool_wait(time.monotonic() - started)
+        return conn
+
+    def return_connection(self, conn):
+        """Gibt eine Verbindung zurück; offene Transaktionen werden zurückgerollt."""
+        close = self._closed
+        if not close and conn.in_transaction:
+            try:
+                conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                close = True
+        with self._cond:
+            if close or self._closed:
+                self._size -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {'backend': self.name, 'path': self.path, 'open': self._size,
+                    'idle': len(self._idle), 'max': POOL_MAX, **self._counters}
+
+    def close(self):
+        """Schließt alle freien Verbindungen; ausgeliehene beim Zurückgeben."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._size -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def _transaction(self, write: bool = False):
+        """
+        Lese- bzw. Schreibtransaktion auf einer ausgeliehenen Verbindung.
+
+        Lesetransaktionen sehen einen konsistenten Stand (Version und Zeilen
+        aus demselben Snapshot); Schreibtransaktionen sperren sofort.
+        """
+        conn = self.get_connection()
+        try:
+            started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            waited = time.perf_counter() - started
+            metrics.record_pool_wait(waited)
+            if waited > 0.01:
+                with self._cond:
+                    self._counters['busy_waits'] += 1
+                    self._counters['busy_wait_time_total'] += waited
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except Exception as e:
+                conn.execute('ROLLBACK')
+                raise
+        finally:
+            self.return_connection(conn)
+
+    def _fetch(self, query: str, params=(), one: bool = False):
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(query, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+        finally:
+            self.return_connection(conn)
+
+    def init_schema(self) -> list:
+        """Wendet ausstehende Migrationen an (BEGIN IMMEDIATE serialisiert parallele Prozesse)."""
+        applied = []
+        with self._transaction(write=True) as conn:
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TEXT DEFAULT ({NOW})
+                )
+            ''')
+            current = conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+            for migration in MIGRATIONS:
+                if migration['version'] <= current:
+                    continue
+                print(f"🛠️ Migration {migration['version']}: {migration['name']}")
+                for statement in migration['statements']:
+                    if isinstance(statement, tuple):
+                        conn.execute(*statement)
+                    else:
+                        conn.execute(statement)
+                conn.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                             (migration['version'], migration['name']))
+                applied.append(migration['version'])
+        return applied
+
+    # --- Lesen ---
+
+    def months_version(self) -> tuple:
+        return _version(self._fetch('SELECT MAX(updated_at), COUNT(*) FROM kpi_data', one=True))
+
+    def month_version(self, month: str) -> tuple:
+        return _version(self._fetch(
+            'SELECT MAX(updated_at), COUNT(*) FROM kpi_data WHERE monat = ?', (month,), one=True
+        ))
+
+    def month_versions(self, before: str) -> dict:
+        rows = self._fetch('''
+            SELECT monat, MAX(updated_at), COUNT(*)
+            FROM kpi_data
+            WHERE monat < ?
+            GROUP BY monat
+        ''', (before,))
+        return {row[0]: _version(row[1:]) for row in rows}
+
+    def list_months(self):
+        with self._transaction() as conn:
+            version = _version(conn.execute('SELECT MAX(updated_at), COUNT(*) FROM kpi_data').fetchone())
+            months = [row[0] for row in conn.execute('SELECT DISTINCT monat FROM kpi_data ORDER BY monat')]
+        return months, version
+
+    def load_month(self, month: str):
+        with self._transaction() as conn:
+            version = _version(conn.execute(
+                'SELECT MAX(updated_at), COUNT(*) FROM kpi_data WHERE monat = ?', (month,)
+            ).fetchone())
+            rows = pd.read_sql_query('''
+                SELECT
+                    datum, standort, disponent, fahrzeuge, stopps,
+                    unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten
+                FROM kpi_data
+                WHERE monat = ?
+                ORDER BY datum, standort
+            ''', conn, params=(month,))
+        return rows, version
+
+    def load_range(self, start, end, standorte: list, db_columns: list):
+        query = f'''
+            SELECT {', '.join(db_columns)}
+            FROM kpi_data
+            WHERE datum BETWEEN ? AND ?
+        '''
+        params = [str(start), str(end)]
+        if standorte:
+            query += ' AND standort IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(list(standorte)))
+        query += ' ORDER BY datum, standort'
+        return pd.DataFrame(self._fetch(query, params), columns=db_columns)
+
+    def _read_frame(self, query: str, params) -> pd.DataFrame:
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(query, params)
+            columns = [desc[0] for desc in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=columns)
+        finally:
+            self.return_connection(conn)
+
+    def daily_aggregates(self, month: str) -> pd.DataFrame:
+        df = self._read_frame(f'''
+            WITH daily AS (
+                SELECT datum,
+                       {_aggregate_select()}
+                FROM kpi_data
+                WHERE monat = ?
+                GROUP BY datum
+            )
+            SELECT datum AS "Datum",
+                   {AGGREGATE_COLUMNS},
+                   {_delta_select('datum')}
+            FROM daily
+            ORDER BY datum
+        ''', (month,))
+        df.insert(1, 'Woche', _iso_week_labels(df['Datum']))
+        return df
+
+    def weekly_aggregates(self, month: str) -> pd.DataFrame:
+        df = self._read_frame(f'''
+            WITH daily AS (
+                SELECT datum,
+                       {_aggregate_select()}
+                FROM kpi_data
+                WHERE monat = ?
+                GROUP BY datum
+            ), weekly AS (
+                SELECT {WEEK_START} AS wochenstart,
+                       {_aggregate_select('AVG')}
+                FROM daily
+                GROUP BY 1
+            )
+            SELECT wochenstart AS "Wochenstart",
+                   {AGGREGATE_COLUMNS},
+                   {_delta_select('wochenstart')}
+            FROM weekly
+            ORDER BY wochenstart
+        ''', (month,))
+        df.insert(0, 'Woche', _iso_week_labels(df['Wochenstart']))
+        return df
+
+    def monthly_aggregates(self, months: list = None) -> pd.DataFrame:
+        where, params = '', ()
+        if months:
+            where = 'WHERE monat IN (SELECT value FROM json_each(?))'
+            params = (json.dumps(list(months)),)
+        return self._read_frame(f'''
+            WITH monthly AS (
+                SELECT monat,
+                       {_aggregate_select()}
+                FROM kpi_data
+                {where}
+                GROUP BY monat
+            )
+            SELECT monat AS "Monat",
+                   {AGGREGATE_COLUMNS},
+                   {_delta_select('monat')}
+            FROM monthly
+            ORDER BY monat
+        ''', params)
+
+    def get_standorte(self) -> list:
+        rows = self._fetch('SELECT name FROM standorte WHERE aktiv = 1 ORDER BY name')
+        return [row[0] for row in rows]
+
+    # --- Schreiben ---
+
+    def _stage(self, conn, rows: list):
+        """Füllt die temporäre Staging-Tabelle der Verbindung mit Parameterzeilen (_rows)."""
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS kpi_stage (
+                datum TEXT NOT NULL,
+                standort TEXT NOT NULL,
+                disponent TEXT,
+                fahrzeuge REAL,
+                stopps REAL,
+                unverplante_stopps REAL,
+                kosten_fuhrpark REAL,
+                stoppschnitt REAL,
+                stoppkosten REAL
+            )
+        ''')
+        conn.execute('DELETE FROM kpi_stage')
+        placeholders = ', '.join('?' for _ in STAGING_COLUMNS)
+        conn.executemany(
+            f"INSERT INTO kpi_stage ({', '.join(STAGING_COLUMNS)}) VALUES ({placeholders})",
+            rows
+        )
+
+    def _merge_stage(self, conn, month: str = None, prune: bool = False) -> dict:
+        """
+        Übernimmt kpi_stage per INSERT ... ON CONFLICT; unveränderte Zeilen
+        werden nicht angefasst (updated_at bleibt stehen). monat wird wie im
+        PostgreSQL-Backend immer aus dem Datum abgeleitet.
+        """
+        staged, existing = conn.execute('''
+            SELECT COUNT(*), COUNT(k.id)
+            FROM kpi_stage s
+            LEFT JOIN kpi_data k ON k.datum = s.datum AND k.standort = s.standort
+        ''').fetchone()
+
+        target = lambda prefix: ', '.join(f'{prefix}{col}' for col in VALUE_COLUMNS)
+        cursor = conn.execute(f'''
+            INSERT INTO kpi_data
+            (datum, monat, standort, disponent, fahrzeuge, stopps,
+             unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten)
+            SELECT
+                datum, strftime('%Y-%m', datum), standort, disponent,
+                {', '.join(STAGE_VALUES[col] for col in NUMERIC_DB_COLUMNS)}
+            FROM kpi_stage
+            WHERE true
+            ON CONFLICT (datum, standort)
+            DO UPDATE SET
+                {', '.join(f'{col} = excluded.{col}' for col in VALUE_COLUMNS)},
+                updated_at = {NOW}
+            WHERE ({target('kpi_data.')}) IS NOT ({target('excluded.')})
+        ''')
+        written = cursor.rowcount
+        inserted = staged - existing
+
+        deleted = 0
+        if prune and month:
+            deleted = conn.execute('''
+                DELETE FROM kpi_data
+                WHERE monat = ?
+                  AND NOT EXISTS (
+                      SELECT 1 FROM kpi_stage s
+                      WHERE s.datum = kpi_data.datum AND s.standort = kpi_data.standort
+                  )
+            ''', (month,)).rowcount
+        conn.execute('DELETE FROM kpi_stage')
+
+        return {
+            'inserted': inserted,
+            'updated': written - inserted,
+            'unchanged': existing - (written - inserted),
+            'deleted': deleted
+        }
+
+    def merge_month(self, staged: pd.DataFrame, month: str, prune: bool = True) -> dict:
+        # Parameter vor der Schreibsperre aufbereiten
+        rows = _rows(staged)
+        with self._transaction(write=True) as conn:
+            self._stage(conn, rows)
+            return self._merge_stage(conn, month, prune=prune)
+
+    def save_changes(self, staged: pd.DataFrame, deleted: pd.DataFrame, month: str,
+                     check=None) -> dict:
+        rows = _rows(staged)
+        keys = [(d.isoformat(), standort, month)
+                for d, standort in zip(deleted['datum'], deleted['standort'])]
+        with self._transaction(write=True) as conn:
+            if check is not None:
+                # BEGIN IMMEDIATE hält die Schreibsperre bereits bis zum Commit
+                checked = [[row[0], row[1]] for row in rows] + [[key[0], key[1]] for key in keys]
+                cursor = conn.execute(f'''
+                    SELECT {', '.join(MONTH_ROW_COLUMNS)}
+                    FROM kpi_data
+                    WHERE monat = ?
+                      AND (datum, standort) IN (
+                          SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]') FROM json_each(?)
+                      )
+                    ORDER BY datum, standort
+                ''', (month, json.dumps(checked)))
+                check(pd.DataFrame(cursor.fetchall(), columns=MONTH_ROW_COLUMNS))
+            result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+            if rows:
+                self._stage(conn, rows)
+                result = self._merge_stage(conn, month, prune=False)
+            if keys:
+                result['deleted'] = conn.executemany(
+                    'DELETE FROM kpi_data WHERE datum = ? AND standort = ? AND monat = ?', keys
+                ).rowcount
+            return result
+
+    def import_file(self, staged: pd.DataFrame, month: str, content_hash: str, filename: str,
+                    skipped: int, force: bool = False) -> dict:
+        rows = _rows(staged)
+        with self._transaction(write=True) as conn:
+            if not force:
+                found = conn.execute(
+                    'SELECT 1 FROM import_log WHERE content_hash = ?', (content_hash,)
+                ).fetchone()
+                if found:
+                    return {'already_imported': True}
+
+            self._stage(conn, rows)
+            result = self._merge_stage(conn, month, prune=False)
+            conn.execute(f'''
+                INSERT INTO import_log (content_hash, filename, monat, rows_staged, rows_skipped)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (content_hash) DO UPDATE SET imported_at = {NOW}
+            ''', (content_hash, filename, month, len(staged), skipped))
+            return result
+
+    def create_workdays(self, start, end, standorte: list = None) -> int:
+        if standorte is None:
+            standort_source = 'SELECT name FROM standorte WHERE aktiv = 1'
+            params = (str(start), str(end))
+        else:
+            standort_source = 'SELECT value AS name FROM json_each(?)'
+            params = (str(start), str(end), json.dumps(list(standorte)))
+
+        with self._transaction(write=True) as conn:
+            return conn.execute(f'''
+                INSERT INTO kpi_data (datum, monat, standort)
+                WITH RECURSIVE tage(tag) AS (
+                    SELECT date(?)
+                    UNION ALL
+                    SELECT date(tag, '+1 day') FROM tage WHERE tag < date(?)
+                )
+                SELECT tage.tag, strftime('%Y-%m', tage.tag), s.name
+                FROM tage
+                CROSS JOIN ({standort_source}) AS s
+                WHERE strftime('%w', tage.tag) NOT IN ('0', '6')
+                ON CONFLICT (datum, standort) DO NOTHING
+            ''', params).rowcount
+
+    def delete_month(self, month: str) -> bool:
+        try:
+            with self._transaction(write=True) as conn:
+                # Prüfe ob Daten vorhanden
+                filled = conn.execute('''
+                    SELECT COUNT(*) FROM kpi_data
+                    WHERE monat = ? AND (fahrzeuge IS NOT NULL OR stopps IS NOT NULL)
+                ''', (month,)).fetchone()[0]
+                if filled > 0:
+                    return False
+                conn.execute('DELETE FROM kpi_data WHERE monat = ?', (month,))
+                return True
+        except Exception as e:
+            return False
+
+    def purge_months(self, months: list):
+        params = (json.dumps(list(months)),)
+        with self._transaction(write=True) as conn:
+            conn.execute('DELETE FROM kpi_data WHERE monat IN (SELECT value FROM json_each(?))', params)
+            conn.execute('DELETE FROM import_log WHERE monat IN (SELECT value FROM json_each(?))', params)
+
+    def add_standorte(self, names: list):
+        with self._transaction(write=True) as conn:
+            conn.execute('''
+                INSERT INTO standorte (name)
+                SELECT value FROM json_each(?) WHERE true
+                ON CONFLICT (name) DO NOTHING
+            ''', (json.dumps(list(names)),))
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Benchmark-Suite für das KPI Dashboard
+
+Erzeugt synthetische Monatsdaten im Format von monatsdaten/ (konfigurierbare
+Standorte, Jahre und Disponenten) und misst die zentralen Pfade:
+CSV-Import, create_month, save_month_data, save_month_changes (eine Zelle),
+get_month_data (kalt/warm), compare_weeks, validate_data und export_to_excel.
+
+Die synthetischen Daten liegen in weit entfernten Jahren (Standard: ab 2091)
+und werden am Ende wieder entfernt; die Benchmark-Datenbank wird trotzdem
+explizit angegeben (--database-url oder BENCHMARK_DATABASE_URL). Mit
+sqlite:///pfad.db läuft dieselbe Suite gegen das eingebettete SQLite-Backend;
+die Backend-Art steht in meta.backend, Vergleiche gelten je Backend.
+
+Ergebnisse werden als JSON geschrieben; mit --compare wird gegen einen
+früheren Lauf verglichen und bei Regressionen mit Exit-Code 1 beendet.
+
+Aufruf:
+    python benchmark.py --database-url postgresql://...|sqlite:///kpi.db [--sites 9] [--years 1]
+                        [--disponenten 2] [--repeat 5] [--output results.json]
+                        [--compare baseline.json] [--threshold 1.25]
+    python benchmark.py --generate-only DIR [--sites 9] [--years 1]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# Füge Parent-Verzeichnis zum Path hinzu
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from formatting import format_number_de
+
+CSV_COLUMNS = ['Datum', 'Standort', 'Disponent', 'Fahrzeuge', 'Stopps',
+               'Unverplante Stopps', 'Kosten Fuhrpark', 'Stoppschnitt', 'Stoppkosten']
+# Kosten je Fahrzeug und Tag wie in den echten Monatsdaten (z.B. 14 -> 5320€)
+COST_PER_VEHICLE = 380
+
+
+# --- Synthetische Daten ---
+
+def site_names(count: int) -> list:
+    return [f"Standort {i:02d}" for i in range(1, count + 1)]
+
+
+def generate_month(month: str, standorte: list, disponenten: int = 2,
+                   rng: np.random.Generator = None) -> pd.DataFrame:
+    """
+    Erzeugt einen Monat im CSV-Format von monatsdaten/ (Text, Dezimalkomma, €).
+
+    Eine Zeile pro Werktag und Standort; der Disponent wechselt zufällig
+    zwischen den Disponenten des Standorts.
+    """
+    rng = rng or np.random.default_rng(0)
+    start = pd.Timestamp(f"{month}-01")
+    days = pd.bdate_range(start, start + pd.offsets.MonthEnd(0))
+
+    n = len(days) * len(standorte)
+    datum = np.repeat(days.strftime('%d.%m.%Y').to_numpy(), len(standorte))
+    standort = np.tile(np.asarray(standorte, dtype=object), len(days))
+    site_index = np.tile(np.arange(len(standorte)), len(days))
+    disponent = pd.Series(site_index).astype(str).str.zfill(2) + '-' + \
+        pd.Series(rng.integers(1, disponenten + 1, n)).astype(str)
+
+    fahrzeuge = rng.integers(10, 21, n)
+    stopps = np.round(fahrzeuge * rng.uniform(15, 25, n)).astype(int)
+    unverplant = np.round(rng.uniform(15, 30, n), 1)
+    kosten = fahrzeuge * COST_PER_VEHICLE
+
+    return pd.DataFrame({
+        'Datum': datum,
+        'Standort': standort,
+        'Disponent': 'Disponent ' + disponent,
+        'Fahrzeuge': fahrzeuge.astype(str),
+        'Stopps': stopps.astype(str),
+        'Unverplante Stopps': format_number_de(unverplant, 1, thousands=False),
+        'Kosten Fuhrpark': pd.Series(kosten).astype(str) + '€',
+        'Stoppschnitt': format_number_de(stopps / fahrzeuge, 1, thousands=False),
+        'Stoppkosten': format_number_de(kosten / stopps, 2, thousands=False) + '€'
+    })[CSV_COLUMNS]
+
+
+def benchmark_months(start_year: int, years: int) -> list:
+    return [f"{year}-{month:02d}" for year in range(start_year, start_year + years)
+            for month in range(1, 13)]
+
+
+def generate_dataset(out_dir: str, sites: int = 9, years: int = 1, disponenten: int = 2,
+                     start_year: int = 2091, seed: int = 42) -> list:
+    """Schreibt synthetische Monats-CSVs (UTF-8 mit BOM, ';', alle Felder gequotet)."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    standorte = site_names(sites)
+    paths = []
+    for month in benchmark_months(start_year, years):
+        path = os.path.join(out_dir, f"{month}.csv")
+        generate_month(month, standorte, disponenten, rng).to_csv(
+            path, sep=';', index=False, encoding='utf-8-sig', quoting=1
+        )
+        paths.append(path)
+    return paths
+
+
+# --- Messung ---
+
+def measure(fn, repeat: int, setup=None) -> dict:
+    """Führt fn repeat-mal aus (setup vorher, nicht gemessen) und fasst die Zeiten zusammen."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    summary = {
+        'repeat': repeat,
+        'min': round(min(timings), 6),
+        'median': round(statistics.median(timings), 6),
+        'mean': round(statistics.fmean(timings), 6),
+        'max': round(max(timings), 6)
+    }
+    if isinstance(result, (pd.DataFrame, list)):
+        summary['rows'] = len(result)
+    elif isinstance(result, bytes):
+        summary['bytes'] = len(result)
+    return summary
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def cleanup(months: list):
+    """Entfernt alle Benchmark-Monate samt Import-Protokoll."""
+    from database import purge_months
+
+    purge_months(months)
+
+
+def run_benchmarks(sites: int = 9, years: int = 1, disponenten: int = 2, repeat: int = 5,
+                   start_year: int = 2091, seed: int = 42, keep_data: bool = False) -> dict:
+    """
+    Führt alle Benchmarks gegen die konfigurierte Datenbank aus.
+
+    Returns:
+        dict mit meta (Parameter, Versionen) und results je Operation
+    """
+    import database
+    from database import (
+        init_database, get_month_data, save_month_data, save_month_changes,
+        create_month, read_cache
+    )
+    from export import export_to_excel
+    from formatting import to_editor_frame
+    from kpi import apply_kpis, validate_data
+    from migrate import import_csv_directory
+    from reports import compare_weeks
+
+    months = benchmark_months(start_year, years)
+    sample_month = months[0]
+    fresh_month = f"{start_year + years}-01"
+    standorte = site_names(sites)
+    results = {}
+
+    init_database()
+    cleanup(months + [fresh_month])
+    try:
+        with tempfile.TemporaryDirectory() as csv_dir:
+            generate_dataset(csv_dir, sites, years, disponenten, start_year, seed)
+            print(f"📁 {len(months)} synthetische Monate, {sites} Standorte")
+            results['csv_import'] = measure(
+                lambda: import_csv_directory(csv_dir, force=True), max(1, repeat // 2)
+            )
+
+        results['create_month'] = measure(
+            lambda: create_month(fresh_month, standorte), repeat,
+            setup=lambda: cleanup([fresh_month])
+        )
+
+        results['get_month_data_cold'] = measure(
+            lambda: get_month_data(sample_month), repeat, setup=read_cache.invalidate
+        )
+        results['get_month_data_warm'] = measure(lambda: get_month_data(sample_month), repeat)
+
+        editor = apply_kpis(to_editor_frame(get_month_data(sample_month)), as_text=True)
+        variants = [editor, editor.assign(Stopps=editor['Stopps'] + '1')]
+        counter = iter(range(10 ** 9))
+        results['save_month_data'] = measure(
+            lambda: save_month_data(sample_month, variants[next(counter) % 2]), repeat
+        )
+        # Eine geänderte Zelle im Wechsel: Schreibmenge unabhängig von der Monatsgröße
+        cell = editor.copy()
+        cell.loc[cell.index[0], 'Stopps'] += '1'
+        edits = [(editor, cell), (cell, editor)]
+        results['save_month_changes'] = measure(
+            lambda: save_month_changes(sample_month, *edits[next(counter) % 2]), repeat
+        )
+
+        results['compare_weeks_cold'] = measure(
+            lambda: compare_weeks(sample_month), repeat, setup=read_cache.invalidate
+        )
+        results['validate_data'] = measure(lambda: validate_data(editor), repeat)
+        results['export_to_excel'] = measure(lambda: export_to_excel(editor, sample_month), repeat)
+    finally:
+        if not keep_data:
+            cleanup(months + [fresh_month])
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'params': {
+                'sites': sites, 'years': years, 'disponenten': disponenten,
+                'repeat': repeat, 'start_year': start_year, 'seed': seed,
+                'rows_per_month': len(editor)
+            },
+            'backend': database.get_backend_name(),
+            'pool': database.get_pool_stats()
+        },
+        'results': results
+    }
+
+
+def compare_results(current: dict, baseline: dict, threshold: float = 1.25) -> list:
+    """
+    Vergleicht Mediane mit einem früheren Lauf.
+
+    Returns:
+        Liste der Regressionen (Operation, Baseline, aktuell, Faktor)
+    """
+    regressions = []
+    backends = (baseline['meta'].get('backend', 'postgres'), current['meta'].get('backend'))
+    if backends[0] != backends[1]:
+        print(f"⚠️ Baseline mit {backends[0]}, aktueller Lauf mit {backends[1]}")
+    print(f"\n{'Operation':<24}{'Baseline':>12}{'Aktuell':>12}{'Faktor':>9}")
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            print(f"{name:<24}{'–':>12}{result['median']:>12.4f}{'neu':>9}")
+            continue
+        factor = result['median'] / base['median'] if base['median'] else float('inf')
+        flag = ' ⚠️' if factor > threshold else ''
+        print(f"{name:<24}{base['median']:>12.4f}{result['median']:>12.4f}{factor:>8.2f}x{flag}")
+        if factor > threshold:
+            regressions.append((name, base['median'], result['median'], round(factor, 2)))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks mit synthetischen KPI-Daten")
+    parser.add_argument('--database-url', default=os.environ.get('BENCHMARK_DATABASE_URL'),
+                        help="Datenbank für den Benchmark: postgresql://... oder sqlite:///pfad.db "
+                             "(Standard: BENCHMARK_DATABASE_URL)")
+    parser.add_argument('--sites', type=int, default=9, help="Anzahl Standorte")
+    parser.add_argument('--years', type=int, default=1, help="Anzahl Jahre")
+    parser.add_argument('--disponenten', type=int, default=2, help="Disponenten je Standort")
+    parser.add_argument('--start-year', type=int, default=2091, help="Erstes synthetisches Jahr")
+    parser.add_argument('--repeat', type=int, default=5, help="Wiederholungen je Operation")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Ergebnisse als JSON speichern")
+    parser.add_argument('--compare', help="Baseline-JSON für den Regressionsvergleich")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="Faktor, ab dem ein Median als Regression gilt")
+    parser.add_argument('--keep-data', action='store_true', help="Synthetische Daten nicht entfernen")
+    parser.add_argument('--generate-only', metavar='DIR', help="Nur CSV-Dateien erzeugen")
+    args = parser.parse_args()
+
+    if args.generate_only:
+        paths = generate_dataset(args.generate_only, args.sites, args.years,
+                                 args.disponenten, args.start_year, args.seed)
+        print(f"✅ {len(paths)} Dateien in {args.generate_only}")
+        sys.exit(0)
+
+    if not args.database_url:
+        parser.error("--database-url oder BENCHMARK_DATABASE_URL angeben")
+
+    import database
+    database.DATABASE_URL = args.database_url
+
+    report = run_benchmarks(args.sites, args.years, args.disponenten, args.repeat,
+                            args.start_year, args.seed, args.keep_data)
+
+    print(f"\n{'Operation':<24}{'Median (s)':>12}{'Min (s)':>12}")
+    for name, result in report['results'].items():
+        print(f"{name:<24}{result['median']:>12.4f}{result['min']:>12.4f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Ergebnisse: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} Regression(en) über {args.threshold}x")
+            sys.exit(1)
+        print("\n✅ Keine Regressionen")
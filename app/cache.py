@@ -0,0 +1,97 @@
+"""
+Prozessweiter LRU-Cache für Lesezugriffe auf die KPI-Datenbank
+
+Einträge tragen einen Versionsstempel (z.B. max(updated_at) und Zeilenzahl
+eines Monats). Nach Ablauf der TTL wird nur der Stempel neu geprüft; ist er
+unverändert, bleibt der Eintrag gültig, ohne die Daten erneut zu laden.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class VersionedLRUCache:
+    """Thread-sicherer LRU-Cache mit Versionsstempeln und Hit/Miss-Zählern."""
+
+    def __init__(self, max_entries: int = 24, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, value, checked_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, load_version=None):
+        """
+        Gibt den gecachten Wert zurück oder None.
+
+        Ist die TTL abgelaufen, wird load_version() aufgerufen und der Eintrag
+        nur verworfen, wenn sich der Versionsstempel geändert hat.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            version, value, checked_at = entry
+            fresh = time.monotonic() - checked_at < self.ttl
+            if fresh or load_version is None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        # Versionsprüfung außerhalb des Locks (DB-Roundtrip)
+        current_version = load_version()
+        with self._lock:
+            self.revalidations += 1
+            if current_version == version and key in self._entries:
+                self._entries[key] = (version, value, time.monotonic())
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version=None):
+        """Legt einen Wert ab und verdrängt ggf. den ältesten Eintrag."""
+        with self._lock:
+            self._entries[key] = (version, value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Entfernt einen Eintrag oder (ohne key) den gesamten Cache."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self.invalidations += 1
+
+    def invalidate_where(self, predicate):
+        """Entfernt alle Einträge, deren Schlüssel predicate(key) erfüllt."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Gibt die Cache-Zähler zurück."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Konformitäts-Suite für die Storage-Backends
+
+Prüft über die öffentliche Schnittstelle von database.py, dass sich ein
+Backend (PostgreSQL oder SQLite) fachlich gleich verhält: Schema-Migration,
+Werktage anlegen, typisierte Monats-Frames, Merge-Zähler beim Speichern,
+Rundung wie NUMERIC(10,2), Versionsstempel, Datumsbereiche, Aggregate
+(gegen eine pandas-Referenz), Import-Protokoll und Löschen.
+
+Die Testdaten liegen in einem weit entfernten Jahr (Standard: 2093) und
+werden am Ende entfernt. Bei Abweichungen endet das Script mit Exit-Code 1.
+
+Aufruf:
+    python conformance.py --database-url postgresql://...
+    python conformance.py --database-url sqlite:///tmp/kpi.db
+"""
+import argparse
+import os
+import sys
+import traceback
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Snapshot-Abgleich der echten Monate hier nicht anstoßen
+os.environ.setdefault('SNAPSHOT_ENABLED', '0')
+
+from formatting import to_editor_frame  # noqa: E402
+
+STANDORTE = ['Konformität Nord', 'Konformität Süd']
+
+
+class ConformanceError(AssertionError):
+    """Ein Backend weicht vom erwarteten Verhalten ab."""
+
+
+def expect(condition: bool, message: str):
+    if not condition:
+        raise ConformanceError(message)
+
+
+def expect_equal(actual, expected, what: str):
+    expect(actual == expected, f"{what}: erwartet {expected!r}, erhalten {actual!r}")
+
+
+def workdays(month: str) -> list:
+    start = pd.Timestamp(f"{month}-01")
+    return list(pd.bdate_range(start, start + pd.offsets.MonthEnd(0)))
+
+
+def fill_month(df: pd.DataFrame, seed: int) -> pd.DataFrame:
+    """Füllt einen Monats-Frame mit reproduzierbaren Werten (Editor-Eingaben als Text)."""
+    rng = np.random.default_rng(seed)
+    n = len(df)
+    filled = df.copy()
+    filled['Disponent'] = [f"Dispo {i % 3}" for i in range(n)]
+    filled['Fahrzeuge'] = rng.integers(5, 30, n).astype(str)
+    filled['Stopps'] = rng.integers(100, 900, n).astype(str)
+    filled['Unverplante Stopps'] = [f"{v:.3f}".replace('.', ',') for v in rng.uniform(0, 20, n)]
+    filled['Kosten Fuhrpark'] = [f"{v:.3f}".replace('.', ',') for v in rng.uniform(1000, 9000, n)]
+    return filled
+
+
+def check_schema(db, month):
+    db.init_database()
+    expect_equal(db.init_database(), [], "Zweite Migration")
+    standorte = db.get_standorte()
+    missing = set(db.DEFAULT_STANDORTE) - set(standorte)
+    expect(not missing, f"Standard-Standorte fehlen: {sorted(missing)}")
+
+
+def check_create_month(db, month):
+    expected = len(workdays(month)) * len(STANDORTE)
+    expect_equal(db.create_month(month, STANDORTE), expected, "create_month (neue Zeilen)")
+    expect_equal(db.create_month(month, STANDORTE), 0, "create_month (wiederholt)")
+    expect(month in db.get_months(), f"{month} fehlt in get_months()")
+
+
+def check_month_frame(db, month):
+    df = db.get_month_data(month)
+    expect_equal(len(df), len(workdays(month)) * len(STANDORTE), "Zeilen im Monat")
+    expect_equal({c: str(t) for c, t in df.dtypes.items()},
+                 {c: str(pd.Series(dtype=t).dtype) for c, t in db.MONTH_DTYPES.items()},
+                 "Spaltentypen")
+    ordered = df.sort_values(['Datum', 'Standort']).reset_index(drop=True)
+    expect(ordered['Datum'].equals(df['Datum']), "Sortierung nach Datum, Standort")
+    expect(df['Datum'].dt.dayofweek.max() < 5, "Nur Werktage")
+    expect(df['Fahrzeuge'].isna().all(), "Neue Zeilen sind leer")
+
+
+def check_save(db, month):
+    filled = fill_month(to_editor_frame(db.get_month_data(month)), seed=1)
+    version_before = db.get_month_version(month)
+
+    result = db.save_month_data(month, filled)
+    n = len(filled)
+    expect_equal({k: result[k] for k in ('inserted', 'updated', 'unchanged', 'deleted')},
+                 {'inserted': 0, 'updated': n, 'unchanged': 0, 'deleted': 0}, "Erstes Speichern")
+    version_after = db.get_month_version(month)
+    expect(version_after != version_before, "Versionsstempel nach Änderung unverändert")
+
+    result = db.save_month_data(month, filled)
+    expect_equal((result['updated'], result['unchanged']), (0, n), "Speichern ohne Änderung")
+    expect_equal(db.get_month_version(month), version_after, "Versionsstempel nach No-op")
+
+    # Eine Zeile entfernen, eine Wochenendzeile ergänzen, einen Wert ändern
+    saturday = next(d for d in pd.date_range(f"{month}-01", periods=7) if d.dayofweek == 5)
+    extra = filled.iloc[[0]].copy()
+    extra['Datum'] = saturday.strftime('%d.%m.%Y')
+    changed = pd.concat([filled.iloc[1:], extra], ignore_index=True)
+    changed.loc[0, 'Stopps'] = '1000'
+    result = db.save_month_data(month, changed)
+    expect_equal({k: result[k] for k in ('inserted', 'updated', 'unchanged', 'deleted', 'skipped')},
+                 {'inserted': 1, 'updated': 1, 'unchanged': n - 2, 'deleted': 1, 'skipped': 0},
+                 "Speichern mit Änderungen")
+
+    # Gespeicherte Werte: Ganzzahlen, 2 Nachkommastellen, abgeleitete KPIs
+    df = db.get_month_data(month)
+    expect_equal(len(df), n, "Zeilen nach Änderung")
+    row = df[(df['Datum'] == saturday) & (df['Standort'] == extra['Standort'].iloc[0])]
+    expect_equal(len(row), 1, "Ergänzte Zeile")
+    row = row.iloc[0]
+    source = extra.iloc[0]
+    expect_equal(int(row['Fahrzeuge']), int(source['Fahrzeuge']), "Fahrzeuge")
+    expect_equal(row['Kosten Fuhrpark'],
+                 round(float(source['Kosten Fuhrpark'].replace(',', '.')), 2), "Kosten (2 Stellen)")
+    derived = db.derive_kpi_values(*(pd.Series([float(source[c].replace(',', '.'))])
+                                      for c in ('Fahrzeuge', 'Stopps', 'Kosten Fuhrpark')))
+    expect_equal(row['Stoppschnitt'], derived['Stoppschnitt'].iloc[0], "Stoppschnitt")
+    expect_equal(row['Stoppkosten'], derived['Stoppkosten'].iloc[0], "Stoppkosten")
+    expect_equal(row['Disponent'], source['Disponent'], "Disponent")
+
+
+def check_delta_save(db, month):
+    loaded = to_editor_frame(db.get_month_data(month))
+    version = db.get_month_version(month)
+    result = db.save_month_changes(month, loaded, loaded.copy())
+    expect(not result['changed'], "Delta ohne Änderung meldet Änderungen")
+    expect_equal(db.get_month_version(month), version, "Versionsstempel nach Delta-No-op")
+
+    # Einen Wert ändern, eine Zeile entfernen, eine Zeile ergänzen – und zurück
+    edited = loaded.copy()
+    edited.loc[1, 'Stopps'] = '777'
+    sunday = next(d for d in pd.date_range(f"{month}-01", periods=7) if d.dayofweek == 6)
+    extra = edited.iloc[[2]].assign(Datum=sunday.strftime('%d.%m.%Y'))
+    edited = pd.concat([edited.drop(index=2), extra], ignore_index=True)
+    result = db.save_month_changes(month, loaded, edited)
+    expect_equal({k: result[k] for k in ('inserted', 'updated', 'deleted', 'unchanged')},
+                 {'inserted': 1, 'updated': 1, 'deleted': 1, 'unchanged': len(loaded) - 2},
+                 "Delta mit Änderungen")
+    result = db.save_month_changes(month, edited, loaded)
+    expect_equal((result['inserted'], result['updated'], result['deleted']), (1, 1, 1), "Delta zurück")
+    expect(to_editor_frame(db.get_month_data(month)).equals(loaded), "Monat nach Delta-Rücknahme")
+
+
+def check_range(db, month):
+    # Die erste Zeile von STANDORTE[0] hat check_save entfernt
+    days = workdays(month)
+    df = db.get_range_data(days[0].date(), days[4].date(), [STANDORTE[1]], ['Stopps'])
+    expect_equal(list(df.columns), ['Datum', 'Standort', 'Stopps'], "Spalten get_range_data")
+    expect_equal(len(df), 5, "Zeilen get_range_data")
+    expect(set(df['Standort']) == {STANDORTE[1]}, "Standort-Filter get_range_data")
+    expect_equal(str(df['Stopps'].dtype), 'float64', "Typ get_range_data")
+
+
+def check_aggregates(db, month):
+    rows = db.get_month_data(month)
+    for col in db.NUMERIC_COLUMNS:
+        rows[col] = rows[col].astype('float64')
+    funcs = {display: func.lower().replace('avg', 'mean') for _, display, func in db.KPI_AGGREGATES}
+
+    daily = db.get_daily_aggregates(month)
+    reference = rows.groupby('Datum').agg(funcs)
+    expect_equal(len(daily), len(reference), "Tage in get_daily_aggregates")
+    for display in funcs:
+        expect(np.allclose(daily[display], reference[display].to_numpy(), equal_nan=True),
+               f"Tageswert {display}")
+    expected_weeks = 'KW ' + reference.index.isocalendar().week.astype(str)
+    expect_equal(list(daily['Woche']), list(expected_weeks), "KW-Bezeichnung")
+    delta = reference['Stopps'].diff()
+    expect(np.allclose(daily['Stopps_Delta'], delta.to_numpy(), equal_nan=True), "Delta zum Vortag")
+    pct = (((reference['Stopps'] / reference['Stopps'].shift()) - 1) * 100).round(1)
+    expect(np.allclose(daily['Stopps_Delta%'], pct.to_numpy(), equal_nan=True, atol=0.051),
+           "Delta% zum Vortag")
+
+    weekly = db.get_weekly_aggregates(month)
+    week_start = reference.index - pd.to_timedelta(reference.index.dayofweek, unit='D')
+    reference_weeks = reference.groupby(week_start).mean()
+    expect_equal(list(weekly['Wochenstart']), list(reference_weeks.index), "Wochenstart")
+    for display in funcs:
+        expect(np.allclose(weekly[display], reference_weeks[display].to_numpy(), equal_nan=True),
+               f"Wochenwert {display}")
+
+    monthly = db.get_monthly_aggregates([month])
+    expect_equal(list(monthly['Monat']), [month], "Monate in get_monthly_aggregates")
+    for display, func in funcs.items():
+        expect(np.isclose(monthly[display].iloc[0], rows[display].agg(func)), f"Monatswert {display}")
+
+
+def check_import(db, month):
+    staged, skipped = db.build_staging_frame(fill_month(to_editor_frame(db.get_month_data(month)), seed=2))
+    content_hash = f"conformance-{month}"
+    result = db.import_staged_month(staged, month, content_hash, f"{month}.csv", skipped, force=True)
+    expect_equal(result['inserted'], 0, "Import: neue Zeilen")
+    expect_equal(result['updated'] + result['unchanged'], len(staged), "Import: Zeilen")
+    result = db.import_staged_month(staged, month, content_hash, f"{month}.csv", skipped)
+    expect_equal(result, {'already_imported': True}, "Import mit bekanntem Hash")
+
+
+def check_delete(db, month):
+    expect_equal(db.delete_month(month), False, "delete_month mit Daten")
+    empty = f"{month[:4]}-12"
+    db.create_month(empty, STANDORTE)
+    expect_equal(db.delete_month(empty), True, "delete_month ohne Daten")
+    expect(empty not in db.get_months(), f"{empty} nach dem Löschen noch vorhanden")
+
+
+CHECKS = [
+    ('Schema', check_schema),
+    ('Monat anlegen', check_create_month),
+    ('Monats-Frame', check_month_frame),
+    ('Speichern', check_save),
+    ('Delta-Speichern', check_delta_save),
+    ('Datumsbereich', check_range),
+    ('Aggregate', check_aggregates),
+    ('Import-Protokoll', check_import),
+    ('Löschen', check_delete),
+]
+
+
+def run_conformance(year: int = 2093) -> list:
+    """
+    Führt alle Prüfungen gegen das konfigurierte Backend aus.
+
+    Returns:
+        Liste der fehlgeschlagenen Prüfungen (Name, Meldung)
+    """
+    import database as db
+
+    month = f"{year}-02"
+    months = [month, f"{year}-12"]
+    print(f"=== Konformität: {db.get_backend_name()} ===")
+
+    failures = []
+    db.init_database()
+    db.purge_months(months)
+    try:
+        for name, check in CHECKS:
+            try:
+                check(db, month)
+                print(f"✓ {name}")
+            except ConformanceError as e:
+                failures.append((name, str(e)))
+                print(f"❌ {name}: {e}")
+            except Exception as e:
+                failures.append((name, repr(e)))
+                print(f"❌ {name}: {e}")
+                traceback.print_exc()
+    finally:
+        db.purge_months(months)
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Konformitäts-Suite für die Storage-Backends")
+    parser.add_argument('--database-url', default=os.environ.get('BENCHMARK_DATABASE_URL'),
+                        help="postgresql://... oder sqlite:///pfad.db (Standard: BENCHMARK_DATABASE_URL)")
+    parser.add_argument('--year', type=int, default=2093, help="Jahr der Testdaten")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("--database-url oder BENCHMARK_DATABASE_URL angeben")
+
+    import database
+    database.DATABASE_URL = args.database_url
+
+    failures = run_conformance(args.year)
+    if failures:
+        print(f"\n❌ {len(failures)} Prüfung(en) fehlgeschlagen")
+        sys.exit(1)
+    print("\n✅ Alle Prüfungen bestanden")
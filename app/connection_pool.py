@@ -0,0 +1,189 @@
+"""
+Thread-sicherer Connection Pool für parallele Streamlit-Sessions
+
+Streamlit bedient jede Session in einem eigenen Thread. Der Pool verteilt
+Verbindungen unter einem Lock, lässt Anfragen bei voller Auslastung bis zu
+einem Timeout warten (statt sofort zu scheitern), prüft länger ungenutzte
+Verbindungen vor der Ausgabe und ersetzt tote Verbindungen automatisch.
+"""
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class PoolTimeout(Exception):
+    """Innerhalb des Timeouts wurde keine Verbindung frei."""
+
+
+class KPIConnectionPool:
+    """Connection Pool mit Warteschlange, Health-Checks und Zählern."""
+
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 10,
+                 timeout: float = 10.0, health_check_after: float = 30.0,
+                 connect_timeout: int = None, cursor_factory=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Ungültige Pool-Größe: min={minconn}, max={maxconn}")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self.connect_timeout = connect_timeout
+        self.cursor_factory = cursor_factory
+
+        self._idle = deque()  # (conn, zuletzt zurückgegeben)
+        self._in_use = set()
+        self._size = 0  # offene + gerade im Aufbau befindliche Verbindungen
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        self._counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'errors': 0,
+            'reconnects': 0,
+            'health_checks': 0
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._size += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        options = {}
+        if self.connect_timeout:
+            options['connect_timeout'] = self.connect_timeout
+        if self.cursor_factory:
+            options['cursor_factory'] = self.cursor_factory
+        return psycopg2.connect(self.dsn, **options)
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        """Prüft eine Verbindung; länger ungenutzte per SELECT 1."""
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        with self._cond:
+            self._counters['health_checks'] += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout: float = None):
+        """
+        Holt eine Verbindung. Ist der Pool ausgeschöpft, wird bis zu timeout
+        Sekunden gewartet, danach PoolTimeout ausgelöst.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    conn, idle_since = None, None
+                    self._size += 1  # Platz reservieren, Aufbau außerhalb des Locks
+                    break
+                remaining = timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"Keine freie Datenbankverbindung nach {timeout:.1f}s "
+                        f"(max. {self.maxconn} Verbindungen)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_time = time.monotonic() - started
+            self._counters['checkouts'] += 1
+            if waited:
+                self._counters['waits'] += 1
+                self._counters['wait_time_total'] += wait_time
+                self._counters['wait_time_max'] = max(self._counters['wait_time_max'], wait_time)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                with self._cond:
+                    self._counters['reconnects'] += 1
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._counters['errors'] += 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._in_use.add(id(conn))
+        return conn
+
+    def putconn(self, conn, close: bool = False):
+        """Gibt eine Verbindung zurück; defekte Verbindungen werden verworfen."""
+        if not close and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._cond:
+            self._in_use.discard(id(conn))
+            if close or conn.closed or self._closed:
+                if conn.closed and not close:
+                    self._counters['errors'] += 1  # Verbindung während der Nutzung abgebrochen
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def closeall(self):
+        """Schließt alle freien Verbindungen und den Pool."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._discard(conn)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Aktuelle Auslastung und kumulierte Zähler."""
+        with self._cond:
+            stats = dict(self._counters)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'min': self.minconn,
+                'max': self.maxconn
+            })
+        stats['wait_time_total'] = round(stats['wait_time_total'], 4)
+        stats['wait_time_max'] = round(stats['wait_time_max'], 4)
+        return stats
@@ -1,240 +1,594 @@
 """
-PostgreSQL Database Handler für KPI Dashboard mit Supabase
+Datenzugriff für das KPI Dashboard
+
+Öffentliche Schnittstelle für App und Scripts. Die Speicherung übernimmt ein
+austauschbares Backend (backends/): PostgreSQL (z.B. Supabase) oder eine
+eingebettete SQLite-Datei. Lese-Cache, Snapshot abgeschlossener Monate,
+Offline-Betrieb und die Aufbereitung der Frames sind backend-unabhängig.
+Öffentliche Aufrufe werden mit Abfragen und Pool-Wartezeit in metrics.py gemessen.
 """
-import psycopg2
-from psycopg2 import pool, extras
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
+import threading
+import time
+import psycopg2
 import streamlit as st
 
+import metrics
+import snapshot
+from backends import (
+    create_backend, resolve_backend, KPI_COLUMN_MAP, NUMERIC_DB_COLUMNS,
+    STAGING_COLUMNS, KPI_AGGREGATES, DEFAULT_STANDORTE
+)
+from cache import VersionedLRUCache
+from connection_pool import PoolTimeout
+from kpi import INPUT_COLUMNS, NUMERIC_COLUMNS, parse_numeric_series, derive_kpi_values
+
 # Supabase Connection String (Streamlit Secrets oder ENV Variable)
 try:
     DATABASE_URL = st.secrets.get('DATABASE_URL', '')
 except:
     DATABASE_URL = os.environ.get('DATABASE_URL', '')
 
+# Eingebettete Datenbank (SQLite-Datei), wenn keine DATABASE_URL gesetzt ist
+DATABASE_PATH = os.environ.get('DATABASE_PATH', '')
+# Explizite Backend-Wahl: postgres | sqlite (sonst aus URL bzw. Pfad abgeleitet)
+KPI_BACKEND = os.environ.get('KPI_BACKEND', '')
+
 # Debug: Zeige welche URL geladen wurde
 if DATABASE_URL:
     # Verstecke Passwort für Logs
-    safe_url = DATABASE_URL.split('@')[0].split(':')[0] + ':***@' + DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else 'URL malformed'
+    safe_url = DATABASE_URL.split('@')[0].split(':')[0] + ':***@' + DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else DATABASE_URL.split('?')[0]
     print(f"🔗 DATABASE_URL loaded: {safe_url}")
+elif DATABASE_PATH:
+    print(f"🗄️ SQLite-Datenbank: {DATABASE_PATH}")
 else:
     print("❌ DATABASE_URL is empty!")
 
-# Connection Pool für bessere Performance
-connection_pool = None
-
-def get_connection_pool():
-    """Erstellt oder gibt den Connection Pool zurück."""
-    global connection_pool
-    if connection_pool is None:
-        if not DATABASE_URL:
-            raise ValueError("DATABASE_URL is not set! Check Streamlit Secrets or environment variables.")
-        connection_pool = psycopg2.pool.SimpleConnectionPool(
-            1, 10,  # Min/Max Connections
-            DATABASE_URL
-        )
-    return connection_pool
+# Fehler, bei denen die Datenbank als nicht erreichbar gilt (Lesen dann aus dem Snapshot)
+DB_UNAVAILABLE_ERRORS = (psycopg2.OperationalError, PoolTimeout)
+# Nach einem Verbindungsfehler wird die Datenbank so lange (Sekunden) nicht
+# erneut angefragt; danach prüft ein Hintergrund-Thread, ob sie wieder da ist
+DB_RETRY_INTERVAL = float(os.environ.get('DB_RETRY_INTERVAL', '30'))
+_db_available = True
+_db_retry_at = 0.0
+_probe_lock = threading.Lock()
+
+backend = None
+_backend_lock = threading.Lock()
+
+# Lese-Cache für get_months / get_month_data (prozessweit, von allen Sessions geteilt)
+read_cache = VersionedLRUCache(
+    max_entries=int(os.environ.get('KPI_CACHE_SIZE', '24')),
+    ttl=float(os.environ.get('KPI_CACHE_TTL', '60'))
+)
+MONTHS_CACHE_KEY = ('months',)
+
+# Cache- und Verbindungszähler zusätzlich als Gauges im Metrik-Export
+metrics.register_gauges('cache', lambda: read_cache.stats())
+metrics.register_gauges('pool', lambda: backend.stats() if backend is not None else {})
+
+def get_backend():
+    """Erstellt oder gibt das konfigurierte Storage-Backend zurück."""
+    global backend
+    if backend is None:
+        with _backend_lock:
+            if backend is None:
+                backend = create_backend(DATABASE_URL, DATABASE_PATH, KPI_BACKEND or None)
+    return backend
+
+def get_backend_name() -> str:
+    """'postgres' oder 'sqlite' (ohne das Backend zu öffnen)."""
+    if backend is not None:
+        return backend.name
+    return resolve_backend(DATABASE_URL, DATABASE_PATH, KPI_BACKEND or None)[0]
 
 def get_connection():
-    """Holt eine Connection aus dem Pool."""
-    pool = get_connection_pool()
-    return pool.getconn()
+    """Holt eine Connection des Backends (PostgreSQL: aus dem Pool, wartet bis DB_POOL_TIMEOUT)."""
+    return get_backend().get_connection()
 
 def return_connection(conn):
     """Gibt eine Connection zurück in den Pool."""
-    pool = get_connection_pool()
-    pool.putconn(conn)
+    get_backend().return_connection(conn)
+
+def is_database_available() -> bool:
+    """False, solange der letzte Zugriff die Datenbank nicht erreicht hat."""
+    return _db_available
+
+def _set_database_available(available: bool):
+    global _db_available, _db_retry_at
+    if not available:
+        _db_retry_at = time.monotonic() + DB_RETRY_INTERVAL
+    _db_available = available
 
+def _offline() -> bool:
+    """
+    True, solange die Datenbank als nicht erreichbar gilt.
+    
+    Lesepfade gehen dann ohne Verbindungsversuch (und ohne connect_timeout)
+    direkt an Cache und Snapshot. Nach DB_RETRY_INTERVAL startet genau eine
+    Hintergrundprüfung; nur sie hebt den Offline-Zustand wieder auf.
+    """
+    if _db_available:
+        return False
+    if time.monotonic() >= _db_retry_at:
+        _probe_in_background()
+    return True
+
+def _offline_error():
+    """Fehler für Zugriffe im Offline-Betrieb (wird wie ein Verbindungsfehler behandelt)."""
+    return psycopg2.OperationalError("Datenbank nicht erreichbar (Offline-Betrieb)")
+
+def _probe_in_background():
+    """Prüft im Hintergrund, ob die Datenbank wieder erreichbar ist (höchstens ein Thread)."""
+    if not _probe_lock.acquire(blocking=False):
+        return
+    
+    def run():
+        try:
+            _ensure_schema()
+            get_backend().months_version()
+        except Exception as e:
+            print(f"⚠️ Datenbank weiterhin nicht erreichbar: {e}")
+            _set_database_available(False)
+        else:
+            invalidate_month_cache()
+            _set_database_available(True)
+        finally:
+            _probe_lock.release()
+    
+    threading.Thread(target=run, name='db-probe', daemon=True).start()
+
+def get_pool_stats() -> dict:
+    """Gibt Auslastung und Zähler (Wartezeiten, Checkouts, Fehler) der Verbindungen zurück."""
+    return get_backend().stats()
+
+@metrics.instrument()
 def init_database():
-    """Initialisiert die Datenbank mit allen Tabellen."""
-    conn = get_connection()
+    """
+    Initialisiert bzw. aktualisiert das Datenbankschema.
+    
+    Die DDL liegt als versionierte Migrationen beim Backend (PostgreSQL:
+    migrations.py) und wird nur ausgeführt, wenn sie noch aussteht.
+    """
+    return get_backend().init_schema()
+
+_schema_current = False
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    """
+    Stellt einmal pro Prozess sicher, dass das Schema aktuell ist.
+    
+    Im Offline-Betrieb wird die Datenbank nicht angefragt; die Prüfung holt
+    die Hintergrundprüfung nach, sobald die Datenbank wieder erreichbar ist.
+    """
+    if _schema_current:
+        return
+    if _offline():
+        raise _offline_error()
     try:
-        cursor = conn.cursor()
-        
-        # KPI-Daten Tabelle
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS kpi_data (
-                id SERIAL PRIMARY KEY,
-                datum DATE NOT NULL,
-                monat VARCHAR(7) NOT NULL,
-                standort VARCHAR(100) NOT NULL,
-                disponent VARCHAR(100),
-                fahrzeuge INTEGER,
-                stopps INTEGER,
-                unverplante_stopps NUMERIC(10,2),
-                kosten_fuhrpark NUMERIC(10,2),
-                stoppschnitt NUMERIC(10,2),
-                stoppkosten NUMERIC(10,2),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(datum, standort)
-            )
-        ''')
-        
-        # Standorte Tabelle
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS standorte (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) UNIQUE NOT NULL,
-                aktiv BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Disponenten Tabelle
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS disponenten (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) UNIQUE NOT NULL,
-                standort_id INTEGER REFERENCES standorte(id),
-                aktiv BOOLEAN DEFAULT TRUE
-            )
-        ''')
-        
-        # User Tabelle für Login
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                role VARCHAR(20) DEFAULT 'user',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # History/Audit Log
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS audit_log (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER,
-                action VARCHAR(50) NOT NULL,
-                table_name VARCHAR(50),
-                record_id INTEGER,
-                old_values TEXT,
-                new_values TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Indizes für schnellere Abfragen
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kpi_datum ON kpi_data(datum)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kpi_monat ON kpi_data(monat)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_kpi_standort ON kpi_data(standort)')
-        
-        conn.commit()
-        
-    except Exception as e:
-        conn.rollback()
-        print(f"Fehler bei Datenbank-Initialisierung: {e}")
+        _ensure_schema()
+    except DB_UNAVAILABLE_ERRORS:
+        _set_database_available(False)
         raise
-    finally:
-        return_connection(conn)
 
+def _ensure_schema():
+    global _schema_current
+    with _schema_lock:
+        if not _schema_current:
+            init_database()
+            _schema_current = True
+
+def get_months_version():
+    """Versionsstempel über alle Monate (im Offline-Betrieb: Fehler ohne Verbindungsversuch)."""
+    if _offline():
+        raise _offline_error()
+    return get_backend().months_version()
+
+def get_month_version(month: str):
+    """Versionsstempel eines Monats: (max(updated_at), Zeilenzahl)."""
+    if _offline():
+        raise _offline_error()
+    return get_backend().month_version(month)
+
+@metrics.instrument()
+def get_closed_month_versions(before: str) -> dict:
+    """Versionsstempel aller Monate vor before in einer Abfrage (für den Snapshot-Abgleich)."""
+    return get_backend().month_versions(before)
+
+def _cached_month_version(month: str):
+    """Versionsstempel für den Lese-Cache: bei abgeschlossenen Monaten aus dem Snapshot (ohne DB)."""
+    version = snapshot.month_version(month) if snapshot.is_closed(month) else None
+    return version if version is not None else get_month_version(month)
+
+def invalidate_month_cache(month: str = None):
+    """Verwirft gecachte Daten eines Monats (oder aller Monate) und die Monatsliste."""
+    if month is None:
+        read_cache.invalidate()
+    else:
+        # Monatsbezogene Einträge (Daten, Tages-/Wochenaggregate) und alle
+        # monatsübergreifenden Einträge (Monatsliste, Monatsaggregate)
+        read_cache.invalidate_where(
+            lambda key: key[0] in ('months', 'monthly', 'range') or key[1:] == (month,)
+        )
+        # Snapshot verwerfen; der nächste Abgleich schreibt ihn neu
+        snapshot.drop_month(month)
+
+def _cached_read(key, load_version, load_value):
+    """Liest über den Versions-Cache; lädt und cacht bei einem Miss."""
+    value = read_cache.get(key, load_version)
+    if value is None:
+        version = load_version()
+        value = load_value()
+        read_cache.put(key, value, version)
+    return value.copy()
+
+def get_cache_stats() -> dict:
+    """Gibt Hit/Miss-Zähler des Lese-Caches zurück."""
+    return read_cache.stats()
+
+@metrics.instrument()
 def get_months():
-    """Gibt alle verfügbaren Monate zurück."""
-    conn = get_connection()
+    """
+    Gibt alle verfügbaren Monate zurück (gecacht).
+    
+    Ist die Datenbank nicht erreichbar, werden die Monate des lokalen
+    Snapshots geliefert (nur lesend).
+    """
+    if _offline():
+        return _offline_months(_offline_error())
     try:
-        cursor = conn.cursor()
-        cursor.execute('SELECT DISTINCT monat FROM kpi_data ORDER BY monat')
-        months = [row[0] for row in cursor.fetchall()]
-        return months
-    finally:
-        return_connection(conn)
+        months = read_cache.get(MONTHS_CACHE_KEY, get_months_version)
+        if months is not None:
+            return list(months)
+        
+        months, version = get_backend().list_months()
+    except DB_UNAVAILABLE_ERRORS as e:
+        _set_database_available(False)
+        return _offline_months(e)
+    
+    _set_database_available(True)
+    read_cache.put(MONTHS_CACHE_KEY, tuple(months), version)
+    # Snapshots abgeschlossener Monate gelegentlich im Hintergrund abgleichen
+    snapshot.sync_in_background(load_month_rows)
+    return months
+
+def _offline_months(error: Exception) -> list:
+    """Monate des Snapshots; ohne Snapshot wird der Verbindungsfehler weitergereicht."""
+    offline_months = snapshot.months()
+    if not offline_months:
+        raise error
+    return offline_months
 
+@metrics.instrument()
+def load_month_rows(month: str) -> pd.DataFrame:
+    """Lädt die Rohdaten eines Monats (DB-Spaltennamen) aus der Datenbank."""
+    rows, _ = _load_month_rows(month)
+    return rows
+
+def _load_month_rows(month: str):
+    """Rohdaten und Versionsstempel eines Monats aus einer Verbindung."""
+    return get_backend().load_month(month)
+
+# Typen der Monats-Frames: Ganzzahlen nullable, Beträge/Quoten float64,
+# Texte mit wenigen Ausprägungen als category
+MONTH_DTYPES = {
+    'Datum': 'datetime64[ns]',
+    'Standort': 'category',
+    'Disponent': 'category',
+    'Fahrzeuge': 'Int64',
+    'Stopps': 'Int64',
+    'Unverplante Stopps': 'float64',
+    'Kosten Fuhrpark': 'float64',
+    'Stoppschnitt': 'float64',
+    'Stoppkosten': 'float64'
+}
+
+def month_frame(rows: pd.DataFrame) -> pd.DataFrame:
+    """Bringt die Rohdaten eines Monats (DB-Spalten) in die typisierte Form."""
+    df = pd.DataFrame({
+        'Datum': pd.to_datetime(rows['datum']),
+        **{display: rows[db_col] for display, db_col in KPI_COLUMN_MAP.items()}
+    })
+    # Decimal/None -> float, danach Int64 bzw. float64 (NULL bleibt <NA>/NaN)
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df.astype(MONTH_DTYPES).reset_index(drop=True)
+
+@metrics.instrument()
 def get_month_data(month: str) -> pd.DataFrame:
-    """Lädt alle Daten für einen Monat."""
-    conn = get_connection()
+    """
+    Lädt alle Daten für einen Monat als typisierten Frame (siehe MONTH_DTYPES).
+    
+    Formatierung für die Anzeige übernimmt formatting.py.
+    
+    Reihenfolge: Lese-Cache (über max(updated_at) und Zeilenzahl validiert),
+    lokaler Snapshot (abgeschlossene Monate), Datenbank. Aufrufer erhalten
+    immer eine Kopie. Im Offline-Betrieb liefern Cache (ohne Versionsprüfung)
+    und Snapshot den letzten bekannten Stand, ohne Verbindungsversuch.
+    """
+    key = ('month', month)
+    if _offline():
+        df = read_cache.get(key)
+        if df is None:
+            cached = snapshot.read_month(month)
+            if cached is None:
+                raise _offline_error()
+            df = month_frame(cached[0])
+            read_cache.put(key, df, cached[1])
+        return df.copy()
+    
+    df = read_cache.get(key, lambda: _cached_month_version(month))
+    if df is not None:
+        return df.copy()
+    
+    cached = snapshot.read_month(month) if snapshot.is_closed(month) else None
+    if cached is not None:
+        rows, version = cached
+    else:
+        try:
+            rows, version = _load_month_rows(month)
+        except DB_UNAVAILABLE_ERRORS:
+            _set_database_available(False)
+            raise
+    
+    df = month_frame(rows)
+    read_cache.put(key, df, version)
+    return df.copy()
+
+@metrics.instrument()
+def get_range_data(start, end, standorte: list = None, columns: list = None) -> pd.DataFrame:
+    """
+    Lädt KPI-Daten für einen Datumsbereich (inklusive) in einer Abfrage.
+    
+    Args:
+        start, end: Datum (date oder 'YYYY-MM-DD')
+        standorte: optionale Liste von Standorten (Filter in SQL)
+        columns: optionale Liste von KPI-Spalten (Anzeigenamen), nur diese
+                 werden selektiert; Datum und Standort sind immer enthalten
+    
+    Returns:
+        DataFrame mit Datum (datetime), Standort und den KPI-Spalten als float
+    """
+    if columns is None:
+        columns = list(KPI_COLUMN_MAP)
+    unknown = [c for c in columns if c not in KPI_COLUMN_MAP]
+    if unknown:
+        raise ValueError(f"Unbekannte Spalten: {unknown}")
+    
+    db_columns = ['datum', 'standort'] + [
+        KPI_COLUMN_MAP[c] for c in columns if c != 'Standort'
+    ]
+    display_names = {db: display for display, db in KPI_COLUMN_MAP.items()}
+    display_names['datum'] = 'Datum'
+    
+    def load():
+        df = get_backend().load_range(start, end, standorte, db_columns)
+        df['datum'] = pd.to_datetime(df['datum'])
+        numeric = [c for c in db_columns if c in NUMERIC_DB_COLUMNS]
+        df[numeric] = df[numeric].astype('float64')
+        return df.rename(columns=display_names)
+    
+    key = ('range', str(start), str(end),
+           tuple(sorted(standorte)) if standorte else None, tuple(columns))
+    return _cached_read(key, get_months_version, load)
+
+# --- Aggregationen (SQL-Pushdown für Wochen-/Monatsvergleich) ---
+
+def _rename_aggregates(df: pd.DataFrame) -> pd.DataFrame:
+    """Benennt Aggregat-Spalten in Anzeigenamen um (inkl. _Delta / _Delta%)."""
+    mapping = {}
+    for col, display, _ in KPI_AGGREGATES:
+        mapping[col] = display
+        mapping[f'{col}_delta'] = f'{display}_Delta'
+        mapping[f'{col}_delta_pct'] = f'{display}_Delta%'
+    return df.rename(columns=mapping)
+
+def _aggregate_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Typisiert einen Aggregat-Frame des Backends und benennt die Spalten um."""
+    label_columns = [c for c in ('Datum', 'Wochenstart') if c in df.columns]
+    for col in label_columns:
+        df[col] = pd.to_datetime(df[col])
+    value_columns = [c for c in df.columns if c not in label_columns + ['Woche', 'Monat']]
+    df[value_columns] = df[value_columns].astype('float64')
+    return _rename_aggregates(df)
+
+@metrics.instrument()
+def get_daily_aggregates(month: str) -> pd.DataFrame:
+    """Tagessummen bzw. -mittel eines Monats inkl. Veränderung zum Vortag."""
+    return _cached_read(
+        ('daily', month),
+        lambda: get_month_version(month),
+        lambda: _aggregate_frame(get_backend().daily_aggregates(month))
+    )
+
+@metrics.instrument()
+def get_weekly_aggregates(month: str) -> pd.DataFrame:
+    """
+    Wochendurchschnitte (ISO-KW) der Tageswerte eines Monats inkl. Deltas
+    zur Vorwoche; entspricht dem früheren pandas-Wochenvergleich.
+    """
+    return _cached_read(
+        ('weekly', month),
+        lambda: get_month_version(month),
+        lambda: _aggregate_frame(get_backend().weekly_aggregates(month))
+    )
+
+@metrics.instrument()
+def get_monthly_aggregates(months: list = None) -> pd.DataFrame:
+    """
+    Monatswerte (Summen bzw. Mittel über alle Zeilen) inkl. Deltas zum
+    vorherigen Monat der Auswahl. Ohne months werden alle Monate geliefert.
+    """
+    key_months = tuple(sorted(set(months))) if months else None
+    return _cached_read(
+        ('monthly', key_months),
+        get_months_version,
+        lambda: _aggregate_frame(get_backend().monthly_aggregates(list(key_months) if key_months else None))
+    )
+
+def _text_column(df: pd.DataFrame, column: str) -> pd.Series:
+    """Textspalte ohne Leerraum; leere Werte werden None."""
+    values = df.get(column, pd.Series(None, index=df.index, dtype=object)).astype(object)
+    values = values.where(values.notna(), '').astype(str).str.strip()
+    return values.replace({'': None, 'nan': None, 'None': None})
+
+def staging_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """Schlüssel (datum, standort) eines Editor-/CSV- oder typisierten Frames."""
+    keys = pd.DataFrame(index=df.index)
+    datum = df.get('Datum', pd.Series('', index=df.index))
+    if pd.api.types.is_datetime64_any_dtype(datum):
+        keys['datum'] = datum.dt.date  # typisierter Frame aus get_month_data
+    else:
+        datum_str = datum.astype(str).str.strip()
+        keys['datum'] = pd.to_datetime(datum_str, format='%d.%m.%Y', errors='coerce').dt.date
+    keys['standort'] = _text_column(df, 'Standort')
+    return keys
+
+def build_staging_frame(df: pd.DataFrame):
+    """
+    Bereitet einen Editor-/CSV-DataFrame spaltenweise für den Bulk-Import vor.
+    
+    Gibt (staged_df, skipped) zurück. Zeilen ohne gültiges Datum oder Standort
+    sowie doppelte (datum, standort)-Schlüssel werden übersprungen.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=STAGING_COLUMNS), 0
+    
+    staged = staging_keys(df)
+    staged['disponent'] = _text_column(df, 'Disponent')
+    
+    for display_col, db_col in KPI_COLUMN_MAP.items():
+        if db_col in NUMERIC_DB_COLUMNS:
+            staged[db_col] = parse_numeric_series(
+                df.get(display_col, pd.Series(None, index=df.index, dtype=object))
+            )
+    
+    # Abgeleitete KPIs immer neu berechnen (identisch zur Eingabemaske)
+    derived = derive_kpi_values(staged['fahrzeuge'], staged['stopps'], staged['kosten_fuhrpark'])
+    staged['stoppschnitt'] = derived['Stoppschnitt']
+    staged['stoppkosten'] = derived['Stoppkosten']
+    
+    valid = staged['datum'].notna() & staged['standort'].notna()
+    staged = staged[valid].drop_duplicates(subset=['datum', 'standort'], keep='last')
+    skipped = len(df) - len(staged)
+    return staged[STAGING_COLUMNS].reset_index(drop=True), skipped
+
+@metrics.instrument()
+def save_month_data(month: str, df: pd.DataFrame) -> dict:
+    """
+    Speichert Daten für einen Monat per Bulk-Write.
+    
+    Der Frame wird einmal spaltenweise aufbereitet und vom Backend in einer
+    Transaktion über eine Staging-Tabelle gemerged. Zeilen, die im Frame
+    fehlen, werden für den Monat entfernt.
+    
+    Returns:
+        dict mit den Zählern inserted, updated, unchanged, deleted, skipped
+    """
+    staged, skipped = build_staging_frame(df)
     try:
-        query = '''
-            SELECT 
-                datum, standort, disponent, fahrzeuge, stopps,
-                unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten
-            FROM kpi_data 
-            WHERE monat = %s
-            ORDER BY datum, standort
-        '''
-        df = pd.read_sql_query(query, conn, params=(month,))
-        
-        # Formatiere Datum für Anzeige
-        if not df.empty:
-            df['Datum'] = pd.to_datetime(df['datum']).dt.strftime('%d.%m.%Y')
-            df = df.rename(columns={
-                'standort': 'Standort',
-                'disponent': 'Disponent',
-                'fahrzeuge': 'Fahrzeuge',
-                'stopps': 'Stopps',
-                'unverplante_stopps': 'Unverplante Stopps',
-                'kosten_fuhrpark': 'Kosten Fuhrpark',
-                'stoppschnitt': 'Stoppschnitt',
-                'stoppkosten': 'Stoppkosten'
-            })
-            # Datum als erste Spalte, entferne die alte 'datum' Spalte
-            df = df[['Datum', 'Standort', 'Disponent', 'Fahrzeuge', 'Stopps', 
-                     'Unverplante Stopps', 'Kosten Fuhrpark', 'Stoppschnitt', 'Stoppkosten']]
-        
-        return df
+        result = get_backend().merge_month(staged, month, prune=True)
     finally:
-        return_connection(conn)
+        invalidate_month_cache(month)
+    
+    result['skipped'] = skipped
+    return result
+
+# Editor-Spalten, aus denen eine Zeile gespeichert wird (abgeleitete KPIs nicht)
+EDITOR_INPUT_COLUMNS = ['Datum', 'Standort', 'Disponent'] + INPUT_COLUMNS
 
-def save_month_data(month: str, df: pd.DataFrame):
-    """Speichert Daten für einen Monat."""
-    conn = get_connection()
+def compute_month_changes(original_df: pd.DataFrame, edited_df: pd.DataFrame) -> dict:
+    """
+    Änderungsmenge der Eingabemaske gegenüber dem geladenen Stand.
+    
+    Die Zeilen beider Frames werden per Inhalts-Hash der Eingabespalten
+    verglichen; nur neue und geänderte Zeilen werden aufbereitet.
+    
+    Returns:
+        dict mit changed (Staging-Frame der neuen/geänderten Zeilen),
+        deleted (Schlüssel datum, standort, die nicht mehr vorkommen),
+        original (die ersetzten bzw. entfernten Zeilen des geladenen Stands,
+        unaufbereitet), skipped und unchanged
+    """
+    columns = [c for c in EDITOR_INPUT_COLUMNS if c in original_df.columns and c in edited_df.columns]
+    old = pd.util.hash_pandas_object(original_df[columns].astype(object), index=False)
+    new = pd.util.hash_pandas_object(edited_df[columns].astype(object), index=False)
+    
+    # Schlüssel, die nach der Änderung nicht mehr vorkommen, wurden entfernt (oder umbenannt)
+    changed, skipped = build_staging_frame(edited_df[~new.isin(old).to_numpy()])
+    original = original_df[~old.isin(new).to_numpy()]
+    removed = staging_keys(original).dropna()
+    kept = pd.MultiIndex.from_frame(changed[['datum', 'standort']])
+    deleted = removed[~pd.MultiIndex.from_frame(removed).isin(kept)].reset_index(drop=True)
+    return {
+        'changed': changed,
+        'deleted': deleted,
+        'original': original,
+        'skipped': skipped,
+        'unchanged': len(edited_df) - skipped - len(changed)
+    }
+
+@metrics.instrument()
+def apply_month_changes(month: str, changed: pd.DataFrame, deleted: pd.DataFrame,
+                        check=None) -> dict:
+    """
+    Schreibt eine Änderungsmenge in einer Transaktion: changed wird
+    upgesertet (Schlüssel datum, standort), die Schlüssel in deleted werden
+    entfernt. check erhält vorher den gesperrt gelesenen Stand der
+    betroffenen Zeilen (siehe KPIBackend.save_changes).
+    
+    Returns:
+        dict mit inserted, updated, unchanged, deleted
+    """
+    if changed.empty and deleted.empty:
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
     try:
-        cursor = conn.cursor()
-        
-        # Lösche alte Daten für diesen Monat
-        cursor.execute('DELETE FROM kpi_data WHERE monat = %s', (month,))
-        
-        # Füge neue Daten ein
-        for _, row in df.iterrows():
-            try:
-                # Parse Datum
-                datum_str = str(row.get('Datum', '')).strip()
-                if datum_str:
-                    datum = datetime.strptime(datum_str, '%d.%m.%Y').date()
-                else:
-                    continue
-                
-                cursor.execute('''
-                    INSERT INTO kpi_data 
-                    (datum, monat, standort, disponent, fahrzeuge, stopps, 
-                     unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (datum, standort) 
-                    DO UPDATE SET
-                        disponent = EXCLUDED.disponent,
-                        fahrzeuge = EXCLUDED.fahrzeuge,
-                        stopps = EXCLUDED.stopps,
-                        unverplante_stopps = EXCLUDED.unverplante_stopps,
-                        kosten_fuhrpark = EXCLUDED.kosten_fuhrpark,
-                        stoppschnitt = EXCLUDED.stoppschnitt,
-                        stoppkosten = EXCLUDED.stoppkosten,
-                        updated_at = CURRENT_TIMESTAMP
-                ''', (
-                    datum,
-                    month,
-                    row.get('Standort', ''),
-                    row.get('Disponent', ''),
-                    parse_numeric(row.get('Fahrzeuge')),
-                    parse_numeric(row.get('Stopps')),
-                    parse_numeric(row.get('Unverplante Stopps')),
-                    parse_numeric(row.get('Kosten Fuhrpark')),
-                    parse_numeric(row.get('Stoppschnitt')),
-                    parse_numeric(row.get('Stoppkosten'))
-                ))
-            except Exception as e:
-                print(f"Fehler beim Speichern von Zeile: {e}")
-                continue
-        
-        conn.commit()
-        
-    except Exception as e:
-        conn.rollback()
-        raise
+        return get_backend().save_changes(changed, deleted, month, check)
+    finally:
+        invalidate_month_cache(month)
+
+@metrics.instrument()
+def save_month_changes(month: str, original_df: pd.DataFrame, edited_df: pd.DataFrame,
+                       progress=None) -> dict:
+    """
+    Speichert nur die Änderungen der Eingabemaske gegenüber dem geladenen Stand
+    (siehe compute_month_changes). Ohne Änderungen erfolgt kein
+    Datenbankzugriff. progress(anteil, text) meldet optional den Fortschritt.
+    
+    Returns:
+        dict mit inserted, updated, unchanged, deleted, skipped und changed
+        (False, wenn nichts zu speichern war)
+    """
+    changes = compute_month_changes(original_df, edited_df)
+    changed, deleted = changes['changed'], changes['deleted']
+    if progress and not (changed.empty and deleted.empty):
+        progress(0.4, f"{len(changed)} Zeilen speichern, {len(deleted)} entfernen …")
+    result = apply_month_changes(month, changed, deleted)
+    
+    result['unchanged'] += changes['unchanged']
+    result['skipped'] = changes['skipped']
+    result['changed'] = not (changed.empty and deleted.empty)
+    return result
+
+@metrics.instrument()
+def import_staged_month(staged: pd.DataFrame, month: str, content_hash: str,
+                        filename: str, skipped: int = 0, force: bool = False) -> dict:
+    """
+    Übernimmt einen aufbereiteten Monat aus einer Import-Datei (ohne Löschen).
+    
+    Dateien mit bereits protokolliertem Inhalts-Hash (import_log) werden ohne
+    force übersprungen.
+    
+    Returns:
+        Merge-Zähler bzw. {'already_imported': True}
+    """
+    try:
+        return get_backend().import_file(staged, month, content_hash, filename, skipped, force)
     finally:
-        return_connection(conn)
+        invalidate_month_cache(month)
 
 def parse_numeric(value):
     """Konvertiert einen Wert zu float."""
@@ -245,103 +599,69 @@ def parse_numeric(value):
     except:
         return None
 
-def create_month(month: str, standorte: list):
+def _create_workdays(start, end, standorte: list = None) -> int:
+    """
+    Legt für alle Werktage (Mo-Fr) zwischen start und end (inklusive) je
+    Standort eine leere Zeile an – in einem einzigen Statement.
+    
+    Ohne standorte werden alle aktiven Standorte aus der Tabelle verwendet.
+    Bereits vorhandene Zeilen bleiben unverändert. Gibt die Anzahl neuer Zeilen zurück.
+    """
+    return get_backend().create_workdays(start, end, standorte)
+
+@metrics.instrument()
+def create_month(month: str, standorte: list = None) -> int:
     """Erstellt einen neuen Monat mit allen Werktagen und Standorten."""
-    conn = get_connection()
+    year, month_num = map(int, month.split('-'))
+    start_date = datetime(year, month_num, 1).date()
+    end_date = (pd.Timestamp(start_date) + pd.offsets.MonthEnd(0)).date()
     try:
-        cursor = conn.cursor()
-        
-        year, month_num = map(int, month.split('-'))
-        
-        # Generiere Werktage
-        start_date = datetime(year, month_num, 1)
-        if month_num == 12:
-            end_date = datetime(year + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = datetime(year, month_num + 1, 1) - timedelta(days=1)
-        
-        current = start_date
-        while current <= end_date:
-            if current.weekday() < 5:  # Mo-Fr
-                for standort in standorte:
-                    try:
-                        cursor.execute('''
-                            INSERT INTO kpi_data (datum, monat, standort)
-                            VALUES (%s, %s, %s)
-                            ON CONFLICT (datum, standort) DO NOTHING
-                        ''', (current.date(), month, standort))
-                    except:
-                        pass
-            current += timedelta(days=1)
-        
-        conn.commit()
-        
-    except Exception as e:
-        conn.rollback()
-        raise
+        return _create_workdays(start_date, end_date, standorte)
     finally:
-        return_connection(conn)
+        invalidate_month_cache(month)
 
+@metrics.instrument()
+def create_year(year: int, standorte: list = None) -> int:
+    """Legt alle Monate eines Jahres mit Werktagen und Standorten vorab an."""
+    try:
+        return _create_workdays(datetime(year, 1, 1).date(), datetime(year, 12, 31).date(), standorte)
+    finally:
+        for month_num in range(1, 13):
+            invalidate_month_cache(f"{year}-{month_num:02d}")
+
+@metrics.instrument()
 def delete_month(month: str) -> bool:
     """Löscht einen Monat (nur wenn keine Daten vorhanden)."""
-    conn = get_connection()
     try:
-        cursor = conn.cursor()
-        
-        # Prüfe ob Daten vorhanden
-        cursor.execute('''
-            SELECT COUNT(*) as count FROM kpi_data 
-            WHERE monat = %s AND (fahrzeuge IS NOT NULL OR stopps IS NOT NULL)
-        ''', (month,))
-        
-        if cursor.fetchone()[0] > 0:
-            return False
-        
-        cursor.execute('DELETE FROM kpi_data WHERE monat = %s', (month,))
-        conn.commit()
-        return True
-        
-    except Exception as e:
-        conn.rollback()
-        return False
+        return get_backend().delete_month(month)
     finally:
-        return_connection(conn)
+        invalidate_month_cache(month)
 
-def get_standorte():
-    """Gibt alle aktiven Standorte zurück."""
-    conn = get_connection()
+@metrics.instrument()
+def purge_months(months: list):
+    """Entfernt Monate vollständig, auch mit Daten (Wartung, Benchmarks)."""
+    try:
+        get_backend().purge_months(months)
+    finally:
+        for month in months:
+            invalidate_month_cache(month)
+
+@metrics.instrument()
+def archive_month(month: str) -> str:
+    """Verschiebt einen Monat in eine Archivtabelle (nur PostgreSQL: DETACH PARTITION)."""
     try:
-        cursor = conn.cursor()
-        cursor.execute('SELECT name FROM standorte WHERE aktiv = TRUE ORDER BY name')
-        standorte = [row[0] for row in cursor.fetchall()]
-        return standorte
+        return get_backend().archive_month(month)
     finally:
-        return_connection(conn)
+        invalidate_month_cache(month)
+
+@metrics.instrument()
+def get_standorte():
+    """Gibt alle aktiven Standorte zurück."""
+    return get_backend().get_standorte()
 
 def init_default_standorte():
     """Initialisiert Standard-Standorte."""
-    standorte = [
-        'Delmenhorst', 'Güstrow', 'Döbeln', 'Melle', 'Langenfeld',
-        'Kassel', 'Berlin', 'Aschaffenburg', 'Renningen'
-    ]
-    
-    conn = get_connection()
     try:
-        cursor = conn.cursor()
-        
-        for standort in standorte:
-            try:
-                cursor.execute('''
-                    INSERT INTO standorte (name) 
-                    VALUES (%s) 
-                    ON CONFLICT (name) DO NOTHING
-                ''', (standort,))
-            except:
-                pass
-        
-        conn.commit()
-        
+        get_backend().add_standorte(DEFAULT_STANDORTE)
     except Exception as e:
-        conn.rollback()
-    finally:
-        return_connection(conn)
+        pass
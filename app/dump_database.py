@@ -1,108 +1,626 @@
 #!/usr/bin/env python3
 """
 Datenbank-Extraktions-Script
-Dumpt alle Daten aus der KPI-Datenbank für Backup/Recovery
+Dumpt alle Daten aus der KPI-Datenbank (PostgreSQL) für Backup/Recovery.
+Beim SQLite-Backend genügt eine Kopie der Datenbankdatei (sqlite3 .backup).
+
+Jede Tabelle wird per COPY TO STDOUT (CSV) bzw. über einen serverseitigen
+Cursor (NDJSON) gestreamt und in gzip-komprimierte Chunks geschrieben – der
+Speicherbedarf bleibt unabhängig von der Tabellengröße konstant. Tabellen
+werden parallel gedumpt, alle Verbindungen teilen sich denselben Snapshot.
+Eine manifest.json enthält Zeilenzahlen und SHA-256-Prüfsummen je Chunk.
+
+Inkrementelle Dumps (--incremental) sichern nur seit dem letzten Lauf
+geänderte KPI-Zeilen (updated_at) und neue Audit-Einträge; --merge führt
+Full-Dump und Inkremente zu einem konsistenten Snapshot zusammen.
+
+Aufruf:
+    python dump_database.py [--output DIR] [--format csv|ndjson] [--workers N]
+    python dump_database.py --incremental
+    python dump_database.py --merge
 """
-import sqlite3
+import argparse
+import csv
+import gzip
+import hashlib
 import json
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from queue import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import get_connection, return_connection, get_backend_name
+
+DUMP_DIR = os.environ.get('DUMP_DIR', '/data/dumps')
+CHUNK_BYTES = int(os.environ.get('DUMP_CHUNK_BYTES', str(64 * 1024 * 1024)))
+NDJSON_FETCH_SIZE = 5000
+
+# Inkrementelle Backups: Stand der Kette und Sicherheitsüberlappung für updated_at
+BACKUP_STATE_FILE = 'backup_state.json'
+INCREMENTAL_OVERLAP_SECONDS = int(os.environ.get('BACKUP_OVERLAP_SECONDS', '600'))
+INCREMENTAL_TABLES = ('kpi_data', 'audit_log')
+KPI_KEYS_TABLE = 'kpi_data_keys'
+
+# Tabelle -> Spalten (None = alle) und Sortierung
+# Passwort-Hashes werden bewusst nicht gesichert.
+DUMP_TABLES = {
+    'kpi_data': {'columns': None, 'order_by': 'datum, standort'},
+    'standorte': {'columns': None, 'order_by': 'id'},
+    'disponenten': {'columns': None, 'order_by': 'id'},
+    'users': {'columns': ['id', 'username', 'role', 'created_at'], 'order_by': 'id'},
+    'audit_log': {'columns': None, 'order_by': 'id'}
+}
+
+# Erste Sortierspalte, deren Wertebereich je Chunk im Manifest steht ('range');
+# Teil-Restore und --merge lesen damit nur die Chunks eines Monats
+RANGE_COLUMNS = {'kpi_data': 'datum', KPI_KEYS_TABLE: 'datum'}
+
+
+class ChunkWriter:
+    """
+    Dateiähnliches Ziel für COPY: schreibt gzip-Chunks fester Maximalgröße.
+
+    psycopg2 ruft write() pro Zeile auf, Chunk-Grenzen liegen daher immer
+    auf Zeilengrenzen. Bei CSV wird der Header in jeden Chunk übernommen.
+    Hat die Tabelle eine Spalte in RANGE_COLUMNS, erhält jeder Chunk deren
+    ersten und letzten Wert als 'range'.
+    """
+
+    def __init__(self, out_dir: str, table: str, extension: str,
+                 chunk_bytes: int = CHUNK_BYTES, has_header: bool = False):
+        self.out_dir = out_dir
+        self.table = table
+        self.extension = extension
+        self.chunk_bytes = chunk_bytes
+        self.has_header = has_header
+        self.header = None
+        self.chunks = []
+        self.table_hash = hashlib.sha256()
+        self.range_column = RANGE_COLUMNS.get(table)
+        self._file = None
+        self._current = None
+        self._first = self._last = None
+
+    def _open_chunk(self):
+        filename = f"{self.table}.{len(self.chunks):04d}.{self.extension}.gz"
+        self._file = gzip.open(os.path.join(self.out_dir, filename), 'wb', compresslevel=6)
+        self._current = {'file': filename, 'rows': 0, 'bytes': 0, 'hash': hashlib.sha256()}
+        self.chunks.append(self._current)
+        if self.header is not None:
+            self._file.write(self.header)
 
-DATABASE_PATH = os.environ.get('DATABASE_PATH', '/data/kpi_dashboard.db')
-OUTPUT_PATH = '/data/database_dump_{}.json'.format(datetime.now().strftime('%Y%m%d_%H%M%S'))
+    def _close_chunk(self):
+        if self._file is not None:
+            self._file.close()
+            self._current['sha256'] = self._current.pop('hash').hexdigest()
+            if self.range_column and self._first is not None:
+                self._current['range'] = [self._range_value(self._first), self._range_value(self._last)]
+            self._file = None
+            self._first = self._last = None
 
-def dump_database():
-    """Exportiert die gesamte Datenbank als JSON."""
-    print(f"=== Datenbank-Dump ===")
-    print(f"Quelle: {DATABASE_PATH}")
-    print(f"Ziel: {OUTPUT_PATH}")
-    
+    def _range_value(self, line: bytes) -> str:
+        """Wert der range_column in einer Zeile (CSV oder NDJSON)."""
+        if self.extension == 'csv':
+            header = next(csv.reader([self.header.decode('utf-8')]))
+            return next(csv.reader([line.decode('utf-8')]))[header.index(self.range_column)]
+        return str(json.loads(line)[self.range_column])
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if self.has_header and self.header is None:
+            self.header = data
+            return len(data)
+        if self._file is None or self._current['bytes'] >= self.chunk_bytes:
+            self._close_chunk()
+            self._open_chunk()
+        self._file.write(data)
+        if self._first is None:
+            self._first = data
+        self._last = data
+        self._current['rows'] += 1
+        self._current['bytes'] += len(data)
+        self._current['hash'].update(data)
+        self.table_hash.update(data)
+        return len(data)
+
+    def close(self) -> dict:
+        """Schließt den letzten Chunk und gibt den Manifest-Eintrag zurück."""
+        if not self.chunks:
+            self._open_chunk()  # leere Tabelle: ein Chunk (nur Header)
+        self._close_chunk()
+        return {
+            'rows': sum(c['rows'] for c in self.chunks),
+            'bytes': sum(c['bytes'] for c in self.chunks),
+            'sha256': self.table_hash.hexdigest(),
+            'header': self.header.decode('utf-8').rstrip('\r\n') if self.header else None,
+            'chunks': self.chunks
+        }
+
+
+def table_select(table: str, where: str = None) -> str:
+    """SELECT für eine Tabelle gemäß DUMP_TABLES."""
+    spec = DUMP_TABLES[table]
+    columns = ', '.join(spec['columns']) if spec['columns'] else '*'
+    query = f"SELECT {columns} FROM {table}"
+    if where:
+        query += f" WHERE {where}"
+    return query + f" ORDER BY {spec['order_by']}"
+
+
+def dump_table_csv(conn, table: str, out_dir: str, query: str, chunk_bytes: int) -> dict:
+    """Streamt eine Tabelle per COPY TO STDOUT in CSV-Chunks."""
+    writer = ChunkWriter(out_dir, table, 'csv', chunk_bytes, has_header=True)
+    cursor = conn.cursor()
+    cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", writer)
+    entry = writer.close()
+    entry['columns'] = entry['header'].split(',') if entry['header'] else []
+    return entry
+
+
+def dump_table_ndjson(conn, table: str, out_dir: str, query: str, chunk_bytes: int) -> dict:
+    """Streamt eine Tabelle über einen serverseitigen Cursor in NDJSON-Chunks."""
+    writer = ChunkWriter(out_dir, table, 'ndjson', chunk_bytes)
+    cursor = conn.cursor(name=f"dump_{table}")
+    cursor.itersize = NDJSON_FETCH_SIZE
+    cursor.execute(query)
+    columns = None
+    for row in cursor:
+        if columns is None:
+            columns = [desc[0] for desc in cursor.description]
+        writer.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n')
+    if columns is None and cursor.description:
+        columns = [desc[0] for desc in cursor.description]
+    cursor.close()
+    entry = writer.close()
+    entry['columns'] = columns or []
+    return entry
+
+
+def open_snapshot_connections(count: int) -> list:
+    """
+    Öffnet count Verbindungen, die alle denselben REPEATABLE READ Snapshot
+    sehen (pg_export_snapshot), damit der Dump tabellenübergreifend konsistent ist.
+    """
+    connections = []
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Sammle alle Daten
-        dump_data = {}
-        
-        # KPI-Daten
-        cursor.execute('SELECT * FROM kpi_data ORDER BY datum, standort')
-        kpi_rows = cursor.fetchall()
-        dump_data['kpi_data'] = [dict(row) for row in kpi_rows]
-        print(f"✓ KPI-Daten: {len(kpi_rows)} Einträge")
-        
-        # Prüfe Dezember-Daten speziell
-        cursor.execute('''
-            SELECT datum, COUNT(*) as count 
-            FROM kpi_data 
-            WHERE monat = '2025-12' 
-            GROUP BY datum 
-            ORDER BY datum
-        ''')
-        dec_dates = cursor.fetchall()
-        print(f"\n=== Dezember 2025 Daten ===")
-        for row in dec_dates:
-            print(f"  {row['datum']}: {row['count']} Einträge")
-        
-        # Standorte
-        cursor.execute('SELECT * FROM standorte')
-        standorte = cursor.fetchall()
-        dump_data['standorte'] = [dict(row) for row in standorte]
-        print(f"\n✓ Standorte: {len(standorte)} Einträge")
-        
-        # Disponenten
-        cursor.execute('SELECT * FROM disponenten')
-        disponenten = cursor.fetchall()
-        dump_data['disponenten'] = [dict(row) for row in disponenten]
-        print(f"✓ Disponenten: {len(disponenten)} Einträge")
-        
-        # Users
-        cursor.execute('SELECT id, username, role, created_at FROM users')
-        users = cursor.fetchall()
-        dump_data['users'] = [dict(row) for row in users]
-        print(f"✓ Benutzer: {len(users)} Einträge")
-        
-        # Audit Log
-        cursor.execute('SELECT * FROM audit_log ORDER BY created_at DESC LIMIT 1000')
-        audit = cursor.fetchall()
-        dump_data['audit_log'] = [dict(row) for row in audit]
-        print(f"✓ Audit Log: {len(audit)} Einträge (letzte 1000)")
-        
-        conn.close()
-        
-        # Speichere als JSON
-        with open(OUTPUT_PATH, 'w', encoding='utf-8') as f:
-            json.dump(dump_data, f, indent=2, ensure_ascii=False, default=str)
-        
-        print(f"\n✅ Dump erfolgreich gespeichert: {OUTPUT_PATH}")
-        
-        # Zeige auch CSV-Export an
-        print(f"\n=== Dezember-Daten zur Ansicht ===")
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datum, standort, disponent, fahrzeuge, stopps, 
-                   unverplante_stopps, kosten_fuhrpark
-            FROM kpi_data 
-            WHERE monat = '2025-12' AND datum >= '2025-12-05' AND datum <= '2025-12-21'
-            ORDER BY datum, standort
-        ''')
-        rows = cursor.fetchall()
-        if rows:
-            print(f"Gefundene Einträge vom 05.12 bis 21.12: {len(rows)}")
-            for row in rows[:20]:  # Zeige erste 20
-                print(f"  {row}")
+        leader = get_connection()
+        connections.append(leader)
+        cursor = leader.cursor()
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        cursor.execute('SELECT pg_export_snapshot()')
+        snapshot_id = cursor.fetchone()[0]
+
+        for _ in range(count - 1):
+            conn = get_connection()
+            connections.append(conn)
+            cursor = conn.cursor()
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+            cursor.execute('SET TRANSACTION SNAPSHOT %s', (snapshot_id,))
+        return connections
+    except Exception:
+        release_connections(connections)
+        raise
+
+
+def release_connections(connections: list):
+    for conn in connections:
+        conn.rollback()
+        return_connection(conn)
+
+
+def run_parallel_dump(out_dir: str, plan, fmt: str, workers: int, chunk_bytes: int):
+    """
+    Dumpt Tabellen parallel im selben Snapshot.
+
+    plan(cursor) läuft zuerst auf der Leader-Verbindung innerhalb des
+    Snapshots und gibt (queries, watermarks) zurück; queries ordnet jeder
+    Ausgabedatei (Tabellenname) ein SELECT zu.
+
+    Returns:
+        (Manifest-Einträge je Tabelle, watermarks)
+    """
+    dump_fn = dump_table_csv if fmt == 'csv' else dump_table_ndjson
+    connections = open_snapshot_connections(max(1, workers))
+    try:
+        queries, watermarks = plan(connections[0].cursor())
+        available = Queue()
+        for conn in connections[:max(1, min(workers, len(queries)))]:
+            available.put(conn)
+
+        def run(table):
+            conn = available.get()
+            try:
+                started = time.perf_counter()
+                entry = dump_fn(conn, table, out_dir, queries[table], chunk_bytes)
+                entry['seconds'] = round(time.perf_counter() - started, 3)
+                # Eine write()-Operation pro Zeile, damit parallele Ausgaben nicht verschachteln
+                sys.stdout.write(f"✓ {table}: {entry['rows']} Zeilen in {len(entry['chunks'])} Chunk(s)\n")
+                return table, entry
+            finally:
+                available.put(conn)
+
+        with ThreadPoolExecutor(max_workers=available.qsize()) as executor:
+            return dict(executor.map(run, queries)), watermarks
+    finally:
+        release_connections(connections)
+
+
+def read_watermarks(cursor) -> dict:
+    """High-Water-Marks im aktuellen Snapshot (max(updated_at), max(audit_log.id))."""
+    cursor.execute('''
+        SELECT (SELECT MAX(updated_at) FROM kpi_data),
+               (SELECT MAX(id) FROM audit_log)
+    ''')
+    kpi_updated_at, audit_id = cursor.fetchone()
+    return {
+        'kpi_data_updated_at': kpi_updated_at.isoformat() if kpi_updated_at else None,
+        'audit_log_id': audit_id
+    }
+
+
+def load_backup_state(base_dir: str) -> dict:
+    """Liest den Stand der Backup-Kette (letzter Full-Dump, Inkremente, Watermarks)."""
+    path = os.path.join(base_dir, BACKUP_STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_backup_state(base_dir: str, state: dict):
+    """Schreibt den Backup-Stand atomar (erst temporär, dann umbenennen)."""
+    path = os.path.join(base_dir, BACKUP_STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+
+def full_plan(cursor):
+    """Plan für einen Full-Dump: alle Tabellen vollständig."""
+    return {table: table_select(table) for table in DUMP_TABLES}, read_watermarks(cursor)
+
+
+def incremental_plan(previous: dict, overlap_seconds: int):
+    """
+    Plan für einen inkrementellen Dump seit den Watermarks von previous.
+
+    kpi_data: nur seit dem letzten Lauf geänderte Zeilen (mit Überlappung, da
+    updated_at den Transaktionsbeginn trägt) plus die vollständige Schlüsselliste
+    (datum, standort), damit gelöschte Zeilen beim Zusammenführen erkannt werden.
+    audit_log: nur neue Einträge. Die kleinen Stammdaten-Tabellen vollständig.
+    """
+    def plan(cursor):
+        queries = {table: table_select(table) for table in DUMP_TABLES
+                   if table not in INCREMENTAL_TABLES}
+        since = previous.get('kpi_data_updated_at')
+        if since:
+            # COPY kennt keine Parameter: Werte per mogrify gebunden einsetzen.
+            # Bereichsabfrage über idx_kpi_updated_at statt Scan der ganzen Tabelle.
+            queries['kpi_data'] = cursor.mogrify(
+                table_select('kpi_data', "updated_at > %s::timestamp - %s * interval '1 second'"),
+                (since, overlap_seconds)
+            ).decode('utf-8')
         else:
-            print("❌ KEINE DATEN gefunden für 05.12-21.12!")
-        conn.close()
-        
-        return OUTPUT_PATH
-        
+            queries['kpi_data'] = table_select('kpi_data')
+        queries[KPI_KEYS_TABLE] = 'SELECT datum, standort FROM kpi_data ORDER BY datum, standort'
+
+        last_audit_id = previous.get('audit_log_id')
+        if last_audit_id is not None:
+            queries['audit_log'] = cursor.mogrify(
+                table_select('audit_log', 'id > %s'), (last_audit_id,)
+            ).decode('utf-8')
+        else:
+            queries['audit_log'] = table_select('audit_log')
+        return queries, read_watermarks(cursor)
+    return plan
+
+
+def write_manifest(out_dir: str, manifest: dict) -> str:
+    path = os.path.join(out_dir, 'manifest.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return path
+
+
+def require_postgres():
+    """Dump und Restore nutzen COPY und Snapshots von PostgreSQL."""
+    if get_backend_name() != 'postgres':
+        raise ValueError("Dump/Restore nur mit PostgreSQL – SQLite-Datei per "
+                         "'sqlite3 kpi_dashboard.db \".backup ziel.db\"' sichern")
+
+
+def dump_database(output_dir: str = None, fmt: str = 'csv', workers: int = 4,
+                  chunk_bytes: int = CHUNK_BYTES, incremental: bool = False,
+                  overlap_seconds: int = INCREMENTAL_OVERLAP_SECONDS) -> str:
+    """
+    Exportiert die Datenbank in ein Dump-Verzeichnis.
+
+    Mit incremental=True werden nur Änderungen seit dem letzten Lauf der
+    Kette gesichert; ohne vorhandenen Full-Dump wird automatisch einer erstellt.
+
+    Returns:
+        Pfad des Dump-Verzeichnisses oder None bei Fehler
+    """
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f"Unbekanntes Format: {fmt}")
+    require_postgres()
+
+    base_dir = output_dir or DUMP_DIR
+    state = load_backup_state(base_dir)
+    if incremental and (state is None or state.get('format') != fmt):
+        print("ℹ️ Kein passender Full-Dump vorhanden – erstelle Full-Dump")
+        incremental = False
+
+    kind = 'incremental' if incremental else 'full'
+    created_at = datetime.now()
+    prefix = 'incr' if incremental else 'dump'
+    out_dir = os.path.join(base_dir, '{}_{}'.format(prefix, created_at.strftime('%Y%m%d_%H%M%S')))
+    print(f"=== Datenbank-Dump ({kind}) ===")
+    print(f"Ziel: {out_dir} ({fmt}, {workers} parallel)")
+
+    try:
+        os.makedirs(out_dir, exist_ok=True)
+        started = time.perf_counter()
+        if incremental:
+            plan = incremental_plan(state['watermarks'], overlap_seconds)
+        else:
+            plan = full_plan
+        tables, watermarks = run_parallel_dump(out_dir, plan, fmt, workers, chunk_bytes)
+
+        manifest = {
+            'kind': kind,
+            'created_at': created_at.isoformat(),
+            'format': fmt,
+            'watermarks': watermarks,
+            'tables': tables
+        }
+        if incremental:
+            manifest['base'] = state['full']
+            manifest['since'] = state['watermarks']
+        write_manifest(out_dir, manifest)
+
+        # Kette fortschreiben: Full-Dump beginnt eine neue Kette
+        name = os.path.basename(out_dir)
+        if incremental:
+            state['incrementals'].append(name)
+        else:
+            state = {'full': name, 'incrementals': [], 'format': fmt}
+        state['watermarks'] = watermarks
+        save_backup_state(base_dir, state)
+
+        print(f"\n✅ Dump erfolgreich gespeichert: {out_dir} ({time.perf_counter() - started:.2f}s)")
+        return out_dir
+
     except Exception as e:
         print(f"❌ Fehler beim Dump: {e}")
         import traceback
         traceback.print_exc()
         return None
 
+
+# --- Zusammenführen von Full- und Inkrement-Dumps ---
+
+def read_manifest(dump_dir: str) -> dict:
+    with open(os.path.join(dump_dir, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _chunk_in_month(chunk: dict, month: str) -> bool:
+    """False, wenn der Datumsbereich des Chunks ('range') außerhalb des Monats liegt."""
+    if 'range' not in chunk:
+        return True
+    first, last = chunk['range']
+    return first[:7] <= month <= last[:7]
+
+
+def iter_table_frames(dump_dir: str, table: str, manifest: dict = None, month: str = None):
+    """
+    Liest die Chunks einer Tabelle nacheinander als DataFrames (Werte als Text).
+
+    Mit month nur die Zeilen dieses Monats; Chunks außerhalb des Monats
+    werden gar nicht gelesen.
+    """
+    import pandas as pd
+
+    manifest = manifest or read_manifest(dump_dir)
+    entry = manifest['tables'].get(table)
+    if entry is None:
+        return
+    for chunk in entry['chunks']:
+        if not chunk['rows'] or (month and not _chunk_in_month(chunk, month)):
+            continue
+        path = os.path.join(dump_dir, chunk['file'])
+        if manifest['format'] == 'csv':
+            frame = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+        else:
+            frame = pd.read_json(path, lines=True, dtype=False, convert_dates=False)
+        if month:
+            frame = frame[frame['datum'].astype(str).str[:7] == month]
+        yield frame
+
+
+def read_table(dump_dir: str, table: str, manifest: dict = None, month: str = None):
+    """Liest eine komplette Tabelle eines Dumps (mit month nur diesen Monat)."""
+    import pandas as pd
+
+    manifest = manifest or read_manifest(dump_dir)
+    frames = list(iter_table_frames(dump_dir, table, manifest, month))
+    columns = manifest['tables'][table]['columns']
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def write_table(out_dir: str, table: str, df, fmt: str, chunk_bytes: int = CHUNK_BYTES) -> dict:
+    """Schreibt einen DataFrame im Dump-Format (gleiches Chunk-Layout wie COPY)."""
+    return write_frames(out_dir, table, [df], list(df.columns), fmt, chunk_bytes)
+
+
+def write_frames(out_dir: str, table: str, frames, columns: list, fmt: str,
+                 chunk_bytes: int = CHUNK_BYTES) -> dict:
+    """Schreibt DataFrames nacheinander in eine Tabelle (immer nur ein Frame im Speicher)."""
+    if fmt == 'csv':
+        writer = ChunkWriter(out_dir, table, 'csv', chunk_bytes, has_header=True)
+        csv_writer = csv.writer(_TextAdapter(writer), lineterminator='\n')
+        csv_writer.writerow(columns)
+    else:
+        writer = ChunkWriter(out_dir, table, 'ndjson', chunk_bytes)
+    for df in frames:
+        values = df[columns].astype(object).where(df[columns].notna(), None)
+        if fmt == 'csv':
+            for row in values.itertuples(index=False, name=None):
+                csv_writer.writerow(row)
+        else:
+            for record in values.to_dict('records'):
+                writer.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+    entry = writer.close()
+    entry['columns'] = list(columns)
+    return entry
+
+
+class _TextAdapter:
+    """Leitet csv.writer-Ausgaben (eine write()-Operation je Zeile) an ChunkWriter weiter."""
+
+    def __init__(self, writer: ChunkWriter):
+        self.writer = writer
+
+    def write(self, text: str):
+        return self.writer.write(text)
+
+
+def _merge_months(sources: list, keys_source) -> list:
+    """
+    Monate, die --merge einzeln zusammenführt: vom ersten bis zum letzten Monat
+    der Schlüsselliste (bzw. des Full-Dumps ohne Inkremente). Fehlt einem
+    Chunk der Datumsbereich (Dumps älterer Versionen), [None] = alles auf einmal.
+    """
+    chunks = [chunk for dump_dir, manifest, table in sources
+              for chunk in manifest['tables'][table]['chunks'] if chunk['rows']]
+    if any('range' not in chunk for chunk in chunks):
+        return [None]
+    dump_dir, manifest, table = keys_source
+    ranges = [chunk['range'] for chunk in manifest['tables'][table]['chunks'] if chunk['rows']]
+    if not ranges:
+        return []
+    first = min(r[0] for r in ranges)[:7]
+    last = max(r[1] for r in ranges)[:7]
+    months, year, month = [], int(first[:4]), int(first[5:7])
+    while f"{year:04d}-{month:02d}" <= last:
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = year + month // 12, month % 12 + 1
+    return months
+
+
+def merge_backups(base_dir: str = None, output_dir: str = None, until: str = None) -> str:
+    """
+    Führt den Full-Dump der aktuellen Kette mit ihren Inkrementen zu einem
+    konsistenten Snapshot (Format wie ein Full-Dump) zusammen.
+
+    kpi_data wird Monat für Monat zusammengeführt: aus jedem Dump werden nur
+    die Chunks des Monats gelesen (Datumsbereich im Manifest), der Speicher
+    hängt damit vom größten Monat ab, nicht von Historie und Kettenlänge.
+    Maßgeblich für vorhandene Zeilen ist die Schlüsselliste des letzten
+    Inkrements. audit_log wird chunkweise durchgereicht. Dumps ohne
+    Datumsbereich (ältere Versionen) werden vollständig in den Speicher geladen.
+
+    Args:
+        base_dir: Basisverzeichnis der Dumps (Standard: DUMP_DIR)
+        output_dir: Zielverzeichnis (Standard: base_dir/snapshot_<Zeitstempel>)
+        until: optional Name des letzten einzubeziehenden Inkrements
+
+    Returns:
+        Pfad des Snapshot-Verzeichnisses
+    """
+    import pandas as pd
+
+    base_dir = base_dir or DUMP_DIR
+    state = load_backup_state(base_dir)
+    if state is None:
+        raise FileNotFoundError(f"Keine Backup-Kette in {base_dir}")
+
+    chain = state['incrementals']
+    if until:
+        chain = chain[:chain.index(until) + 1]
+    full_dir = os.path.join(base_dir, state['full'])
+    full_manifest = read_manifest(full_dir)
+    fmt = full_manifest['format']
+
+    dumps = [(full_dir, full_manifest)]
+    dumps += [(os.path.join(base_dir, name), read_manifest(os.path.join(base_dir, name))) for name in chain]
+    latest_dir, latest_manifest = dumps[-1]
+
+    sources = [(dump_dir, manifest, 'kpi_data') for dump_dir, manifest in dumps]
+    keys_source = (latest_dir, latest_manifest, KPI_KEYS_TABLE if chain else 'kpi_data')
+    if chain:
+        sources.append(keys_source)
+    months = _merge_months(sources, keys_source)
+
+    def kpi_frames():
+        for month in months:
+            kpi = pd.concat([read_table(dump_dir, 'kpi_data', manifest, month)
+                             for dump_dir, manifest in dumps], ignore_index=True)
+            if chain:
+                # Upsert nach (datum, standort), danach gelöschte Schlüssel entfernen
+                kpi = kpi.drop_duplicates(subset=['datum', 'standort'], keep='last')
+                keys = read_table(latest_dir, KPI_KEYS_TABLE, latest_manifest, month)
+                kpi = kpi.merge(keys, on=['datum', 'standort'], how='inner')
+            yield kpi.sort_values(['datum', 'standort'], kind='stable')
+
+    def audit_frames():
+        # Inkremente enthalten nur höhere ids; nach id sortiert durchreichen
+        last_id = None
+        for dump_dir, manifest in dumps:
+            for frame in iter_table_frames(dump_dir, 'audit_log', manifest):
+                ids = pd.to_numeric(frame['id'])
+                if last_id is not None:
+                    frame, ids = frame[ids > last_id], ids[ids > last_id]
+                if len(frame):
+                    last_id = ids.max()
+                    yield frame
+
+    created_at = datetime.now()
+    out_dir = output_dir or os.path.join(base_dir, 'snapshot_{}'.format(created_at.strftime('%Y%m%d_%H%M%S')))
+    os.makedirs(out_dir, exist_ok=True)
+
+    tables = {
+        'kpi_data': write_frames(out_dir, 'kpi_data', kpi_frames(),
+                                 full_manifest['tables']['kpi_data']['columns'], fmt),
+        'audit_log': write_frames(out_dir, 'audit_log', audit_frames(),
+                                  full_manifest['tables']['audit_log']['columns'], fmt)
+    }
+    for table in DUMP_TABLES:
+        if table not in tables:
+            tables[table] = write_table(out_dir, table, read_table(latest_dir, table, latest_manifest), fmt)
+
+    write_manifest(out_dir, {
+        'kind': 'snapshot',
+        'created_at': created_at.isoformat(),
+        'format': fmt,
+        'watermarks': latest_manifest['watermarks'],
+        'sources': [state['full']] + chain,
+        'tables': tables
+    })
+    print(f"✅ Snapshot aus {1 + len(chain)} Dump(s): {out_dir} ({tables['kpi_data']['rows']} KPI-Zeilen)")
+    return out_dir
+
+
 if __name__ == '__main__':
-    dump_database()
+    parser = argparse.ArgumentParser(description="KPI-Datenbank sichern")
+    parser.add_argument('--output', default=DUMP_DIR, help="Basisverzeichnis für Dumps")
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--workers', type=int, default=4, help="Parallel gedumpte Tabellen")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Nur Änderungen seit dem letzten Dump der Kette sichern")
+    parser.add_argument('--merge', action='store_true',
+                        help="Full-Dump und Inkremente zu einem Snapshot zusammenführen "
+                             "(monatsweise; Speicherbedarf etwa ein Monat KPI-Daten)")
+    args = parser.parse_args()
+    if args.merge:
+        merge_backups(args.output)
+    else:
+        dump_database(args.output, args.format, args.workers, incremental=args.incremental)
@@ -0,0 +1,113 @@
+"""
+Excel-Export für das KPI Dashboard
+
+Workbooks werden im write-only (Streaming) Modus von openpyxl erzeugt und
+über einen Inhalts-Hash des DataFrames gecacht, damit ein erneuter Klick
+auf "Excel Export" ohne Änderungen nichts neu berechnet.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
+
+MAX_COLUMN_WIDTH = 30
+EXPORT_CACHE_SIZE = 8
+
+_export_cache = OrderedDict()
+_export_cache_lock = threading.Lock()
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """Inhalts-Hash eines DataFrames (Werte, Index und Spaltennamen)."""
+    digest = hashlib.sha1()
+    digest.update('\x1f'.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _named_styles():
+    """Header- und Zellen-Style, einmal pro Workbook registriert."""
+    thin = Side(style='thin')
+    thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    header_style = NamedStyle(name='kpi_header')
+    header_style.fill = PatternFill(start_color="1F4E78", end_color="1F4E78", fill_type="solid")
+    header_style.font = Font(color="FFFFFF", bold=True, size=12)
+    header_style.border = thin_border
+    header_style.alignment = Alignment(horizontal='center')
+
+    cell_style = NamedStyle(name='kpi_cell')
+    cell_style.border = thin_border
+    return header_style, cell_style
+
+
+def _column_widths(df: pd.DataFrame) -> list:
+    """Spaltenbreiten aus der längsten Zelle (inkl. Header), spaltenweise berechnet."""
+    widths = []
+    for col in df.columns:
+        values = df[col]
+        lengths = values.astype(str).str.len().where(values.notna(), 0)
+        max_length = max(len(str(col)), int(lengths.max()) if len(lengths) else 0)
+        widths.append(min(max_length + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def export_to_excel(df: pd.DataFrame, title: str = None) -> bytes:
+    """Exportiert DataFrame als formatiertes Excel (write-only, konstanter Speicher)."""
+    wb = Workbook(write_only=True)
+    header_style, cell_style = _named_styles()
+    wb.add_named_style(header_style)
+    wb.add_named_style(cell_style)
+
+    ws = wb.create_sheet("KPI Daten")
+
+    # Spaltenbreiten müssen im write-only Modus vor den Zeilen gesetzt werden
+    for col_idx, width in enumerate(_column_widths(df), 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = width
+
+    header = []
+    for col_name in df.columns:
+        cell = WriteOnlyCell(ws, value=col_name)
+        cell.style = 'kpi_header'
+        header.append(cell)
+    ws.append(header)
+
+    # Eine Zelle pro Spalte wiederverwenden: append() serialisiert die Zeile sofort
+    row_cells = []
+    for _ in df.columns:
+        cell = WriteOnlyCell(ws)
+        cell.style = 'kpi_cell'
+        row_cells.append(cell)
+
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        for cell, value in zip(row_cells, row):
+            cell.value = value
+        ws.append(row_cells)
+
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def get_excel_export(df: pd.DataFrame, title: str = None) -> bytes:
+    """Gibt den Excel-Export aus dem Cache zurück oder erzeugt ihn bei Bedarf."""
+    key = (frame_hash(df), title)
+    with _export_cache_lock:
+        if key in _export_cache:
+            _export_cache.move_to_end(key)
+            return _export_cache[key]
+
+    data = export_to_excel(df, title)
+
+    with _export_cache_lock:
+        _export_cache[key] = data
+        while len(_export_cache) > EXPORT_CACHE_SIZE:
+            _export_cache.popitem(last=False)
+    return data
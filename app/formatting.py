@@ -0,0 +1,123 @@
+"""
+Darstellungsschicht: Typisierte KPI-Frames in deutsche Anzeigeform bringen
+
+Die Datenschicht (database.py) liefert typisierte Spalten (datetime, category,
+Int64/float64). Formatiert wird erst hier, unmittelbar vor der Anzeige.
+
+Alle Formatierer arbeiten spaltenweise auf ganzen Series (numpy-Rundung,
+String-Operationen je Spalte) statt mit einem Python-Aufruf pro Zelle.
+"""
+import numpy as np
+import pandas as pd
+
+from kpi import parse_numeric_series
+
+DATE_FORMAT = '%d.%m.%Y'
+
+# Tausenderpunkt vor jeder vollständigen Dreiergruppe bis zum Ende der Zahl
+THOUSANDS_PATTERN = r'\B(?=(\d{3})+(?!\d))'
+
+
+def format_number_de(values, decimals: int = 2, sign: bool = False,
+                     suffix: str = '', thousands: bool = True):
+    """
+    Formatiert Zahlen im deutschen Format ('1.234,56').
+
+    Args:
+        values: Series, Array oder Einzelwert (Text wie '12,5' wird geparst)
+        decimals: Nachkommastellen
+        sign: '+' vor positiven Werten (für Deltas)
+        suffix: Anhang für gefüllte Werte, z.B. ' €' oder '%'
+        thousands: Tausenderpunkte setzen
+
+    Returns:
+        Series mit Text (gleicher Index) bzw. str bei einem Einzelwert;
+        fehlende Werte werden ''.
+    """
+    scalar = np.ndim(values) == 0
+    series = pd.Series([values]) if scalar else pd.Series(values)
+    numbers = parse_numeric_series(series).to_numpy(dtype='float64', na_value=np.nan)
+
+    valid = ~np.isnan(numbers)
+    factor = 10 ** decimals
+    # Kaufmännisch runden (halbe Stellen vom Nullpunkt weg), wie f'{x:.2f}'
+    scaled = np.floor(np.abs(np.where(valid, numbers, 0)) * factor + 0.5).astype(np.int64)
+
+    text = pd.Series(scaled // factor, index=series.index).astype(str)
+    if thousands:
+        text = text.str.replace(THOUSANDS_PATTERN, '.', regex=True)
+    if decimals > 0:
+        fraction = pd.Series(scaled % factor, index=series.index).astype(str).str.zfill(decimals)
+        text = text + ',' + fraction
+
+    # Vorzeichen nur, wenn der gerundete Wert nicht 0 ist
+    nonzero = scaled > 0
+    prefix = np.where(nonzero & (numbers < 0), '-', np.where(sign & nonzero, '+', ''))
+    text = (prefix + text + suffix).where(valid, '')
+    return text.iloc[0] if scalar else text
+
+
+def format_currency_de(values, decimals: int = 2, sign: bool = False):
+    """Beträge in Euro: '1.234,50 €'."""
+    return format_number_de(values, decimals, sign=sign, suffix=' €')
+
+
+def format_percent_de(values, decimals: int = 1, sign: bool = True):
+    """Prozentwerte (bereits in Prozent): '+12,5%'."""
+    return format_number_de(values, decimals, sign=sign, suffix='%')
+
+
+def format_frame_de(df: pd.DataFrame, formats: dict) -> pd.DataFrame:
+    """
+    Formatiert mehrere Spalten eines Frames.
+
+    Args:
+        formats: {Spalte: kwargs für format_number_de}, z.B.
+                 {'Kosten Fuhrpark': {'decimals': 2, 'suffix': ' €'}}
+
+    Returns:
+        Kopie von df; nicht genannte Spalten bleiben unverändert.
+    """
+    result = df.copy()
+    for col, options in formats.items():
+        if col in result.columns:
+            result[col] = format_number_de(result[col], **options)
+    return result
+
+
+def format_date_de(values: pd.Series) -> pd.Series:
+    """Datumswerte als TT.MM.JJJJ (fehlende Werte -> '')."""
+    dates = pd.to_datetime(values, errors='coerce')
+    return dates.dt.strftime(DATE_FORMAT).fillna('')
+
+
+def to_input_text(values: pd.Series) -> pd.Series:
+    """
+    Zahlen als editierbarer Text mit Dezimalkomma: ohne Tausenderpunkt und
+    ohne überflüssiges ',0' (z.B. 5320.0 -> '5320', 26.7 -> '26,7').
+    """
+    text = (
+        values.astype(str)
+        .str.replace(r'\.0+$', '', regex=True)
+        .str.replace('.', ',', regex=False)
+    )
+    return text.where(values.notna(), '')
+
+
+def to_editor_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Wandelt einen typisierten Monats-Frame in den Text-Frame der Eingabemaske.
+
+    Alle Spalten werden zu Text, damit im Editor deutsche Eingaben wie
+    '1.234,50' möglich bleiben; Validierung und Speichern parsen sie wieder.
+    """
+    editor = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        values = df[col]
+        if col == 'Datum':
+            editor[col] = format_date_de(values)
+        elif pd.api.types.is_numeric_dtype(values):
+            editor[col] = to_input_text(values)
+        else:
+            editor[col] = values.astype(object).where(values.notna(), '').astype(str)
+    return editor.reset_index(drop=True)
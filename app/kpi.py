@@ -0,0 +1,153 @@
+"""
+Spaltenweise KPI-Berechnungen für das KPI Dashboard
+
+Wird von Eingabemaske, Exporten und database.save_month_data gemeinsam
+genutzt, damit Stoppschnitt und Stoppkosten überall identisch entstehen.
+"""
+import numpy as np
+import pandas as pd
+
+# Eingabe-Spalten, aus denen die abgeleiteten KPIs berechnet werden
+INPUT_COLUMNS = ['Fahrzeuge', 'Stopps', 'Unverplante Stopps', 'Kosten Fuhrpark']
+DERIVED_COLUMNS = ['Stoppschnitt', 'Stoppkosten']
+NUMERIC_COLUMNS = INPUT_COLUMNS + DERIVED_COLUMNS
+
+
+def parse_numeric_series(series: pd.Series) -> pd.Series:
+    """
+    Wandelt eine Spalte spaltenweise in float um.
+
+    Versteht deutsche Dezimalkommas inkl. Tausenderpunkt ('1.234,5'),
+    Euro-Zeichen und Leerzeichen. Nicht parsebare Werte werden NaN.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+
+    text = (
+        series.astype(str)
+        .str.replace('€', '', regex=False)
+        .str.replace(' ', '', regex=False)
+        .str.strip()
+    )
+    has_comma = text.str.contains(',', regex=False)
+    text = text.where(~has_comma, text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    return pd.to_numeric(text, errors='coerce')
+
+
+def derive_kpi_values(fahrzeuge: pd.Series, stopps: pd.Series, kosten: pd.Series) -> pd.DataFrame:
+    """
+    Berechnet Stoppschnitt (Stopps / Fahrzeuge, 1 Nachkommastelle) und
+    Stoppkosten (Kosten / Stopps, 2 Nachkommastellen) für numerische Spalten.
+
+    Ist ein Nenner fehlend oder nicht positiv, ist das Ergebnis NaN.
+    """
+    fahrzeuge = fahrzeuge.to_numpy(dtype='float64', na_value=np.nan)
+    stopps_values = stopps.to_numpy(dtype='float64', na_value=np.nan)
+    kosten = kosten.to_numpy(dtype='float64', na_value=np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stoppschnitt = np.where(fahrzeuge > 0, np.round(stopps_values / fahrzeuge, 1), np.nan)
+        stoppkosten = np.where(stopps_values > 0, np.round(kosten / stopps_values, 2), np.nan)
+
+    return pd.DataFrame(
+        {'Stoppschnitt': stoppschnitt, 'Stoppkosten': stoppkosten},
+        index=stopps.index
+    )
+
+
+def derive_kpis(df: pd.DataFrame) -> pd.DataFrame:
+    """Berechnet Stoppschnitt und Stoppkosten für einen ganzen Frame in einem Durchlauf."""
+    def column(name):
+        if name in df.columns:
+            return parse_numeric_series(df[name])
+        return pd.Series(np.nan, index=df.index)
+
+    return derive_kpi_values(column('Fahrzeuge'), column('Stopps'), column('Kosten Fuhrpark'))
+
+
+# Nachkommastellen der abgeleiteten KPIs (wie in derive_kpi_values gerundet)
+DERIVED_DECIMALS = {'Stoppschnitt': 1, 'Stoppkosten': 2}
+
+
+def apply_kpis(df: pd.DataFrame, as_text: bool = False) -> pd.DataFrame:
+    """
+    Gibt eine Kopie von df mit neu berechneten Stoppschnitt/Stoppkosten zurück.
+
+    Mit as_text=True werden die Werte wie in der Eingabemaske (und damit in
+    CSV-/Excel-Export) als Text mit Dezimalkomma geschrieben, sonst als float.
+    """
+    from formatting import format_number_de  # formatting importiert kpi
+
+    result = df.copy()
+    derived = derive_kpis(result)
+    for col in DERIVED_COLUMNS:
+        if as_text:
+            result[col] = format_number_de(derived[col], DERIVED_DECIMALS[col], thousands=False)
+        else:
+            result[col] = derived[col]
+    return result
+
+
+# --- Validierung ---
+
+VALIDATION_COLUMNS = ['row', 'column', 'rule', 'value', 'message']
+
+
+def _as_text(series: pd.Series) -> pd.Series:
+    """Normalisiert eine Spalte zu getrimmtem Text; leere Zellen werden ''."""
+    text = series.astype(str).str.strip()
+    return text.where(series.notna() & ~text.isin(['nan', 'None', '<NA>']), '')
+
+
+def _error_rows(mask: pd.Series, column: str, rule: str, text: pd.Series,
+                reason: str, quote_value: bool = False) -> pd.DataFrame:
+    """Baut die Fehlerzeilen für eine Regel aus einer booleschen Maske."""
+    positions = np.flatnonzero(mask.to_numpy())
+    if len(positions) == 0:
+        return pd.DataFrame(columns=VALIDATION_COLUMNS)
+    values = text.iloc[positions].reset_index(drop=True)
+    rows = pd.Series(positions)
+    message = 'Zeile ' + (rows + 1).astype(str) + ': ' + reason
+    if quote_value:
+        message = message + " '" + values + "'"
+    return pd.DataFrame({
+        'row': rows,
+        'column': column,
+        'rule': rule,
+        'value': values,
+        'message': message
+    })
+
+
+def validate_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Validiert einen Editor-Frame spaltenweise.
+
+    Prüft Datumsformat (TT.MM.JJJJ), Zahlenformat und Nicht-Negativität der
+    Eingabespalten. Gibt einen Fehler-Frame mit den Spalten row (0-basierte
+    Position), column, rule, value und message zurück; leer, wenn alles gültig ist.
+    """
+    errors = []
+
+    if 'Datum' in df.columns:
+        text = _as_text(df['Datum'])
+        filled = text != ''
+        parsed = pd.to_datetime(text.where(filled), format='%d.%m.%Y', errors='coerce')
+        errors.append(_error_rows(filled & parsed.isna(), 'Datum', 'datum', text,
+                                  'Ungültiges Datum', quote_value=True))
+
+    for field in INPUT_COLUMNS:
+        if field not in df.columns:
+            continue
+        text = _as_text(df[field])
+        filled = text != ''
+        values = parse_numeric_series(text.where(filled))
+        errors.append(_error_rows(filled & values.isna(), field, 'zahl', text,
+                                  f'{field} ist keine gültige Zahl'))
+        errors.append(_error_rows(values < 0, field, 'nicht_negativ', text,
+                                  f'{field} darf nicht negativ sein'))
+
+    errors = [e for e in errors if not e.empty]
+    if not errors:
+        return pd.DataFrame(columns=VALIDATION_COLUMNS)
+    return pd.concat(errors, ignore_index=True).sort_values(['row', 'column'], kind='stable').reset_index(drop=True)
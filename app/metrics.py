@@ -0,0 +1,424 @@
+"""
+Laufzeit-Metriken: Datenbankaufrufe, Abfragen, Pool-Wartezeit und Reruns
+
+Jeder öffentliche Aufruf in database.py, jede SQL-Abfrage der Backends und
+jeder Streamlit-Rerun (samt Seite und Abschnitten) wird gemessen. Je
+(Art, Name) bleiben die letzten METRICS_SAMPLE_SIZE Dauern für p50/p95
+erhalten; die letzten Aufrufe und Abfragen stehen für die Admin-Ansicht
+bereit.
+
+Zeitmesser bilden pro Thread einen Stapel: Abfragen und Wartezeiten werden
+dem innersten laufenden Aufruf zugeordnet und beim Abschluss an die
+umgebenden Zeitmesser weitergereicht. So zeigt ein Rerun, wie viel Zeit auf
+Datenbank, Abfragen, Pool und die einzelnen Abschnitte entfiel.
+
+Export: prometheus_text() im Textformat von Prometheus; optional schreibt
+METRICS_LOG je Rerun eine JSON-Zeile und METRICS_TEXTFILE regelmäßig den
+Prometheus-Text (z.B. für den Textfile-Collector des node_exporter).
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from functools import wraps
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+SAMPLE_SIZE = int(os.environ.get('METRICS_SAMPLE_SIZE', '500'))
+RECENT_SIZE = int(os.environ.get('METRICS_RECENT_SIZE', '50'))
+METRICS_LOG = os.environ.get('METRICS_LOG', '')
+METRICS_TEXTFILE = os.environ.get('METRICS_TEXTFILE', '')
+TEXTFILE_INTERVAL = float(os.environ.get('METRICS_TEXTFILE_INTERVAL', '15'))
+QUERY_TEXT_LENGTH = 300
+QUANTILES = (0.5, 0.95)
+RERUN_STATE_KEY = '_metrics_rerun'
+
+_lock = threading.Lock()
+_local = threading.local()
+_series = {}  # (Art, Name) -> _Series
+_recent_calls = deque(maxlen=RECENT_SIZE)
+_recent_queries = deque(maxlen=RECENT_SIZE)
+_recent_reruns = deque(maxlen=RECENT_SIZE)
+_totals = defaultdict(float)  # queries, query_seconds, pool_wait_seconds, pool_waits
+_gauges = {}  # Präfix -> Funktion, die ein dict mit Zahlen liefert
+_textfile_written = 0.0
+
+
+class _Series:
+    """Dauern einer (Art, Name)-Kombination: Stichprobe plus Summen."""
+
+    __slots__ = ('samples', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+def _stack() -> list:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _observe(kind: str, name: str, seconds: float):
+    with _lock:
+        series = _series.get((kind, name))
+        if series is None:
+            series = _series[(kind, name)] = _Series()
+        series.add(seconds)
+
+
+class Timer:
+    """
+    Misst einen Abschnitt; als Kontextmanager oder mit start_timer()/stop().
+
+    Sammelt die Abfragen, Pool-Wartezeit und Dauern verschachtelter
+    Zeitmesser (breakdown je 'Art:Name').
+    """
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.started = time.perf_counter()
+        self.last_activity = self.started
+        self.seconds = None
+        self.rows = None
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.pool_wait = 0.0
+        self.breakdown = defaultdict(float)
+        self.parent = None
+        self.children = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _touch(self):
+        self.last_activity = time.perf_counter()
+
+    def stop(self, rows=None, ended: float = None) -> float:
+        """Beendet die Messung (mehrfacher Aufruf ist unschädlich)."""
+        if self.seconds is not None:
+            return self.seconds
+        ended = max(ended or time.perf_counter(), self.started)
+        # Noch offene innere Zeitmesser (z.B. nach st.stop()) mit abschließen
+        for child in self.children:
+            if child.seconds is None:
+                child.stop(ended=ended)
+        stack = _stack()
+        if self in stack:
+            del stack[stack.index(self):]
+
+        self.seconds = ended - self.started
+        if rows is not None:
+            self.rows = rows
+        if METRICS_ENABLED:
+            _observe(self.kind, self.name, self.seconds)
+        parent = self.parent
+        if parent is not None:
+            parent.queries += self.queries
+            parent.query_seconds += self.query_seconds
+            parent.pool_wait += self.pool_wait
+            if parent.kind != self.kind:
+                parent.breakdown[f'{self.kind}:{self.name}'] += self.seconds
+            parent._touch()
+        if self.kind == 'db' and METRICS_ENABLED:
+            with _lock:
+                _recent_calls.append(self.as_dict())
+        return self.seconds
+
+    def as_dict(self) -> dict:
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'seconds': self.seconds,
+            'rows': self.rows,
+            'queries': self.queries,
+            'query_seconds': self.query_seconds,
+            'pool_wait': self.pool_wait,
+            'at': datetime.now().isoformat(timespec='seconds')
+        }
+
+
+def start_timer(kind: str, name: str) -> Timer:
+    """Startet einen Zeitmesser im aktuellen Thread (innerster Aufruf)."""
+    timer = Timer(kind, name)
+    stack = _stack()
+    if stack:
+        timer.parent = stack[-1]
+        timer.parent.children.append(timer)
+    stack.append(timer)
+    return timer
+
+
+def timer(kind: str, name: str) -> Timer:
+    """Kontextmanager: with metrics.timer('section', 'Daten laden'): ..."""
+    return start_timer(kind, name)
+
+
+def _count_rows(result):
+    """Zeilenzahl eines Ergebnisses (Frame, Liste oder Merge-Zähler)."""
+    if result is None or isinstance(result, (bool, str)):
+        return None
+    if isinstance(result, int):
+        return result
+    if isinstance(result, dict):
+        counts = [result.get(key) for key in ('inserted', 'updated', 'deleted')]
+        return sum(c for c in counts if isinstance(c, int)) if any(counts) else None
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def instrument(kind: str = 'db'):
+    """Dekorator: misst jeden Aufruf der Funktion unter ihrem Namen."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not METRICS_ENABLED:
+                return fn(*args, **kwargs)
+            current = start_timer(kind, fn.__name__)
+            try:
+                result = fn(*args, **kwargs)
+                current.stop(rows=_count_rows(result))
+                return result
+            finally:
+                current.stop()
+        return wrapper
+    return decorate
+
+
+def _normalize_sql(sql) -> str:
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    return re.sub(r'\s+', ' ', str(sql)).strip()[:QUERY_TEXT_LENGTH]
+
+
+def record_query(sql, seconds: float, rows=None) -> dict:
+    """
+    Vermerkt eine ausgeführte Abfrage beim innersten laufenden Aufruf.
+
+    Returns:
+        Der Eintrag (rows kann nach dem Fetch noch gesetzt werden)
+    """
+    if not METRICS_ENABLED:
+        return {}
+    stack = _stack()
+    current = stack[-1] if stack else None
+    entry = {
+        'sql': _normalize_sql(sql),
+        'seconds': seconds,
+        'rows': rows if rows is not None and rows >= 0 else None,
+        'call': current.name if current else None,
+        'at': datetime.now().isoformat(timespec='seconds')
+    }
+    if current is not None:
+        current.queries += 1
+        current.query_seconds += seconds
+        current._touch()
+    # p50/p95 je aufrufender Funktion; Abfragen außerhalb eines Aufrufs nach Befehl
+    _observe('query', entry['call'] or entry['sql'].split(' ', 1)[0].upper() or '?', seconds)
+    with _lock:
+        _totals['queries'] += 1
+        _totals['query_seconds'] += seconds
+        _recent_queries.append(entry)
+    return entry
+
+
+def record_pool_wait(seconds: float):
+    """Vermerkt die Wartezeit auf eine Verbindung (Pool bzw. SQLite-Sperre)."""
+    if not METRICS_ENABLED:
+        return
+    stack = _stack()
+    if stack:
+        stack[-1].pool_wait += seconds
+    _observe('pool', 'wait', seconds)
+    with _lock:
+        _totals['pool_waits'] += 1
+        _totals['pool_wait_seconds'] += seconds
+
+
+def register_gauges(prefix: str, load):
+    """Registriert eine Funktion, deren Zahlenwerte als Gauges exportiert werden."""
+    _gauges[prefix] = load
+
+
+# --- Reruns (Streamlit) ---
+
+def start_rerun(state) -> Timer:
+    """
+    Startet die Messung eines Script-Durchlaufs.
+
+    state ist der Session-State: Ein Rerun, der nicht regulär beendet wurde
+    (st.stop(), st.rerun(), Fehler), wird hier mit dem Zeitpunkt seiner
+    letzten Aktivität abgeschlossen.
+    """
+    previous = state.get(RERUN_STATE_KEY) if hasattr(state, 'get') else None
+    if previous is not None and previous.seconds is None:
+        previous.parent = None
+        _finish(previous, ended=previous.last_activity)
+
+    _local.stack = []
+    rerun = start_timer('rerun', '?')
+    state[RERUN_STATE_KEY] = rerun
+    return rerun
+
+
+def finish_rerun(state, name: str = None):
+    """Beendet den laufenden Rerun (name: z.B. die angezeigte Seite)."""
+    rerun = state.get(RERUN_STATE_KEY) if hasattr(state, 'get') else None
+    if rerun is None or rerun.seconds is not None:
+        return
+    if name:
+        rerun.name = name
+    _finish(rerun)
+
+
+def _finish(rerun: Timer, ended: float = None):
+    rerun.stop(ended=ended)
+    if not METRICS_ENABLED:
+        return
+    record = rerun.as_dict()
+    record['breakdown'] = dict(rerun.breakdown)
+    with _lock:
+        _recent_reruns.append(record)
+    if METRICS_LOG:
+        try:
+            with open(METRICS_LOG, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f"⚠️ Metrik-Log nicht schreibbar: {e}")
+    write_textfile()
+
+
+# --- Auswertung und Export ---
+
+def _quantile(sorted_samples: list, q: float) -> float:
+    """Quantil nach Nearest-Rank."""
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, math.ceil(q * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summary(kind: str = None) -> list:
+    """
+    Kennzahlen je (Art, Name): count, total, max, p50, p95 (Sekunden).
+
+    Returns:
+        Liste von dicts, nach p95 absteigend
+    """
+    with _lock:
+        items = [(key, list(series.samples), series.count, series.total, series.max)
+                 for key, series in _series.items() if kind is None or key[0] == kind]
+    rows = []
+    for (series_kind, name), samples, count, total, maximum in items:
+        samples.sort()
+        rows.append({
+            'kind': series_kind, 'name': name, 'count': count, 'total': total, 'max': maximum,
+            'p50': _quantile(samples, 0.5), 'p95': _quantile(samples, 0.95)
+        })
+    return sorted(rows, key=lambda row: row['p95'], reverse=True)
+
+
+def recent_calls() -> list:
+    with _lock:
+        return list(_recent_calls)
+
+
+def recent_queries() -> list:
+    with _lock:
+        return list(_recent_queries)
+
+
+def recent_reruns() -> list:
+    with _lock:
+        return list(_recent_reruns)
+
+
+def reset():
+    """Verwirft alle Messwerte (z.B. zwischen Benchmark-Läufen)."""
+    with _lock:
+        _series.clear()
+        _recent_calls.clear()
+        _recent_queries.clear()
+        _recent_reruns.clear()
+        _totals.clear()
+
+
+def _label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _gauge_values() -> dict:
+    values = {}
+    for prefix, load in list(_gauges.items()):
+        try:
+            stats = load() or {}
+        except Exception:
+            continue
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[f'kpi_{prefix}_{re.sub(r"[^a-zA-Z0-9_]", "_", key)}'] = value
+    return values
+
+
+def prometheus_text() -> str:
+    """Alle Metriken im Textformat von Prometheus."""
+    lines = [
+        '# HELP kpi_duration_seconds Dauer von Datenbankaufrufen, Abfragen, Reruns und Abschnitten',
+        '# TYPE kpi_duration_seconds summary'
+    ]
+    with _lock:
+        items = sorted((key, sorted(series.samples), series.count, series.total)
+                       for key, series in _series.items())
+        totals = dict(_totals)
+    for (kind, name), samples, count, total in items:
+        labels = f'kind="{_label(kind)}",name="{_label(name)}"'
+        for q in QUANTILES:
+            lines.append(f'kpi_duration_seconds{{{labels},quantile="{q}"}} {_quantile(samples, q):.6f}')
+        lines.append(f'kpi_duration_seconds_sum{{{labels}}} {total:.6f}')
+        lines.append(f'kpi_duration_seconds_count{{{labels}}} {count}')
+
+    for name in ('queries', 'query_seconds', 'pool_waits', 'pool_wait_seconds'):
+        lines.append(f'# TYPE kpi_{name}_total counter')
+        lines.append(f'kpi_{name}_total {totals.get(name, 0)}')
+
+    for name, value in sorted(_gauge_values().items()):
+        lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(force: bool = False):
+    """Schreibt prometheus_text() nach METRICS_TEXTFILE (höchstens alle TEXTFILE_INTERVAL s)."""
+    global _textfile_written
+    if not METRICS_TEXTFILE:
+        return
+    now = time.monotonic()
+    if not force and now - _textfile_written < TEXTFILE_INTERVAL:
+        return
+    _textfile_written = now
+    try:
+        with open(METRICS_TEXTFILE + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        os.replace(METRICS_TEXTFILE + '.tmp', METRICS_TEXTFILE)
+    except OSError as e:
+        print(f"⚠️ Metrik-Datei nicht schreibbar: {e}")
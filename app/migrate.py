@@ -1,107 +1,142 @@
 """
-Migrations-Script: Konvertiert CSV-Dateien zu SQLite
+Migrations-Script: Importiert CSV-Monatsdateien in die KPI-Datenbank
+
+Die Dateien werden parallel in einem Prozess-Pool spaltenweise geparst und
+je Monat in eine Staging-Tabelle geladen (PostgreSQL: COPY, SQLite:
+executemany) und mit einem einzigen INSERT ... ON CONFLICT übernommen. Bereits importierte Dateien (gleicher
+Inhalts-Hash in import_log) werden übersprungen; ein erneuter Lauf ist
+damit idempotent.
+
+Aufruf:
+    python migrate.py [CSV_DIR] [--workers N] [--force]
 """
+import argparse
+import hashlib
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
 import pandas as pd
-from datetime import datetime
 
 # Füge Parent-Verzeichnis zum Path hinzu
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import get_connection, init_database, init_default_standorte
+from database import init_database, build_staging_frame, import_staged_month, get_backend_name
 
-def migrate_csv_to_sqlite(csv_dir: str):
-    """Migriert alle CSV-Dateien zu SQLite."""
-    print("🚀 Starte Migration von CSV zu SQLite...")
-    
-    # Initialisiere Datenbank
-    init_database()
-    init_default_standorte()
-    print("✅ Datenbank initialisiert")
-    
-    # Finde alle CSV-Dateien
-    csv_files = [f for f in os.listdir(csv_dir) if f.endswith('.csv')]
+
+def parse_csv_file(filepath: str) -> dict:
+    """
+    Liest und parst eine Monats-CSV (läuft im Worker-Prozess).
+
+    Returns:
+        dict mit filename, month, content_hash, staged (DB-Spalten), skipped
+    """
+    with open(filepath, 'rb') as f:
+        content = f.read()
+
+    df = pd.read_csv(BytesIO(content), sep=';', dtype=str, encoding='utf-8-sig')
+    staged, skipped = build_staging_frame(df)
+    filename = os.path.basename(filepath)
+    return {
+        'filename': filename,
+        'month': filename.replace('.csv', ''),
+        'content_hash': hashlib.sha256(content).hexdigest(),
+        'staged': staged,
+        'skipped': skipped
+    }
+
+
+def import_parsed_file(parsed: dict, force: bool = False) -> dict:
+    """
+    Übernimmt eine geparste Datei in einer Transaktion.
+
+    Returns:
+        Merge-Zähler bzw. {'already_imported': True}
+    """
+    return import_staged_month(
+        parsed['staged'], parsed['month'], parsed['content_hash'],
+        parsed['filename'], parsed['skipped'], force=force
+    )
+
+
+def import_csv_directory(csv_dir: str, workers: int = None, force: bool = False) -> dict:
+    """Importiert alle CSV-Dateien eines Verzeichnisses in die konfigurierte Datenbank."""
+    print(f"🚀 Starte Import von CSV nach {get_backend_name()}...")
+    started = time.perf_counter()
+
+    csv_files = sorted(
+        os.path.join(csv_dir, f) for f in os.listdir(csv_dir) if f.endswith('.csv')
+    )
     print(f"📁 Gefunden: {len(csv_files)} CSV-Dateien")
-    
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    total_rows = 0
-    
-    for csv_file in sorted(csv_files):
-        month = csv_file.replace('.csv', '')
-        filepath = os.path.join(csv_dir, csv_file)
-        
-        print(f"\n📄 Verarbeite: {csv_file}")
-        
+
+    totals = {'files': 0, 'already_imported': 0, 'failed': 0,
+              'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+    if not csv_files:
+        return totals
+
+    # Parsen parallel im Prozess-Pool – bevor der Connection Pool existiert,
+    # damit Worker keine geerbten DB-Verbindungen halten
+    parsed_files = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {path: executor.submit(parse_csv_file, path) for path in csv_files}
+        for path, future in futures.items():
+            try:
+                parsed_files[path] = future.result()
+            except Exception as e:
+                print(f"  ❌ {os.path.basename(path)}: Fehler beim Lesen: {e}")
+                totals['failed'] += 1
+    print(f"✅ {len(parsed_files)} Dateien geparst ({time.perf_counter() - started:.2f}s)")
+
+    # Schema sicherstellen (führt nur ausstehende Migrationen aus)
+    init_database()
+
+    # Schreiben sequentiell: eine Transaktion (COPY + Merge) pro Monat
+    for path, parsed in parsed_files.items():
+        name = parsed['filename']
         try:
-            df = pd.read_csv(filepath, sep=';')
-            rows_imported = 0
-            
-            for _, row in df.iterrows():
-                try:
-                    # Parse Datum
-                    datum_str = str(row.get('Datum', '')).strip()
-                    if not datum_str or datum_str == 'nan':
-                        continue
-                    
-                    datum = datetime.strptime(datum_str, '%d.%m.%Y').date()
-                    
-                    # Parse numerische Werte
-                    def parse_num(val):
-                        if pd.isna(val) or val == '' or str(val).strip() == '':
-                            return None
-                        try:
-                            return float(str(val).replace(',', '.').replace('€', '').strip())
-                        except:
-                            return None
-                    
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO kpi_data 
-                        (datum, monat, standort, disponent, fahrzeuge, stopps, 
-                         unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        datum,
-                        month,
-                        str(row.get('Standort', '')).strip(),
-                        str(row.get('Disponent', '')).strip() if pd.notna(row.get('Disponent')) else None,
-                        parse_num(row.get('Fahrzeuge')),
-                        parse_num(row.get('Stopps')),
-                        parse_num(row.get('Unverplante Stopps')),
-                        parse_num(row.get('Kosten Fuhrpark')),
-                        parse_num(row.get('Stoppschnitt')),
-                        parse_num(row.get('Stoppkosten'))
-                    ))
-                    rows_imported += 1
-                    
-                except Exception as e:
-                    print(f"  ⚠️ Fehler in Zeile: {e}")
-                    continue
-            
-            print(f"  ✅ {rows_imported} Zeilen importiert")
-            total_rows += rows_imported
-            
+            result = import_parsed_file(parsed, force=force)
         except Exception as e:
-            print(f"  ❌ Fehler beim Lesen: {e}")
+            print(f"  ❌ {name}: {e}")
+            totals['failed'] += 1
             continue
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"\n🎉 Migration abgeschlossen!")
-    print(f"📊 Gesamt: {total_rows} Zeilen in {len(csv_files)} Monaten")
+
+        if result.get('already_imported'):
+            print(f"  ⏭️ {name}: bereits importiert")
+            totals['already_imported'] += 1
+            continue
+
+        totals['files'] += 1
+        totals['skipped'] += parsed['skipped']
+        for key in ('inserted', 'updated', 'unchanged'):
+            totals[key] += result[key]
+        print(f"  ✅ {name}: {result['inserted']} neu, {result['updated']} geändert, "
+              f"{result['unchanged']} unverändert, {parsed['skipped']} übersprungen")
+
+    print(f"\n🎉 Import abgeschlossen in {time.perf_counter() - started:.2f}s!")
+    print(f"📊 Gesamt: {totals['inserted'] + totals['updated']} Zeilen geschrieben "
+          f"aus {totals['files']} Dateien ({totals['already_imported']} übersprungen)")
+    return totals
+
+
+# Früherer Name aus der Zeit vor dem SQLite-Backend
+migrate_csv_to_postgres = import_csv_directory
+
 
 if __name__ == "__main__":
-    # Standard CSV-Verzeichnis
-    csv_dir = os.environ.get('CSV_DIR', '/data/monatsdaten')
-    
+    parser = argparse.ArgumentParser(description="CSV-Monatsdaten in die KPI-Datenbank importieren")
+    parser.add_argument('csv_dir', nargs='?', default=os.environ.get('CSV_DIR', '/data/monatsdaten'))
+    parser.add_argument('--workers', type=int, default=None, help="Anzahl Parser-Prozesse")
+    parser.add_argument('--force', action='store_true', help="Auch bereits importierte Dateien erneut übernehmen")
+    args = parser.parse_args()
+
+    csv_dir = args.csv_dir
     # Fallback für lokales Testing
     if not os.path.exists(csv_dir):
         csv_dir = os.path.join(os.path.dirname(__file__), '..', 'monatsdaten')
-    
+
     if os.path.exists(csv_dir):
-        migrate_csv_to_sqlite(csv_dir)
+        import_csv_directory(csv_dir, workers=args.workers, force=args.force)
     else:
         print(f"❌ CSV-Verzeichnis nicht gefunden: {csv_dir}")
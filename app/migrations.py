@@ -0,0 +1,404 @@
+"""
+Versionierte Schema-Migrationen für das KPI Dashboard (PostgreSQL-Backend)
+
+Jede Migration wird genau einmal pro Datenbank ausgeführt und in der Tabelle
+schema_version vermerkt. Ist das Schema aktuell, kostet der Check eine
+einzige Abfrage pro Prozess – danach gar keine mehr (database.ensure_schema).
+Das SQLite-Backend pflegt dasselbe Schema in backends/sqlite.py.
+
+Migrationen mit transactional=False laufen im Autocommit-Modus, damit
+CREATE INDEX CONCURRENTLY möglich ist (sperrt kpi_data nicht für Schreiber).
+Ein abgebrochener CONCURRENTLY-Build hinterlässt einen ungültigen Index,
+deshalb wird der Index in solchen Migrationen vorher verworfen.
+
+Seit Version 5 ist kpi_data nach Monaten partitioniert (RANGE über datum,
+eine Partition kpi_data_YYYY_MM je Monat). Partitionen legt die Funktion
+kpi_ensure_month_partition() bei Bedarf an; das Backend ruft sie vor jedem
+Schreiben auf. Zeilen ohne passende Partition landen in kpi_data_default
+(Version 6) und werden beim Anlegen der Monatspartition umgezogen.
+
+Version 5 schreibt kpi_data in einer Transaktion komplett um und sperrt die
+Tabelle dabei exklusiv; andere App-Instanzen warten so lange am
+Migrations-Lock. Das Update deshalb in einem Wartungsfenster einspielen
+(bei einigen zehntausend Zeilen wenige Sekunden).
+
+Version 7 indiziert updated_at für inkrementelle Backups ohne Schreibsperre:
+CONCURRENTLY ist auf partitionierten Tabellen nicht möglich, der Index wird
+deshalb je Partition gebaut und an den Index der Elterntabelle gehängt.
+"""
+import time
+
+from database import get_connection, return_connection, DEFAULT_STANDORTE
+
+# Schlüssel für pg_advisory_lock, damit parallel startende Prozesse nicht
+# gleichzeitig migrieren
+MIGRATION_LOCK_ID = 734_201
+LOCK_POLL_INTERVAL = 0.5
+
+MIGRATIONS = [
+    {
+        'version': 1,
+        'name': 'Basistabellen',
+        'transactional': True,
+        'statements': [
+            '''
+            CREATE TABLE IF NOT EXISTS kpi_data (
+                id SERIAL PRIMARY KEY,
+                datum DATE NOT NULL,
+                monat VARCHAR(7) NOT NULL,
+                standort VARCHAR(100) NOT NULL,
+                disponent VARCHAR(100),
+                fahrzeuge INTEGER,
+                stopps INTEGER,
+                unverplante_stopps NUMERIC(10,2),
+                kosten_fuhrpark NUMERIC(10,2),
+                stoppschnitt NUMERIC(10,2),
+                stoppkosten NUMERIC(10,2),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(datum, standort)
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS standorte (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(100) UNIQUE NOT NULL,
+                aktiv BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS disponenten (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(100) UNIQUE NOT NULL,
+                standort_id INTEGER REFERENCES standorte(id),
+                aktiv BOOLEAN DEFAULT TRUE
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username VARCHAR(50) UNIQUE NOT NULL,
+                password_hash VARCHAR(255) NOT NULL,
+                role VARCHAR(20) DEFAULT 'user',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS audit_log (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER,
+                action VARCHAR(50) NOT NULL,
+                table_name VARCHAR(50),
+                record_id INTEGER,
+                old_values TEXT,
+                new_values TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_kpi_datum ON kpi_data(datum)',
+            'CREATE INDEX IF NOT EXISTS idx_kpi_monat ON kpi_data(monat)',
+            'CREATE INDEX IF NOT EXISTS idx_kpi_standort ON kpi_data(standort)'
+        ]
+    },
+    {
+        'version': 2,
+        'name': 'Standard-Standorte',
+        'transactional': True,
+        'statements': [
+            (
+                'INSERT INTO standorte (name) SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING',
+                (DEFAULT_STANDORTE,)
+            )
+        ]
+    },
+    {
+        'version': 3,
+        'name': 'Index für Standort-Zeitreihen (get_range_data)',
+        'transactional': False,
+        'statements': [
+            'DROP INDEX CONCURRENTLY IF EXISTS idx_kpi_standort_datum',
+            'CREATE INDEX CONCURRENTLY idx_kpi_standort_datum ON kpi_data(standort, datum)'
+        ]
+    },
+    {
+        'version': 4,
+        'name': 'Import-Protokoll für CSV-Bulk-Import',
+        'transactional': True,
+        'statements': [
+            '''
+            CREATE TABLE IF NOT EXISTS import_log (
+                content_hash CHAR(64) PRIMARY KEY,
+                filename VARCHAR(255) NOT NULL,
+                monat VARCHAR(7) NOT NULL,
+                rows_staged INTEGER NOT NULL,
+                rows_skipped INTEGER NOT NULL,
+                imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            '''
+        ]
+    },
+    {
+        'version': 5,
+        'name': 'kpi_data monatsweise partitioniert',
+        'transactional': True,
+        'statements': [
+            # Legt die Partition des Monats an, falls sie fehlt. Existiert sie
+            # bereits, kostet der Aufruf nur einen Katalog-Lookup (keine Sperre).
+            '''
+            CREATE OR REPLACE FUNCTION kpi_ensure_month_partition(tag DATE) RETURNS VOID AS $$
+            DECLARE
+                von DATE := date_trunc('month', tag)::date;
+                partition TEXT := 'kpi_data_' || to_char(von, 'YYYY_MM');
+            BEGIN
+                IF to_regclass(partition) IS NULL THEN
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF kpi_data FOR VALUES FROM (%L) TO (%L)',
+                        partition, von, (von + interval '1 month')::date
+                    );
+                END IF;
+            EXCEPTION WHEN duplicate_table OR unique_violation THEN
+                NULL;  -- parallel von einer anderen Verbindung angelegt
+            END;
+            $$ LANGUAGE plpgsql
+            ''',
+            'ALTER TABLE kpi_data RENAME TO kpi_data_alt',
+            'ALTER INDEX kpi_data_pkey RENAME TO kpi_data_alt_pkey',
+            'ALTER INDEX kpi_data_datum_standort_key RENAME TO kpi_data_alt_datum_standort_key',
+            'DROP INDEX IF EXISTS idx_kpi_datum',
+            'DROP INDEX IF EXISTS idx_kpi_monat',
+            'DROP INDEX IF EXISTS idx_kpi_standort',
+            'DROP INDEX IF EXISTS idx_kpi_standort_datum',
+            # Die id-Sequenz überlebt das Verwerfen der alten Tabelle
+            'ALTER SEQUENCE kpi_data_id_seq OWNED BY NONE',
+            '''
+            CREATE TABLE kpi_data (
+                id INTEGER NOT NULL DEFAULT nextval('kpi_data_id_seq'),
+                datum DATE NOT NULL,
+                monat VARCHAR(7) NOT NULL,
+                standort VARCHAR(100) NOT NULL,
+                disponent VARCHAR(100),
+                fahrzeuge INTEGER,
+                stopps INTEGER,
+                unverplante_stopps NUMERIC(10,2),
+                kosten_fuhrpark NUMERIC(10,2),
+                stoppschnitt NUMERIC(10,2),
+                stoppkosten NUMERIC(10,2),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, datum),
+                UNIQUE (datum, standort)
+            ) PARTITION BY RANGE (datum)
+            ''',
+            'ALTER SEQUENCE kpi_data_id_seq OWNED BY kpi_data.id',
+            '''
+            SELECT kpi_ensure_month_partition(m)
+            FROM (SELECT DISTINCT date_trunc('month', datum)::date FROM kpi_data_alt) AS months(m)
+            ''',
+            # monat wird dabei aus dem Datum abgeleitet: Monatsabfragen grenzen
+            # zusätzlich über datum ein, damit nur eine Partition gelesen wird
+            '''
+            INSERT INTO kpi_data
+            (id, datum, monat, standort, disponent, fahrzeuge, stopps, unverplante_stopps,
+             kosten_fuhrpark, stoppschnitt, stoppkosten, created_at, updated_at)
+            SELECT id, datum, to_char(datum, 'YYYY-MM'), standort, disponent, fahrzeuge, stopps,
+                   unverplante_stopps, kosten_fuhrpark, stoppschnitt, stoppkosten,
+                   created_at, updated_at
+            FROM kpi_data_alt
+            ''',
+            'DROP TABLE kpi_data_alt',
+            # Deckt Monatsabfragen und den Versionsstempel (MAX(updated_at)) ab
+            '''
+            CREATE INDEX idx_kpi_monat_standort_datum
+            ON kpi_data(monat, standort, datum) INCLUDE (updated_at)
+            ''',
+            'CREATE INDEX idx_kpi_standort_datum ON kpi_data(standort, datum)',
+            'ANALYZE kpi_data'
+        ]
+    },
+    {
+        'version': 6,
+        'name': 'DEFAULT-Partition für kpi_data',
+        'transactional': True,
+        'statements': [
+            # Auffangpartition: Schreibpfade ohne kpi_ensure_month_partition()
+            # scheitern nicht mehr. Wird die Monatspartition später angelegt,
+            # zieht die Funktion die Zeilen des Monats aus der DEFAULT-Partition um.
+            'CREATE TABLE IF NOT EXISTS kpi_data_default PARTITION OF kpi_data DEFAULT',
+            '''
+            CREATE OR REPLACE FUNCTION kpi_ensure_month_partition(tag DATE) RETURNS VOID AS $$
+            DECLARE
+                von DATE := date_trunc('month', tag)::date;
+                bis DATE := (date_trunc('month', tag) + interval '1 month')::date;
+                partition TEXT := 'kpi_data_' || to_char(von, 'YYYY_MM');
+            BEGIN
+                IF to_regclass(partition) IS NOT NULL THEN
+                    RETURN;
+                END IF;
+                IF EXISTS (SELECT 1 FROM kpi_data_default WHERE datum >= von AND datum < bis) THEN
+                    EXECUTE format('CREATE TABLE %I (LIKE kpi_data INCLUDING DEFAULTS)', partition);
+                    EXECUTE format(
+                        'WITH moved AS (DELETE FROM kpi_data_default WHERE datum >= %L AND datum < %L RETURNING *) '
+                        'INSERT INTO %I SELECT * FROM moved',
+                        von, bis, partition
+                    );
+                    EXECUTE format(
+                        'ALTER TABLE kpi_data ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                        partition, von, bis
+                    );
+                ELSE
+                    EXECUTE format(
+                        'CREATE TABLE IF NOT EXISTS %I PARTITION OF kpi_data FOR VALUES FROM (%L) TO (%L)',
+                        partition, von, bis
+                    );
+                END IF;
+            EXCEPTION WHEN duplicate_table OR unique_violation THEN
+                NULL;  -- parallel von einer anderen Verbindung angelegt
+            END;
+            $$ LANGUAGE plpgsql
+            ''',
+            # Bereits dort gelandete Zeilen in ihre Monatspartitionen verschieben
+            '''
+            SELECT kpi_ensure_month_partition(m)
+            FROM (SELECT DISTINCT date_trunc('month', datum)::date FROM kpi_data_default) AS months(m)
+            '''
+        ]
+    },
+    {
+        'version': 7,
+        'name': 'Index auf kpi_data.updated_at (inkrementelle Backups)',
+        'transactional': False,
+        'statements': [
+            # Partitionierte Tabellen kennen kein CONCURRENTLY: Index zunächst nur
+            # auf der Elterntabelle (ungültig), dann je Partition ohne Schreibsperre
+            # bauen und anhängen; mit der letzten Partition wird er gültig.
+            'DROP INDEX IF EXISTS idx_kpi_updated_at',
+            'CREATE INDEX idx_kpi_updated_at ON ONLY kpi_data(updated_at)',
+            lambda cursor: _index_partitions_concurrently(cursor, 'idx_kpi_updated_at', 'updated_at')
+        ]
+    }
+]
+
+LATEST_VERSION = max(m['version'] for m in MIGRATIONS)
+
+def _execute(cursor, statement):
+    """Führt ein Statement aus (SQL-String, (SQL, Parameter)-Tupel oder Funktion cursor -> None)."""
+    if callable(statement):
+        statement(cursor)
+    elif isinstance(statement, tuple):
+        cursor.execute(*statement)
+    else:
+        cursor.execute(statement)
+
+
+def _index_partitions_concurrently(cursor, parent_index: str, column: str):
+    """
+    Baut einen Index je Partition von kpi_data mit CREATE INDEX CONCURRENTLY
+    und hängt ihn an den Index der Elterntabelle (nur im Autocommit-Modus).
+    """
+    cursor.execute('''
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'kpi_data'::regclass
+        ORDER BY c.relname
+    ''')
+    for (partition,) in cursor.fetchall():
+        index = f'{partition}_{column}_idx'
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {index}')
+        cursor.execute(f'CREATE INDEX CONCURRENTLY {index} ON {partition}({column})')
+        cursor.execute(f'ALTER INDEX {parent_index} ATTACH PARTITION {index}')
+
+
+def get_schema_version(cursor) -> int:
+    """Gibt die höchste angewendete Version zurück (0 ohne schema_version)."""
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return cursor.fetchone()[0]
+
+
+def _apply(conn, migration):
+    """Wendet eine Migration an und vermerkt sie in schema_version."""
+    cursor = conn.cursor()
+    if migration['transactional']:
+        for statement in migration['statements']:
+            _execute(cursor, statement)
+        cursor.execute(
+            'INSERT INTO schema_version (version, name) VALUES (%s, %s)',
+            (migration['version'], migration['name'])
+        )
+        conn.commit()
+        return
+
+    conn.autocommit = True
+    try:
+        for statement in migration['statements']:
+            _execute(cursor, statement)
+        cursor.execute(
+            'INSERT INTO schema_version (version, name) VALUES (%s, %s)',
+            (migration['version'], migration['name'])
+        )
+    finally:
+        conn.autocommit = False
+
+
+def run_migrations() -> list:
+    """
+    Wendet alle ausstehenden Migrationen an.
+
+    Returns:
+        Liste der angewendeten Versionen (leer, wenn das Schema aktuell ist)
+    """
+    conn = get_connection()
+    applied = []
+    try:
+        cursor = conn.cursor()
+        if get_schema_version(cursor) >= LATEST_VERSION:
+            conn.commit()
+            return applied
+
+        # Session-Lock per Polling: ein blockierendes pg_advisory_lock() wäre eine
+        # offene Transaktion, auf die CREATE INDEX CONCURRENTLY warten würde
+        conn.commit()
+        conn.autocommit = True
+        while True:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', (MIGRATION_LOCK_ID,))
+            if cursor.fetchone()[0]:
+                break
+            time.sleep(LOCK_POLL_INTERVAL)
+        conn.autocommit = False
+        try:
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(200) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+
+            # Nach dem Lock erneut prüfen – ein anderer Prozess war evtl. schneller
+            current = get_schema_version(cursor)
+            conn.commit()
+            for migration in MIGRATIONS:
+                if migration['version'] <= current:
+                    continue
+                print(f"🛠️ Migration {migration['version']}: {migration['name']}")
+                _apply(conn, migration)
+                applied.append(migration['version'])
+        finally:
+            conn.rollback()
+            conn.autocommit = True
+            cursor.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_ID,))
+            conn.autocommit = False
+        return applied
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Fehler bei Datenbank-Migration: {e}")
+        raise
+    finally:
+        return_connection(conn)
+
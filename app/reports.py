@@ -0,0 +1,41 @@
+"""
+Auswertungen für die Report-Seiten (Wochen- und Monatsvergleich)
+
+Die Aggregation läuft in der Datenbank; hier werden nur die wenigen
+Ergebniszeilen für die Anzeige zusammengestellt.
+"""
+import pandas as pd
+
+from database import get_weekly_aggregates, get_monthly_aggregates
+
+# KPIs im Monatsvergleich
+MONTH_COMPARISON_KPIS = ['Fahrzeuge', 'Stopps', 'Stoppschnitt', 'Stoppkosten']
+
+
+def compare_weeks(month: str) -> pd.DataFrame:
+    """Vergleicht KPIs wochenweise (ISO-KW) inkl. Deltas zur Vorwoche."""
+    return get_weekly_aggregates(month)
+
+
+def compare_months(month1: str, month2: str) -> pd.DataFrame:
+    """
+    Stellt die Monatswerte zweier Monate gegenüber.
+
+    Gibt einen Frame mit den Spalten KPI, month1, month2, Delta und Delta %
+    zurück; leer, wenn einer der Monate keine Daten hat.
+    """
+    monthly = get_monthly_aggregates([month1, month2]).set_index('Monat')
+    if month1 not in monthly.index or month2 not in monthly.index:
+        return pd.DataFrame()
+
+    values1 = monthly.loc[month1, MONTH_COMPARISON_KPIS].astype(float)
+    values2 = monthly.loc[month2, MONTH_COMPARISON_KPIS].astype(float)
+    comparison = pd.DataFrame({
+        'KPI': MONTH_COMPARISON_KPIS,
+        month1: values1.to_numpy(),
+        month2: values2.to_numpy()
+    })
+    comparison['Delta'] = (values2 - values1).to_numpy()
+    pct = ((values2 / values1 - 1) * 100).replace([float('inf'), float('-inf')], float('nan'))
+    comparison['Delta %'] = pct.round(1).to_numpy()
+    return comparison
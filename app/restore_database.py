@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Restore-Script: Spielt einen Dump von dump_database.py zurück in PostgreSQL
+(nur PostgreSQL-Backend)
+
+Vollständiger Restore: Jede Tabelle wird in einer eigenen Transaktion geleert
+(TRUNCATE), ihre Indizes werden verworfen, die Chunks per COPY ... FREEZE
+geladen und die Indizes danach in einem Durchgang neu aufgebaut. Die
+partitionierte Tabelle kpi_data lädt über eine Staging-Tabelle, weil COPY
+FREEZE dort nicht möglich ist; fehlende Monatspartitionen werden angelegt. Unabhängige
+Tabellen laufen parallel auf eigenen Verbindungen; standorte und disponenten
+(Fremdschlüssel) gemeinsam in einer Transaktion.
+
+Teil-Restore (--month / --standort): Nur die passenden KPI-Zeilen werden über
+eine Staging-Tabelle ersetzt, alle übrigen Daten bleiben unverändert. Schon
+beim Lesen wird gefiltert; Chunks außerhalb des Monats (Datumsbereich im
+Manifest) werden gar nicht gelesen.
+
+Die SHA-256-Prüfsummen aus manifest.json werden beim Lesen mitgeprüft; bei
+Abweichung wird die Transaktion der Tabelle zurückgerollt.
+
+Aufruf:
+    python restore_database.py DUMP_DIR [--workers N] [--tables T ...]
+    python restore_database.py DUMP_DIR --month 2025-01 [--standort Berlin ...]
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Füge Parent-Verzeichnis zum Path hinzu
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backends.postgres import MONTH_FILTER, month_params
+from database import get_connection, return_connection
+from dump_database import read_manifest, require_postgres
+
+# Arbeitsspeicher für den Index-Neuaufbau (nur innerhalb der Restore-Transaktion)
+MAINTENANCE_WORK_MEM = os.environ.get('RESTORE_MAINTENANCE_WORK_MEM', '256MB')
+
+# Restore-Gruppen: Tabellen einer Gruppe teilen sich eine Transaktion
+# (Reihenfolge = Ladereihenfolge), Gruppen laufen parallel.
+RESTORE_GROUPS = [
+    ['kpi_data'],
+    ['audit_log'],
+    ['standorte', 'disponenten']
+]
+
+# users wird ohne Passwort-Hashes gesichert und kann daher nicht zurückgespielt werden
+SKIPPED_TABLES = {'users': 'Dump enthält keine Passwort-Hashes'}
+
+
+class ChecksumReader:
+    """
+    Liest einen gzip-Chunk für COPY FROM und bildet dabei die SHA-256-Prüfsumme.
+
+    Der CSV-Header steht in jedem Chunk, zählt aber nicht zur Prüfsumme.
+    """
+
+    def __init__(self, path: str, has_header: bool):
+        self._file = gzip.open(path, 'rb')
+        self._hash = hashlib.sha256()
+        self._pending = self._file.readline() if has_header else b''
+
+    def read(self, size: int = -1) -> bytes:
+        if self._pending:
+            data, self._pending = self._pending, b''
+            return data
+        data = self._file.read(size)
+        self._hash.update(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        if self._pending:
+            return self.read()
+        data = self._file.readline(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+
+class RecordStream:
+    """
+    Dateiähnliche Quelle für COPY FROM: read() wird aus einem Generator von
+    CSV-Zeilen (bytes) gefüllt, der Speicherbedarf bleibt konstant.
+    """
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class NDJSONReader(RecordStream):
+    """
+    Übersetzt einen NDJSON-Chunk zeilenweise nach CSV, während COPY liest.
+
+    Jeder Wert außer null wird in Anführungszeichen gesetzt: COPY liest ein
+    unquotiertes leeres Feld als NULL, "" dagegen als leeren Text. Mit subset
+    werden nur die Zeilen der Auswahl übernommen.
+    """
+
+    def __init__(self, reader: ChecksumReader, columns: list, subset: 'KPISubset' = None):
+        super().__init__(self._convert(reader, columns, subset))
+
+    @staticmethod
+    def _field(value) -> str:
+        if value is None:
+            return ''
+        return '"' + str(value).replace('"', '""') + '"'
+
+    def _convert(self, reader: ChecksumReader, columns: list, subset):
+        for line in iter(reader.readline, b''):
+            record = json.loads(line)
+            if subset is not None and not subset.includes(record.get('datum'), record.get('standort')):
+                continue
+            yield (','.join(self._field(record.get(column)) for column in columns) + '\n').encode('utf-8')
+
+
+class FilteredCSVReader(RecordStream):
+    """
+    Reicht von einem CSV-Chunk nur den Header und die Datensätze der Auswahl
+    unverändert an COPY weiter (NULL/leerer Text bleiben exakt erhalten).
+    """
+
+    def __init__(self, reader: ChecksumReader, subset: 'KPISubset'):
+        super().__init__(self._filter(reader, subset))
+
+    @staticmethod
+    def _records(reader: ChecksumReader):
+        """Vollständige CSV-Datensätze (Zeilenumbrüche in Anführungszeichen bleiben zusammen)."""
+        record = b''
+        for line in iter(reader.readline, b''):
+            record += line
+            if record.count(b'"') % 2 == 0:
+                yield record
+                record = b''
+        if record:
+            yield record
+
+    def _filter(self, reader: ChecksumReader, subset):
+        records = self._records(reader)
+        header = next(records, None)
+        if header is None:
+            return
+        yield header
+        names = next(csv.reader([header.decode('utf-8')]))
+        datum, standort = names.index('datum'), names.index('standort')
+        for record in records:
+            fields = next(csv.reader([record.decode('utf-8')]))
+            if subset.includes(fields[datum], fields[standort]):
+                yield record
+
+
+class KPISubset:
+    """Auswahl eines Teil-Restores (Monat und/oder Standorte), geprüft beim Lesen der Chunks."""
+
+    def __init__(self, month: str = None, standorte: list = None):
+        self.month = month
+        self.standorte = set(standorte) if standorte else None
+        if month:
+            _, start, end = month_params(month)
+            self.start, self.end = start.isoformat(), end.isoformat()
+        else:
+            self.start = self.end = None
+
+    def includes_chunk(self, chunk: dict) -> bool:
+        """False, wenn der Datumsbereich des Chunks (Manifest 'range') außerhalb des Monats liegt."""
+        if self.start is None or 'range' not in chunk:
+            return True
+        first, last = chunk['range']
+        return first[:10] < self.end and last[:10] >= self.start
+
+    def includes(self, datum, standort) -> bool:
+        if self.start is not None and not (datum and self.start <= str(datum)[:10] < self.end):
+            return False
+        return self.standorte is None or standort in self.standorte
+
+    def where(self) -> tuple:
+        """WHERE-Bedingung für kpi_data (mit Datumsgrenzen für die Partitionsauswahl) und Parameter."""
+        conditions, params = [], []
+        if self.month:
+            conditions.append(MONTH_FILTER)
+            params.extend(month_params(self.month))
+        if self.standorte:
+            conditions.append('standort = ANY(%s)')
+            params.append(sorted(self.standorte))
+        return ' AND '.join(conditions), params
+
+
+def _verify(reader: ChecksumReader, chunk: dict):
+    if reader.hexdigest() != chunk['sha256']:
+        raise ValueError(f"Prüfsumme von {chunk['file']} stimmt nicht")
+
+
+def copy_chunks(cursor, dump_dir: str, manifest: dict, table: str, target: str,
+                freeze: bool = False, subset: KPISubset = None) -> int:
+    """
+    Lädt alle Chunks einer Tabelle per COPY in target.
+
+    Mit subset (nur kpi_data) werden Chunks außerhalb des Monats übersprungen
+    und von den übrigen nur die passenden Zeilen geladen.
+
+    Returns:
+        Anzahl gelesener Zeilen (ohne übersprungene Chunks)
+    """
+    entry = manifest['tables'][table]
+    columns = ', '.join(entry['columns'])
+    options = 'FORMAT csv, HEADER true' if manifest['format'] == 'csv' else 'FORMAT csv'
+    if freeze:
+        options += ', FREEZE true'
+    statement = f"COPY {target} ({columns}) FROM STDIN WITH ({options})"
+
+    rows = 0
+    for chunk in entry['chunks']:
+        if subset is not None and not subset.includes_chunk(chunk):
+            continue
+        rows += chunk['rows']
+        path = os.path.join(dump_dir, chunk['file'])
+        if manifest['format'] == 'csv':
+            reader = ChecksumReader(path, has_header=True)
+            try:
+                cursor.copy_expert(statement, reader if subset is None else FilteredCSVReader(reader, subset))
+                _verify(reader, chunk)
+            finally:
+                reader.close()
+        else:
+            # NDJSON zeilenweise nach CSV übersetzen (exakte Werte, ohne Typ-Inferenz)
+            reader = ChecksumReader(path, has_header=False)
+            try:
+                cursor.copy_expert(statement, NDJSONReader(reader, entry['columns'], subset))
+                _verify(reader, chunk)
+            finally:
+                reader.close()
+    return rows
+
+
+def drop_indexes(cursor, table: str) -> list:
+    """
+    Verwirft alle Indizes einer Tabelle, die nicht von Fremdschlüsseln
+    benötigt werden, und gibt die Statements für den Neuaufbau zurück.
+    """
+    cursor.execute('''
+        SELECT con.conname, pg_get_constraintdef(con.oid)
+        FROM pg_constraint con
+        WHERE con.conrelid = %s::regclass
+          AND con.contype IN ('p', 'u')
+          AND NOT EXISTS (
+              SELECT 1 FROM pg_constraint fk
+              WHERE fk.contype = 'f' AND fk.conindid = con.conindid
+          )
+    ''', (table,))
+    constraints = cursor.fetchall()
+
+    cursor.execute('''
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = x.indexrelid)
+    ''', (table,))
+    indexes = cursor.fetchall()
+
+    rebuild = []
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+        rebuild.append(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+    for name, definition in indexes:
+        cursor.execute(f'DROP INDEX {name}')
+        # Indizes partitionierter Tabellen meldet Postgres als "ON ONLY"
+        rebuild.append(definition.replace(' ON ONLY ', ' ON ', 1))
+    return rebuild
+
+
+def is_partitioned(cursor, table: str) -> bool:
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", (table,))
+    return cursor.fetchone()[0]
+
+
+def ensure_partitions(cursor, source: str, where: str = 'true', params=()):
+    """Legt die Monatspartitionen von kpi_data für alle Daten in source an."""
+    cursor.execute(f'''
+        SELECT kpi_ensure_month_partition(m)
+        FROM (SELECT DISTINCT date_trunc('month', datum)::date FROM {source} WHERE {where}) AS months(m)
+    ''', params)
+
+
+def _select_expression(column: str) -> str:
+    """monat folgt dem Datum, damit jede Zeile in der Partition ihres Monats liegt."""
+    return "to_char(datum, 'YYYY-MM')" if column == 'monat' else column
+
+
+def copy_partitioned(cursor, dump_dir: str, manifest: dict, table: str) -> int:
+    """Lädt kpi_data über eine Staging-Tabelle in die Monatspartitionen."""
+    cursor.execute(f'''
+        CREATE TEMP TABLE {table}_restore (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP
+    ''')
+    loaded = copy_chunks(cursor, dump_dir, manifest, table, f'{table}_restore')
+    ensure_partitions(cursor, f'{table}_restore')
+    columns = manifest['tables'][table]['columns']
+    cursor.execute(f'''
+        INSERT INTO {table} ({', '.join(columns)})
+        SELECT {', '.join(_select_expression(column) for column in columns)} FROM {table}_restore
+    ''')
+    return loaded
+
+
+def reset_sequence(cursor, table: str):
+    """Setzt die id-Sequenz hinter den höchsten geladenen Wert."""
+    cursor.execute(f'''
+        SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL)
+        FROM {table}
+    ''', (table,))
+
+
+def restore_group(dump_dir: str, manifest: dict, tables: list) -> dict:
+    """
+    Spielt eine Gruppe von Tabellen vollständig zurück (eine Transaktion).
+
+    Returns:
+        {Tabelle: geladene Zeilen}
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SET LOCAL maintenance_work_mem = %s', (MAINTENANCE_WORK_MEM,))
+        cursor.execute(f"TRUNCATE {', '.join(tables)}")
+
+        loaded = {}
+        for table in tables:
+            started = time.perf_counter()
+            rebuild = drop_indexes(cursor, table)
+            if is_partitioned(cursor, table):
+                loaded[table] = copy_partitioned(cursor, dump_dir, manifest, table)
+            else:
+                loaded[table] = copy_chunks(cursor, dump_dir, manifest, table, table, freeze=True)
+            for statement in rebuild:
+                cursor.execute(statement)
+            reset_sequence(cursor, table)
+            sys.stdout.write(f"✓ {table}: {loaded[table]} Zeilen, {len(rebuild)} Index(e) "
+                             f"neu aufgebaut ({time.perf_counter() - started:.2f}s)\n")
+
+        conn.commit()
+        return loaded
+
+    except Exception as e:
+        conn.rollback()
+        raise
+    finally:
+        return_connection(conn)
+
+
+def restore_kpi_subset(dump_dir: str, manifest: dict, month: str = None, standorte: list = None) -> dict:
+    """
+    Ersetzt die KPI-Zeilen eines Monats und/oder Standorts durch den Stand im Dump.
+
+    Gefiltert wird schon beim Lesen der Chunks: Chunks außerhalb des Monats
+    werden übersprungen, in die Staging-Tabelle kommen nur die passenden
+    Zeilen. Die Restore-Dauer hängt damit vom Monat ab, nicht von der Historie.
+    updated_at wird auf den Restore-Zeitpunkt gesetzt, damit Caches und
+    inkrementelle Backups die zurückgespielten Zeilen als geändert erkennen.
+
+    Returns:
+        {'deleted': n, 'restored': n, 'scanned': n}
+    """
+    subset = KPISubset(month, standorte)
+    where, params = subset.where()
+
+    columns = manifest['tables']['kpi_data']['columns']
+    insert_columns = ', '.join(columns)
+    select_columns = ', '.join(
+        'CURRENT_TIMESTAMP' if column == 'updated_at' else _select_expression(column)
+        for column in columns
+    )
+
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TEMP TABLE kpi_restore (LIKE kpi_data INCLUDING DEFAULTS) ON COMMIT DROP
+        ''')
+        scanned = copy_chunks(cursor, dump_dir, manifest, 'kpi_data', 'kpi_restore', subset=subset)
+
+        cursor.execute(f'DELETE FROM kpi_data WHERE {where}', params)
+        deleted = cursor.rowcount
+        ensure_partitions(cursor, 'kpi_restore')
+        cursor.execute(f'''
+            INSERT INTO kpi_data ({insert_columns})
+            SELECT {select_columns} FROM kpi_restore
+        ''')
+        restored = cursor.rowcount
+        reset_sequence(cursor, 'kpi_data')
+
+        conn.commit()
+        return {'deleted': deleted, 'restored': restored, 'scanned': scanned}
+
+    except Exception as e:
+        conn.rollback()
+        raise
+    finally:
+        return_connection(conn)
+
+
+def restore_database(dump_dir: str, workers: int = 3, tables: list = None,
+                     month: str = None, standorte: list = None) -> dict:
+    """
+    Spielt einen Full-Dump oder Snapshot zurück.
+
+    Args:
+        dump_dir: Dump-Verzeichnis mit manifest.json
+        workers: parallel geladene Tabellengruppen
+        tables: optional nur diese Tabellen (vollständiger Restore)
+        month / standorte: Teil-Restore der KPI-Daten
+
+    Returns:
+        Ergebnis je Tabelle bzw. Teil-Restore-Zähler
+    """
+    require_postgres()
+    manifest = read_manifest(dump_dir)
+    if manifest['kind'] == 'incremental':
+        raise ValueError("Inkrementelle Dumps zuerst mit 'dump_database.py --merge' zusammenführen")
+
+    started = time.perf_counter()
+    print(f"=== Restore aus {dump_dir} ({manifest['kind']}, {manifest['format']}) ===")
+
+    if month or standorte:
+        result = restore_kpi_subset(dump_dir, manifest, month, standorte)
+        print(f"✅ {result['restored']} KPI-Zeilen wiederhergestellt, "
+              f"{result['deleted']} ersetzt, {result['scanned']} gelesen "
+              f"({time.perf_counter() - started:.2f}s)")
+        return result
+
+    wanted = set(tables or manifest['tables'])
+    for table in sorted(wanted & set(SKIPPED_TABLES)):
+        print(f"⏭️ {table}: übersprungen ({SKIPPED_TABLES[table]})")
+
+    groups = []
+    for group in RESTORE_GROUPS:
+        selected = [table for table in group if table in wanted and table in manifest['tables']]
+        if selected:
+            groups.append(selected)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups) or 1))) as executor:
+        futures = [executor.submit(restore_group, dump_dir, manifest, group) for group in groups]
+        result = {}
+        for future in futures:
+            result.update(future.result())
+
+    print(f"\n✅ Restore abgeschlossen: {sum(result.values())} Zeilen in "
+          f"{time.perf_counter() - started:.2f}s")
+    print("ℹ️ Bitte einen neuen Full-Dump erstellen – bestehende Inkremente passen nicht mehr.")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="KPI-Datenbank aus einem Dump wiederherstellen")
+    parser.add_argument('dump_dir', help="Dump- oder Snapshot-Verzeichnis mit manifest.json")
+    parser.add_argument('--workers', type=int, default=3, help="Parallel geladene Tabellengruppen")
+    parser.add_argument('--tables', nargs='+', help="Nur diese Tabellen vollständig wiederherstellen")
+    parser.add_argument('--month', help="Nur KPI-Daten dieses Monats (YYYY-MM)")
+    parser.add_argument('--standort', nargs='+', help="Nur KPI-Daten dieser Standorte")
+    args = parser.parse_args()
+
+    restore_database(args.dump_dir, args.workers, args.tables, args.month, args.standort)
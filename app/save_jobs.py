@@ -0,0 +1,169 @@
+"""
+Speichern im Hintergrund für die Eingabemaske
+
+Speichervorgänge laufen in einem kleinen Worker-Pool statt im
+Streamlit-Script: submit_save() gibt sofort einen Job zurück, die App zeigt
+Fortschritt und Ergebnis bei den folgenden Reruns an.
+
+Je (Session, Monat) läuft höchstens ein Job gleichzeitig. Ein weiterer
+Speichervorgang, solange der vorige noch wartet, wird mit ihm
+zusammengelegt (der neueste Editor-Stand gewinnt); läuft der vorige bereits,
+startet der neue erst nach dessen Ende. Die Änderungen werden immer
+gegenüber dem zuletzt geladenen Stand berechnet, daher bleibt das Ergebnis
+auch bei mehrfachem Speichern derselben Änderungen gleich.
+
+Mit aktivierter Write-Ahead-Queue (write_queue.py) werden die Änderungen
+zuerst lokal gesichert; ist die Datenbank nicht erreichbar, endet der Job
+mit result['queued'] > 0 und die Queue trägt sie später nach.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import write_queue
+from database import save_month_changes
+
+SAVE_WORKERS = int(os.environ.get('SAVE_WORKERS', '2'))
+JOB_RETENTION = 3600  # Sekunden, die abgeschlossene Jobs abrufbar bleiben
+
+_lock = threading.Lock()
+_executor = None
+_jobs = {}         # Job-ID -> SaveJob
+_latest = {}       # (Session, Monat) -> zuletzt eingereichter Job
+_key_locks = {}    # (Session, Monat) -> Lock, serialisiert die Ausführung
+
+
+class SaveJob:
+    """Handle eines Speichervorgangs (Status, Fortschritt, Ergebnis)."""
+
+    def __init__(self, session_id: str, month: str, original_df, edited_df):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.month = month
+        self.original_df = original_df
+        self.edited_df = edited_df
+        self.status = 'queued'  # queued, running, done, failed
+        self.progress = 0.0
+        self.message = 'Wartet …'
+        self.result = None
+        self.error = None
+        self.coalesced = 0
+        self.submitted_at = time.time()
+        self.finished_at = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def _update(self, progress: float, message: str):
+        self.progress = progress
+        self.message = message
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SAVE_WORKERS, thread_name_prefix='save')
+        return _executor
+
+
+def _prune():
+    """Entfernt abgeschlossene Jobs nach JOB_RETENTION (Aufruf unter _lock)."""
+    cutoff = time.time() - JOB_RETENTION
+    for job_id, job in list(_jobs.items()):
+        if job.finished and job.finished_at < cutoff:
+            _remove(job)
+
+
+def _remove(job: SaveJob):
+    """Entfernt einen abgeschlossenen Job samt Schlüsseleinträgen (Aufruf unter _lock)."""
+    del _jobs[job.id]
+    key = (job.session_id, job.month)
+    if _latest.get(key) is job:
+        del _latest[key]
+        _key_locks.pop(key, None)
+
+
+def submit_save(session_id: str, month: str, original_df, edited_df) -> SaveJob:
+    """
+    Reicht einen Speichervorgang ein und kehrt sofort zurück.
+
+    Wartet für (session_id, month) noch ein Job, wird er mit dem neuen
+    Editor-Stand zusammengelegt und zurückgegeben.
+    """
+    key = (session_id, month)
+    with _lock:
+        _prune()
+        waiting = _latest.get(key)
+        if waiting is not None and waiting.status == 'queued':
+            # Ausgangsstand des wartenden Jobs bleibt, nur die Eingaben werden ersetzt
+            waiting.edited_df = edited_df
+            waiting.coalesced += 1
+            return waiting
+
+        job = SaveJob(session_id, month, original_df, edited_df)
+        _jobs[job.id] = job
+        _latest[key] = job
+        _key_locks.setdefault(key, threading.Lock())
+
+    _get_executor().submit(_run, job)
+    return job
+
+
+def _run(job: SaveJob):
+    with _key_locks[(job.session_id, job.month)]:
+        with _lock:
+            job.status = 'running'
+            original_df, edited_df = job.original_df, job.edited_df
+        job._update(0.1, 'Änderungen werden ermittelt …')
+        try:
+            save = write_queue.save_month_changes if write_queue.SAVE_QUEUE_ENABLED else save_month_changes
+            job.result = save(job.month, original_df, edited_df, progress=job._update)
+            job.status = 'done'
+            job._update(1.0, 'Gespeichert')
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+            job._update(1.0, 'Fehler beim Speichern')
+        finally:
+            job.finished_at = time.time()
+            # Frames nicht länger als nötig im Speicher halten
+            job.original_df = job.edited_df = None
+
+
+def get_job(job_id: str):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def session_jobs(session_id: str) -> list:
+    """Jobs einer Session, älteste zuerst."""
+    with _lock:
+        jobs = [job for job in _jobs.values() if job.session_id == session_id]
+    return sorted(jobs, key=lambda job: job.submitted_at)
+
+
+def discard(job_id: str):
+    """Entfernt einen abgeschlossenen Job (Ergebnis wurde angezeigt)."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is not None and job.finished:
+            _remove(job)
+
+
+def stats() -> dict:
+    with _lock:
+        jobs = list(_jobs.values())
+    return {
+        'queued': sum(job.status == 'queued' for job in jobs),
+        'running': sum(job.status == 'running' for job in jobs),
+        'failed': sum(job.status == 'failed' for job in jobs),
+        'workers': SAVE_WORKERS
+    }
+
+
+metrics.register_gauges('save_jobs', stats)
@@ -0,0 +1,215 @@
+"""
+Lokaler Parquet-Snapshot abgeschlossener Monate
+
+Abgeschlossene Monate (vor dem laufenden Monat) ändern sich selten. Sie
+werden als Parquet-Datei je Monat lokal abgelegt und über einen
+Versionsstempel (max(updated_at), Zeilenzahl) aus kpi_data synchron gehalten.
+Lesepfade in database.py bedienen solche Monate zuerst aus dem Snapshot –
+ohne Datenbank-Roundtrip und auch dann, wenn die Datenbank nicht erreichbar
+ist (nur lesend).
+
+pyarrow ist optional: Ohne pyarrow ist der Snapshot deaktiviert und alle
+Lesezugriffe laufen wie bisher über die Datenbank.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (Parquet-Engine für pandas)
+    SNAPSHOT_AVAILABLE = True
+except ImportError:
+    SNAPSHOT_AVAILABLE = False
+
+
+def _default_snapshot_dir() -> str:
+    """Neben monatsdaten/: /data/snapshots im Container, sonst im Projektverzeichnis."""
+    if os.path.isdir('/data'):
+        return '/data/snapshots'
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'snapshots')
+
+
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR') or _default_snapshot_dir()
+SNAPSHOT_ENABLED = SNAPSHOT_AVAILABLE and os.environ.get('SNAPSHOT_ENABLED', '1') != '0'
+# Mindestabstand zwischen zwei Abgleichen mit kpi_data (Sekunden)
+SNAPSHOT_SYNC_INTERVAL = float(os.environ.get('SNAPSHOT_SYNC_INTERVAL', '300'))
+MANIFEST_FILE = 'manifest.json'
+
+# Spalten im Snapshot (DB-Namen, wie von get_month_data gelesen)
+SNAPSHOT_COLUMNS = [
+    'datum', 'standort', 'disponent', 'fahrzeuge', 'stopps',
+    'unverplante_stopps', 'kosten_fuhrpark', 'stoppschnitt', 'stoppkosten'
+]
+
+_manifest = None
+_lock = threading.Lock()
+_sync_lock = threading.Lock()
+_last_sync = 0.0
+
+
+def current_month() -> str:
+    return datetime.today().strftime('%Y-%m')
+
+
+def is_closed(month: str) -> bool:
+    """Ein Monat ist abgeschlossen, wenn er vor dem laufenden Monat liegt."""
+    return month < current_month()
+
+
+def _month_path(month: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{month}.parquet")
+
+
+def _load_manifest() -> dict:
+    """Manifest {Monat: {'updated_at', 'rows', 'synced_at'}} (einmal pro Prozess gelesen)."""
+    global _manifest
+    if _manifest is None:
+        path = os.path.join(SNAPSHOT_DIR, MANIFEST_FILE)
+        try:
+            with open(path, encoding='utf-8') as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def _save_manifest(manifest: dict):
+    path = os.path.join(SNAPSHOT_DIR, MANIFEST_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _as_version(entry: dict) -> tuple:
+    """Manifest-Eintrag -> Versionsstempel wie database.get_month_version."""
+    return (datetime.fromisoformat(entry['updated_at']), entry['rows'])
+
+
+def months() -> list:
+    """Alle Monate mit Snapshot (für den Offline-Betrieb)."""
+    if not SNAPSHOT_ENABLED:
+        return []
+    with _lock:
+        return sorted(_load_manifest())
+
+
+def month_version(month: str):
+    """Versionsstempel des Snapshots eines Monats oder None."""
+    if not SNAPSHOT_ENABLED:
+        return None
+    with _lock:
+        entry = _load_manifest().get(month)
+        return _as_version(entry) if entry else None
+
+
+def read_month(month: str):
+    """
+    Liest einen Monat aus dem Snapshot.
+
+    Returns:
+        (DataFrame mit SNAPSHOT_COLUMNS, Versionsstempel) oder None
+    """
+    version = month_version(month)
+    if version is None:
+        return None
+    try:
+        df = pd.read_parquet(_month_path(month))
+    except (OSError, ValueError):
+        drop_month(month)  # Datei fehlt oder ist beschädigt: beim nächsten Sync neu schreiben
+        return None
+    return df, version
+
+
+def write_month(month: str, df: pd.DataFrame, version: tuple):
+    """Schreibt einen Monat atomar (temporäre Datei, dann umbenennen)."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = _month_path(month)
+    df[SNAPSHOT_COLUMNS].to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    with _lock:
+        manifest = _load_manifest()
+        manifest[month] = {
+            'updated_at': version[0].isoformat(),
+            'rows': version[1],
+            'synced_at': datetime.now().isoformat(timespec='seconds')
+        }
+        _save_manifest(manifest)
+
+
+def drop_month(month: str):
+    """Entfernt den Snapshot eines Monats (z.B. nach einer Änderung in dieser Instanz)."""
+    if not SNAPSHOT_ENABLED:
+        return
+    with _lock:
+        manifest = _load_manifest()
+        if manifest.pop(month, None) is None:
+            return
+        _save_manifest(manifest)
+    try:
+        os.remove(_month_path(month))
+    except OSError:
+        pass
+
+
+def sync_snapshots(load_month) -> dict:
+    """
+    Gleicht die Snapshots mit kpi_data ab.
+
+    Eine Abfrage liefert die Versionsstempel aller abgeschlossenen Monate;
+    nur Monate mit geändertem Stempel werden neu geladen und geschrieben,
+    Monate ohne Daten in der Datenbank werden entfernt.
+
+    Args:
+        load_month: Funktion month -> DataFrame mit SNAPSHOT_COLUMNS (aus der DB)
+
+    Returns:
+        dict mit written, removed, unchanged
+    """
+    global _last_sync
+    from database import get_closed_month_versions
+
+    result = {'written': [], 'removed': [], 'unchanged': 0}
+    if not SNAPSHOT_ENABLED:
+        return result
+
+    with _sync_lock:
+        versions = get_closed_month_versions(current_month())
+
+        for month, version in sorted(versions.items()):
+            if version[0] is None:
+                continue
+            if month_version(month) == version:
+                result['unchanged'] += 1
+                continue
+            write_month(month, load_month(month), version)
+            result['written'].append(month)
+
+        for month in months():
+            if month not in versions:
+                drop_month(month)
+                result['removed'].append(month)
+
+        _last_sync = time.monotonic()
+    return result
+
+
+def sync_in_background(load_month):
+    """Startet einen Abgleich im Hintergrund, höchstens alle SNAPSHOT_SYNC_INTERVAL Sekunden."""
+    global _last_sync
+    if not SNAPSHOT_ENABLED or time.monotonic() - _last_sync < SNAPSHOT_SYNC_INTERVAL:
+        return
+    if _sync_lock.locked():
+        return
+    _last_sync = time.monotonic()
+
+    def run():
+        try:
+            sync_snapshots(load_month)
+        except Exception as e:
+            print(f"⚠️ Snapshot-Abgleich fehlgeschlagen: {e}")
+
+    threading.Thread(target=run, name='snapshot-sync', daemon=True).start()
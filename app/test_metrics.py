@@ -0,0 +1,29 @@
+"""Quantile der Laufzeit-Metriken (Nearest-Rank)"""
+import pytest
+
+from metrics import _quantile
+
+
+@pytest.mark.parametrize('samples, q, expected', [
+    ([], 0.5, 0.0),
+    ([7], 0.5, 7),
+    ([7], 0.95, 7),
+    ([1, 100], 0.5, 1),
+    ([1, 100], 0.95, 100),
+    ([1, 2, 3], 0.5, 2),
+    ([1, 2, 3, 4], 0.5, 2),
+    ([1, 2, 3, 4, 5, 6, 7, 8], 0.5, 4),
+    (list(range(1, 101)), 0.5, 50),
+    (list(range(1, 101)), 0.95, 95),
+    (list(range(1, 21)), 0.95, 19),
+    (list(range(1, 21)), 1.0, 20),
+    (list(range(1, 21)), 0.0, 1),
+])
+def test_quantile_nearest_rank(samples, q, expected):
+    assert _quantile(samples, q) == expected
+
+
+def test_quantile_p50_ranks():
+    # Rang der p50 für n = 1..8: 1,1,2,2,3,3,4,4
+    ranks = [_quantile(list(range(1, n + 1)), 0.5) for n in range(1, 9)]
+    assert ranks == [1, 1, 2, 2, 3, 3, 4, 4]
@@ -0,0 +1,638 @@
+"""
+Lokale Write-Ahead-Queue für Speichervorgänge der Eingabemaske
+
+Änderungen werden zuerst in eine lokale SQLite-Datei geschrieben (sofort und
+dauerhaft) und von einem Hintergrund-Thread in Batches in die Datenbank
+übertragen. Ist die Datenbank langsam oder nicht erreichbar, bleibt die
+Eingabe erhalten und wird automatisch nachgetragen.
+
+- Upserts und Löschungen je (datum, standort) sind idempotent; ein nach
+  einem Absturz erneut übertragener Batch ändert nichts.
+- Jede Zeile trägt den Stand, auf dem die Änderung beruht. Hat sich die
+  Zeile in der Datenbank inzwischen anders geändert, gewinnt die
+  eingereihte Änderung; der überschriebene Stand wird als Konflikt
+  protokolliert (conflicts()).
+- overlay() legt noch ausstehende Änderungen über einen Monats-Frame, damit
+  die Eingabemaske den gespeicherten Stand zeigt.
+- Nur vorübergehende Fehler (Datenbank nicht erreichbar, Sperren) werden
+  wiederholt. Lehnt die Datenbank Daten ab (Überlauf, zu lange Texte,
+  Constraints), wird der Monat Schlüssel für Schlüssel übertragen; die
+  fehlerhaften Zeilen landen in rejected_writes (rejected()) und blockieren
+  die übrigen nicht. Dasselbe gilt nach SAVE_QUEUE_MAX_ATTEMPTS Versuchen.
+
+Konfiguration:
+    SAVE_QUEUE_ENABLED=0            Queue aus, direkt speichern
+    SAVE_QUEUE_PATH=...             Datei (Standard: neben den Snapshots)
+    SAVE_QUEUE_BATCH_ROWS=500       Zeilen je Übertragung
+    SAVE_QUEUE_MAX_ATTEMPTS=500     Versuche je Zeile (bei 60 s Abstand ca. 8 Stunden)
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import pandas as pd
+from psycopg2.extensions import TransactionRollbackError
+
+import metrics
+import snapshot
+from database import (
+    STAGING_COLUMNS, NUMERIC_DB_COLUMNS, MONTH_DTYPES, DB_UNAVAILABLE_ERRORS, build_staging_frame,
+    compute_month_changes, apply_month_changes, month_frame
+)
+
+SAVE_QUEUE_ENABLED = os.environ.get('SAVE_QUEUE_ENABLED', '1') != '0'
+SAVE_QUEUE_PATH = os.environ.get('SAVE_QUEUE_PATH') or os.path.join(
+    os.path.dirname(os.path.normpath(snapshot.SNAPSHOT_DIR)), 'save_queue.db'
+)
+BATCH_ROWS = int(os.environ.get('SAVE_QUEUE_BATCH_ROWS', '500'))
+MAX_ATTEMPTS = int(os.environ.get('SAVE_QUEUE_MAX_ATTEMPTS', '500'))
+FLUSH_INTERVAL = 5.0       # Sekunden zwischen zwei Versuchen im Leerlauf
+SAVE_FLUSH_WAIT = 2.0      # so lange wartet ein Speichervorgang auf eine laufende Übertragung
+MAX_RETRY_INTERVAL = 60.0  # längste Wartezeit nach Fehlern
+WRITTEN_MAX = 10_000       # gemerkte eigene Stände (älteste fallen heraus)
+
+# Vorübergehende Fehler werden wiederholt, alle anderen lehnen die Zeilen ab
+TRANSIENT_ERRORS = DB_UNAVAILABLE_ERRORS + (TransactionRollbackError, sqlite3.OperationalError)
+
+VALUE_COLUMNS = [c for c in STAGING_COLUMNS if c not in ('datum', 'standort')]
+# Für die Konflikterkennung zählen nur die Eingaben (abgeleitete KPIs folgen daraus)
+BASE_COLUMNS = ['disponent', 'fahrzeuge', 'stopps', 'unverplante_stopps', 'kosten_fuhrpark']
+
+_lock = threading.Lock()        # Zugriff auf die Queue-Datei
+_flush_lock = threading.Lock()  # höchstens eine Übertragung gleichzeitig
+_wakeup = threading.Event()
+_flusher = None
+_pending = None                 # Monat -> Anzahl ausstehender Zeilen (Cache)
+_open_conflicts = 0
+_open_rejected = 0
+_written = OrderedDict()        # (Monat, datum, standort) -> zuletzt übertragener Stand
+_last_error = None
+
+
+def _connect() -> sqlite3.Connection:
+    directory = os.path.dirname(os.path.abspath(SAVE_QUEUE_PATH))
+    os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(SAVE_QUEUE_PATH, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=FULL')
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS pending_writes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            monat TEXT NOT NULL,
+            datum TEXT NOT NULL,
+            standort TEXT NOT NULL,
+            op TEXT NOT NULL,              -- upsert oder delete
+            werte TEXT,                    -- JSON der neuen Werte (upsert)
+            basis TEXT,                    -- JSON des geladenen Stands (NULL: neue Zeile)
+            enqueued_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_pending_monat ON pending_writes(monat);
+        CREATE TABLE IF NOT EXISTS conflicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            monat TEXT NOT NULL,
+            datum TEXT NOT NULL,
+            standort TEXT NOT NULL,
+            op TEXT NOT NULL,
+            werte TEXT,                    -- übernommener Stand aus der Queue
+            basis TEXT,                    -- Stand, auf dem die Änderung beruhte
+            datenbank TEXT,                -- überschriebener Stand der Datenbank
+            detected_at TEXT NOT NULL,
+            acknowledged INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS rejected_writes (
+            id INTEGER PRIMARY KEY,        -- id aus pending_writes
+            monat TEXT NOT NULL,
+            datum TEXT NOT NULL,
+            standort TEXT NOT NULL,
+            op TEXT NOT NULL,
+            werte TEXT,
+            basis TEXT,
+            enqueued_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            error TEXT,
+            rejected_at TEXT NOT NULL,
+            acknowledged INTEGER NOT NULL DEFAULT 0
+        );
+    ''')
+    return conn
+
+
+def _value(value):
+    """JSON-taugliche, vergleichbare Form eines Zellwerts (Zahlen auf 2 Stellen)."""
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NA:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, str):
+        return value
+    return round(float(value), 2)
+
+
+def _json_rows(frame: pd.DataFrame, columns: list = VALUE_COLUMNS) -> list:
+    """Werte jeder Zeile (ohne Schlüssel) als JSON."""
+    return [
+        json.dumps({col: _value(value) for col, value in zip(columns, values)}, sort_keys=True)
+        for values in frame[columns].itertuples(index=False, name=None)
+    ]
+
+
+def _remember(month: str, datum: str, standort: str, written):
+    """Merkt den übertragenen Stand eines Schlüssels (höchstens WRITTEN_MAX Einträge)."""
+    key = (month, datum, standort)
+    _written[key] = written
+    _written.move_to_end(key)
+    while len(_written) > WRITTEN_MAX:
+        _written.popitem(last=False)
+
+
+def _message(error: Exception) -> str:
+    """Erste Zeile einer Fehlermeldung."""
+    return (str(error).strip().splitlines() or [repr(error)])[0]
+
+
+def _base(values: str) -> str:
+    """Vergleichsstand (BASE_COLUMNS) aus dem JSON einer eingereihten Zeile."""
+    data = json.loads(values)
+    return json.dumps({col: data[col] for col in BASE_COLUMNS}, sort_keys=True)
+
+
+def _refresh_pending(conn):
+    """Liest die Zähler für pending_counts() und status() neu (Aufruf unter _lock)."""
+    global _pending, _open_conflicts, _open_rejected
+    _pending = dict(conn.execute('SELECT monat, COUNT(*) FROM pending_writes GROUP BY monat').fetchall())
+    _open_conflicts = conn.execute('SELECT COUNT(*) FROM conflicts WHERE acknowledged = 0').fetchone()[0]
+    _open_rejected = conn.execute('SELECT COUNT(*) FROM rejected_writes WHERE acknowledged = 0').fetchone()[0]
+
+
+def pending_counts() -> dict:
+    """Ausstehende Zeilen je Monat."""
+    if _pending is None:
+        with _lock:
+            conn = _connect()
+            try:
+                _refresh_pending(conn)
+            finally:
+                conn.close()
+    return dict(_pending)
+
+
+def enqueue(month: str, changed: pd.DataFrame, deleted: pd.DataFrame, original: pd.DataFrame,
+            wake: bool = True) -> int:
+    """
+    Reiht eine Änderungsmenge (siehe database.compute_month_changes) dauerhaft ein.
+
+    wake=False, wenn der Aufrufer selbst gleich flush() aufruft.
+
+    Returns:
+        Anzahl eingereihter Zeilen
+    """
+    base, _ = build_staging_frame(original)
+    base_values = dict(zip(zip(base['datum'], base['standort']), _json_rows(base, BASE_COLUMNS)))
+    now = datetime.now().isoformat(timespec='seconds')
+
+    rows = [
+        (month, datum.isoformat(), standort, 'upsert', werte, base_values.get((datum, standort)), now)
+        for datum, standort, werte in zip(changed['datum'], changed['standort'], _json_rows(changed))
+    ] + [
+        (month, datum.isoformat(), standort, 'delete', None, base_values.get((datum, standort)), now)
+        for datum, standort in zip(deleted['datum'], deleted['standort'])
+    ]
+    if not rows:
+        return 0
+
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT INTO pending_writes (monat, datum, standort, op, werte, basis, enqueued_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.execute('COMMIT')
+            _refresh_pending(conn)
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+    if wake:
+        _wakeup.set()
+    return len(rows)
+
+
+def _row_values(rows: pd.DataFrame) -> dict:
+    """Zeilen aus der Datenbank (MONTH_ROW_COLUMNS) -> {(datum, standort): JSON der Eingaben}."""
+    rows = rows.copy()
+    for col in NUMERIC_DB_COLUMNS:
+        rows[col] = pd.to_numeric(rows[col], errors='coerce')
+    dates = pd.to_datetime(rows['datum']).dt.strftime('%Y-%m-%d')
+    return dict(zip(zip(dates, rows['standort']), _json_rows(rows, BASE_COLUMNS)))
+
+
+def _apply_batch(month: str, entries: list) -> dict:
+    """
+    Überträgt die Einträge eines Monats (älteste zuerst) in einer Transaktion.
+
+    Je Schlüssel gilt der Stand des ersten Eintrags als Basis und der
+    letzte Eintrag als Ziel. Verglichen wird mit dem Stand, den das Backend
+    in der Schreibtransaktion gesperrt liest; Änderungen anderer zwischen
+    Lesen und Schreiben sind damit ausgeschlossen.
+    """
+    keys = {}
+    for _, datum, standort, op, werte, basis in entries:
+        key = (datum, standort)
+        first_basis = keys[key]['basis'] if key in keys else basis
+        keys[key] = {'op': op, 'werte': werte, 'basis': first_basis}
+
+    upserts, deletes = [], []
+    for (datum, standort), entry in keys.items():
+        if entry['op'] == 'upsert':
+            upserts.append({'datum': date.fromisoformat(datum), 'standort': standort,
+                            **json.loads(entry['werte'])})
+        else:
+            deletes.append({'datum': date.fromisoformat(datum), 'standort': standort})
+
+    conflicts = []
+
+    def check(rows: pd.DataFrame):
+        # Läuft in der Schreibtransaktion, nach dem gesperrten Lesen der Zeilen
+        conflicts.clear()
+        current = _row_values(rows)
+        for (datum, standort), entry in keys.items():
+            target = entry['werte'] if entry['op'] == 'upsert' else None
+            now = current.get((datum, standort))
+            # Kein Konflikt: unveränderte Basis, Ziel schon erreicht oder eigener früherer Stand
+            known = [entry['basis'], target and _base(target)]
+            if (month, datum, standort) in _written:
+                known.append(_written[(month, datum, standort)])
+            if now not in known:
+                conflicts.append((month, datum, standort, entry['op'], target, entry['basis'], now))
+
+    changed = pd.DataFrame(upserts, columns=STAGING_COLUMNS)
+    changed[NUMERIC_DB_COLUMNS] = changed[NUMERIC_DB_COLUMNS].astype('float64')
+    deleted = pd.DataFrame(deletes, columns=['datum', 'standort'])
+    result = apply_month_changes(month, changed, deleted, check)
+    for (datum, standort), entry in keys.items():
+        target = entry['werte'] if entry['op'] == 'upsert' else None
+        _remember(month, datum, standort, target and _base(target))
+    result['conflicts'] = conflicts
+    return result
+
+
+@metrics.instrument()
+def flush(max_rows: int = None, month: str = None, timeout: float = None) -> dict:
+    """
+    Überträgt ausstehende Änderungen in Batches (BATCH_ROWS Zeilen, je Monat
+    eine Transaktion), bis die Queue leer ist oder die Datenbank nicht
+    erreichbar ist. Von der Datenbank abgelehnte Zeilen werden aussortiert.
+
+    Args:
+        max_rows: höchstens so viele Zeilen (in ganzen Batches)
+        month: nur Zeilen dieses Monats (älteste zuerst)
+        timeout: höchstens so lange auf eine laufende Übertragung warten;
+            danach wird nichts übertragen (busy=True)
+
+    Returns:
+        dict mit inserted, updated, deleted, conflicts, flushed, rejected,
+        rejected_months, rejected_error, batch_error, busy, pending und
+        error (nur bei vorübergehenden Fehlern)
+    """
+    global _last_error
+    totals = {'inserted': 0, 'updated': 0, 'deleted': 0, 'conflicts': 0, 'flushed': 0,
+              'rejected': 0, 'rejected_months': {}, 'rejected_error': None, 'batch_error': None,
+              'busy': False, 'error': None}
+    if not _flush_lock.acquire(timeout=-1 if timeout is None else timeout):
+        totals['busy'] = True
+        totals['pending'] = sum(pending_counts().values())
+        return totals
+    try:
+        while max_rows is None or totals['flushed'] < max_rows:
+            with _lock:
+                conn = _connect()
+                try:
+                    batch = conn.execute(f'''
+                        SELECT id, monat, datum, standort, op, werte, basis
+                        FROM pending_writes {'WHERE monat = ?' if month else ''}
+                        ORDER BY id LIMIT ?
+                    ''', ((month,) if month else ()) + (BATCH_ROWS,)).fetchall()
+                finally:
+                    conn.close()
+            if not batch:
+                break
+
+            by_month = {}
+            for row in batch:
+                by_month.setdefault(row[1], []).append(row)
+            for month, rows in by_month.items():
+                if not _flush_month(month, rows, totals):
+                    break
+            if totals['error']:
+                break
+            _last_error = None
+    finally:
+        _flush_lock.release()
+    totals['pending'] = sum(pending_counts().values())
+    return totals
+
+
+def _flush_month(month: str, rows: list, totals: dict) -> bool:
+    """
+    Überträgt die Queue-Zeilen eines Monats. Lehnt die Datenbank den Batch
+    ab, wird jeder Schlüssel einzeln übertragen, damit eine fehlerhafte
+    Zeile die übrigen nicht blockiert.
+
+    Returns:
+        False, wenn ein vorübergehender Fehler die Übertragung stoppt
+    """
+    try:
+        _apply_rows(month, rows, totals)
+        return True
+    except TRANSIENT_ERRORS as e:
+        _mark_failed([row[0] for row in rows], e, totals)
+        return False
+    except Exception as e:
+        totals['batch_error'] = _message(e)
+        print(f"⚠️ Speicher-Queue: Batch für {month} abgelehnt, übertrage einzeln: {totals['batch_error']}")
+
+    by_key = {}
+    for row in rows:
+        by_key.setdefault((row[2], row[3]), []).append(row)
+    for key_rows in by_key.values():
+        try:
+            _apply_rows(month, key_rows, totals)
+        except TRANSIENT_ERRORS as e:
+            _mark_failed([row[0] for row in key_rows], e, totals)
+            return False
+        except Exception as e:
+            _reject([row[0] for row in key_rows], _message(e))
+            totals['rejected'] += len(key_rows)
+            totals['rejected_months'][month] = totals['rejected_months'].get(month, 0) + len(key_rows)
+            totals['rejected_error'] = _message(e)
+    return True
+
+
+def _apply_rows(month: str, rows: list, totals: dict):
+    """Überträgt Queue-Zeilen eines Monats und entfernt sie aus der Queue."""
+    result = _apply_batch(month, [(row[0],) + row[2:] for row in rows])
+    _complete([row[0] for row in rows], result['conflicts'])
+    for key in ('inserted', 'updated', 'deleted'):
+        totals[key] += result[key]
+    totals['conflicts'] += len(result['conflicts'])
+    totals['flushed'] += len(rows)
+
+
+def _complete(ids: list, conflicts: list):
+    now = datetime.now().isoformat(timespec='seconds')
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('DELETE FROM pending_writes WHERE id = ?', [(i,) for i in ids])
+            conn.executemany('''
+                INSERT INTO conflicts (monat, datum, standort, op, werte, basis, datenbank, detected_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [conflict + (now,) for conflict in conflicts])
+            conn.execute('COMMIT')
+            _refresh_pending(conn)
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+
+def _mark_failed(ids: list, error: Exception, totals: dict):
+    """Zählt einen vorübergehenden Fehler; Zeilen nach MAX_ATTEMPTS Versuchen werden aussortiert."""
+    global _last_error
+    message = _message(error)
+    _last_error = f"{datetime.now():%H:%M:%S} {message}"
+    totals['error'] = str(error)
+    with _lock:
+        conn = _connect()
+        try:
+            conn.executemany(
+                'UPDATE pending_writes SET attempts = attempts + 1, last_error = ? WHERE id = ?',
+                [(message[:500], i) for i in ids]
+            )
+            exhausted = [row[0] for row in conn.execute(
+                f"SELECT id FROM pending_writes WHERE attempts >= ? AND id IN ({', '.join('?' * len(ids))})",
+                [MAX_ATTEMPTS] + list(ids)
+            ).fetchall()]
+        finally:
+            conn.close()
+    if exhausted:
+        _reject(exhausted, f"Nach {MAX_ATTEMPTS} Versuchen aufgegeben: {message}")
+
+
+def _reject(ids: list, error: str):
+    """Verschiebt Queue-Zeilen nach rejected_writes."""
+    now = datetime.now().isoformat(timespec='seconds')
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('''
+                INSERT OR REPLACE INTO rejected_writes
+                (id, monat, datum, standort, op, werte, basis, enqueued_at, attempts, error, rejected_at)
+                SELECT id, monat, datum, standort, op, werte, basis, enqueued_at, attempts + 1, ?, ?
+                FROM pending_writes WHERE id = ?
+            ''', [(error[:500], now, i) for i in ids])
+            conn.executemany('DELETE FROM pending_writes WHERE id = ?', [(i,) for i in ids])
+            conn.execute('COMMIT')
+            _refresh_pending(conn)
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+
+def _run_flusher():
+    interval = FLUSH_INTERVAL
+    while True:
+        _wakeup.wait(interval)
+        _wakeup.clear()
+        try:
+            failed = bool(sum(pending_counts().values())) and flush()['error'] is not None
+        except Exception as e:
+            print(f"⚠️ Übertragung der Speicher-Queue fehlgeschlagen: {e}")
+            failed = True
+        # Nach Fehlern schrittweise seltener versuchen
+        interval = min(interval * 2, MAX_RETRY_INTERVAL) if failed else FLUSH_INTERVAL
+
+
+def start_flusher():
+    """Startet den Hintergrund-Thread (einmal pro Prozess)."""
+    global _flusher
+    with _lock:
+        if _flusher is not None or not SAVE_QUEUE_ENABLED:
+            return
+        _flusher = threading.Thread(target=_run_flusher, name='save-queue', daemon=True)
+        _flusher.start()
+    _wakeup.set()
+
+
+def save_month_changes(month: str, original_df: pd.DataFrame, edited_df: pd.DataFrame,
+                       progress=None) -> dict:
+    """
+    Wie database.save_month_changes, aber über die Queue: Die Änderungen sind
+    nach dem Einreihen gesichert und werden danach sofort übertragen. Ist die
+    Datenbank nicht erreichbar, bleiben sie in der Queue (result['queued']).
+
+    Übertragen werden nur die ausstehenden Zeilen dieses Monats; Rückstände
+    anderer Monate und Sessions trägt der Hintergrund-Thread nach. Läuft
+    gerade eine Übertragung, wartet der Speichervorgang höchstens
+    SAVE_FLUSH_WAIT Sekunden und überlässt seine Zeilen dann ebenfalls ihm.
+    """
+    changes = compute_month_changes(original_df, edited_df)
+    changed, deleted = changes['changed'], changes['deleted']
+    result = {'inserted': 0, 'updated': 0, 'deleted': 0, 'conflicts': 0, 'queued': 0,
+              'unchanged': changes['unchanged'], 'skipped': changes['skipped'],
+              'changed': not (changed.empty and deleted.empty)}
+    if not result['changed']:
+        return result
+
+    enqueue(month, changed, deleted, changes['original'], wake=False)
+    if progress:
+        progress(0.4, "Lokal gesichert, wird übertragen …")
+    flushed = flush(max_rows=pending_counts().get(month, 0), month=month, timeout=SAVE_FLUSH_WAIT)
+    # Was jetzt nicht übertragen werden konnte, trägt der Hintergrund-Thread nach
+    start_flusher()
+    if flushed['pending']:
+        _wakeup.set()
+    for key in ('inserted', 'updated', 'deleted', 'conflicts'):
+        result[key] = flushed[key]
+    result['queued'] = pending_counts().get(month, 0)
+    result['rejected'] = flushed['rejected_months'].get(month, 0)
+    result['error'] = flushed['error'] or flushed['rejected_error']
+    return result
+
+
+def overlay(month: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Legt ausstehende Änderungen eines Monats über den typisierten Monats-Frame."""
+    if not pending_counts().get(month):
+        return df
+    with _lock:
+        conn = _connect()
+        try:
+            entries = conn.execute('''
+                SELECT datum, standort, op, werte FROM pending_writes
+                WHERE monat = ? ORDER BY id
+            ''', (month,)).fetchall()
+        finally:
+            conn.close()
+    latest = {(datum, standort): (op, werte) for datum, standort, op, werte in entries}
+
+    keys = df['Datum'].dt.strftime('%Y-%m-%d') + '|' + df['Standort'].astype(str)
+    pending_keys = {f'{datum}|{standort}' for datum, standort in latest}
+    rows = pd.DataFrame(
+        [{'datum': datum, 'standort': standort, **json.loads(werte)}
+         for (datum, standort), (op, werte) in latest.items() if op == 'upsert'],
+        columns=STAGING_COLUMNS
+    )
+    merged = pd.concat(
+        [df[~keys.isin(pending_keys).to_numpy()].astype(object), month_frame(rows).astype(object)],
+        ignore_index=True
+    )
+    return merged.astype(MONTH_DTYPES).sort_values(['Datum', 'Standort']).reset_index(drop=True)
+
+
+def status() -> dict:
+    """Ausstehende Zeilen, letzter Übertragungsfehler, offene Konflikte und abgelehnte Zeilen (ohne Dateizugriff)."""
+    return {
+        'pending': sum(pending_counts().values()),
+        'last_error': _last_error,
+        'conflicts': _open_conflicts,
+        'rejected': _open_rejected
+    }
+
+
+def conflicts(include_acknowledged: bool = False) -> pd.DataFrame:
+    """Protokollierte Konflikte (neueste zuerst)."""
+    where = '' if include_acknowledged else 'WHERE acknowledged = 0'
+    with _lock:
+        conn = _connect()
+        try:
+            return pd.read_sql_query(f'''
+                SELECT id, detected_at, monat, datum, standort, op, werte, basis, datenbank
+                FROM conflicts {where} ORDER BY id DESC
+            ''', conn)
+        finally:
+            conn.close()
+
+
+def acknowledge_conflicts(ids: list = None):
+    """Markiert Konflikte als gesehen (ohne ids: alle)."""
+    with _lock:
+        conn = _connect()
+        try:
+            if ids is None:
+                conn.execute('UPDATE conflicts SET acknowledged = 1')
+            else:
+                conn.executemany('UPDATE conflicts SET acknowledged = 1 WHERE id = ?',
+                                 [(i,) for i in ids])
+            _refresh_pending(conn)
+        finally:
+            conn.close()
+
+
+def rejected(include_acknowledged: bool = False) -> pd.DataFrame:
+    """Von der Datenbank abgelehnte Zeilen (neueste zuerst)."""
+    where = '' if include_acknowledged else 'WHERE acknowledged = 0'
+    with _lock:
+        conn = _connect()
+        try:
+            return pd.read_sql_query(f'''
+                SELECT id, rejected_at, monat, datum, standort, op, werte, attempts, error
+                FROM rejected_writes {where} ORDER BY id DESC
+            ''', conn)
+        finally:
+            conn.close()
+
+
+def retry_rejected(ids: list = None) -> int:
+    """Reiht abgelehnte Zeilen erneut ein (ohne ids: alle offenen)."""
+    where = 'acknowledged = 0' if ids is None else f"id IN ({', '.join('?' * len(ids))})"
+    with _lock:
+        conn = _connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            moved = conn.execute(f'''
+                INSERT INTO pending_writes (id, monat, datum, standort, op, werte, basis, enqueued_at)
+                SELECT id, monat, datum, standort, op, werte, basis, enqueued_at
+                FROM rejected_writes WHERE {where}
+            ''', ids or ()).rowcount
+            conn.execute(f'DELETE FROM rejected_writes WHERE {where}', ids or ())
+            conn.execute('COMMIT')
+            _refresh_pending(conn)
+        except Exception as e:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+    _wakeup.set()
+    return moved
+
+
+def acknowledge_rejected(ids: list = None):
+    """Verwirft abgelehnte Zeilen (bleiben als gesehen protokolliert)."""
+    with _lock:
+        conn = _connect()
+        try:
+            if ids is None:
+                conn.execute('UPDATE rejected_writes SET acknowledged = 1')
+            else:
+                conn.executemany('UPDATE rejected_writes SET acknowledged = 1 WHERE id = ?',
+                                 [(i,) for i in ids])
+            _refresh_pending(conn)
+        finally:
+            conn.close()
+
+
+metrics.register_gauges('save_queue', lambda: {'pending': sum(pending_counts().values()), 'rejected': _open_rejected})